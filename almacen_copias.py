@@ -0,0 +1,208 @@
+"""
+Almacén de copias de seguridad comprimidas, sin repetidas y con retención
+
+Cada copia se guarda en copias/ comprimida con zstd si el paquete zstandard está instalado y si
+no con gzip, leyendo la instantánea a trozos. Mientras se comprime se calcula su SHA-256: si
+coincide con el de la última copia, no se guarda (los datos no han cambiado). El índice
+copias/indice.json tiene una entrada por copia (archivo, fecha, hash, tamaños, motivo, subida).
+
+Al guardar se aplica la retención, como un "prune": se conserva la copia más reciente de cada una
+de las últimas CONSERVAR_HORAS horas con copia, CONSERVAR_DIAS días y CONSERVAR_MESES meses, y
+siempre la última; el resto se borra. Las copias de seguridad previas a una restauración o
+importación (motivo distinto de 'automática') no entran en ese reparto: se conservan enteras
+CONSERVAR_SEGURIDAD_DIAS días (campo conservar_hasta del índice).
+"""
+import hashlib
+import os
+import tempfile
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: sin bloqueo entre procesos
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from almacenamiento import directorio_persistente, escribir_json, leer_json
+from copias_bd import instantanea_sqlite
+
+DIRECTORIO = 'copias'
+INDICE = 'indice.json'
+BLOQUEO = 'indice.lock'
+TROZO = 1024 * 1024
+EXTENSIONES = {'zstd': '.db.zst', 'gzip': '.db.gz'}
+
+CONSERVAR_HORAS = int(os.environ.get('BACKUP_CONSERVAR_HORAS', '24'))
+CONSERVAR_DIAS = int(os.environ.get('BACKUP_CONSERVAR_DIAS', '30'))
+CONSERVAR_MESES = int(os.environ.get('BACKUP_CONSERVAR_MESES', '12'))
+CONSERVAR_SEGURIDAD_DIAS = int(os.environ.get('BACKUP_CONSERVAR_SEGURIDAD_DIAS', '30'))
+AUTOMATICA = 'automática'
+
+def directorio_copias():
+    return directorio_persistente(DIRECTORIO)
+
+@contextmanager
+def _bloqueo(directorio):
+    """Bloqueo del índice entre hilos y procesos mientras se lee y reescribe"""
+    with open(os.path.join(directorio, BLOQUEO), 'a') as archivo:
+        if fcntl is not None:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+        yield
+
+def listar_copias():
+    """Entradas del índice, de la más antigua a la más reciente"""
+    return leer_json(os.path.join(directorio_copias(), INDICE)) or []
+
+def _formato():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+def _compresor(formato):
+    if formato == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compressobj()
+    return zlib.compressobj(6, wbits=31)  # 31: cabecera y cola gzip
+
+def _descompresor(formato):
+    if formato == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Para leer copias .zst hace falta el paquete zstandard')
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+def _nombre_libre(directorio, fecha, formato):
+    base = f"backup_sqlite_{fecha.strftime('%Y%m%d_%H%M%S')}"
+    nombre, numero = base + EXTENSIONES[formato], 1
+    while os.path.exists(os.path.join(directorio, nombre)):
+        nombre, numero = f'{base}_{numero}{EXTENSIONES[formato]}', numero + 1
+    return nombre
+
+def guardar_copia(origen, motivo=AUTOMATICA, fecha=None):
+    """Guarda comprimida la instantánea `origen` (archivo .db) y aplica la retención.
+
+    Devuelve (entrada, nueva): si el contenido es igual al de la última copia no se guarda nada y
+    se devuelve la entrada de esa copia con nueva=False (si es una copia de seguridad, esa copia
+    pasa a conservarse como tal).
+    """
+    directorio = directorio_copias()
+    fecha = fecha or datetime.now()
+    formato = _formato()
+    compresor = _compresor(formato)
+    resumen = hashlib.sha256()
+    tamano = 0
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as destino, open(origen, 'rb') as fuente:
+            while True:
+                trozo = fuente.read(TROZO)
+                if not trozo:
+                    break
+                resumen.update(trozo)
+                tamano += len(trozo)
+                destino.write(compresor.compress(trozo))
+            destino.write(compresor.flush())
+
+        with _bloqueo(directorio):
+            indice = listar_copias()
+            if indice and indice[-1]['sha256'] == resumen.hexdigest():
+                if motivo != AUTOMATICA:
+                    _marcar_seguridad(indice[-1], motivo, fecha)
+                    escribir_json(os.path.join(directorio, INDICE), indice)
+                return indice[-1], False
+            nombre = _nombre_libre(directorio, fecha, formato)
+            os.replace(temporal, os.path.join(directorio, nombre))
+            entrada = {
+                'archivo': nombre, 'fecha': fecha.isoformat(timespec='seconds'), 'sha256': resumen.hexdigest(),
+                'tamano': tamano, 'comprimido': os.path.getsize(os.path.join(directorio, nombre)),
+                'formato': formato, 'motivo': motivo, 'subido': False,
+            }
+            if motivo != AUTOMATICA:
+                _marcar_seguridad(entrada, motivo, fecha)
+            indice.append(entrada)
+            _aplicar_retencion(directorio, indice, fecha)
+        return entrada, True
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def copiar_bd(motivo=AUTOMATICA):
+    """Hace una instantánea de la BD SQLite y la guarda en el almacén; devuelve (entrada, nueva)"""
+    descriptor, instantanea = tempfile.mkstemp(dir=directorio_copias(), suffix='.db.tmp')
+    os.close(descriptor)
+    try:
+        instantanea_sqlite(instantanea)
+        return guardar_copia(instantanea, motivo)
+    finally:
+        os.remove(instantanea)
+
+def _marcar_seguridad(entrada, motivo, fecha):
+    entrada['motivo'] = motivo
+    hasta = (fecha + timedelta(days=CONSERVAR_SEGURIDAD_DIAS)).isoformat(timespec='seconds')
+    entrada['conservar_hasta'] = max(entrada.get('conservar_hasta') or '', hasta)
+
+def a_conservar(entradas, horas=None, dias=None, meses=None, ahora=None):
+    """Nombres de archivo que conserva la retención.
+
+    La más reciente de cada hora, día y mes entre las copias automáticas, y las copias de seguridad
+    cuyo conservar_hasta no ha pasado (en `ahora`).
+    """
+    ahora = (ahora or datetime.now()).isoformat(timespec='seconds')
+    seguridad = {entrada['archivo'] for entrada in entradas if (entrada.get('conservar_hasta') or '') > ahora}
+    entradas = [entrada for entrada in entradas if entrada['archivo'] not in seguridad]
+    reglas = (
+        ('%Y%m%d%H', CONSERVAR_HORAS if horas is None else horas),
+        ('%Y%m%d', CONSERVAR_DIAS if dias is None else dias),
+        ('%Y%m', CONSERVAR_MESES if meses is None else meses),
+    )
+    # A igual fecha (resolución de segundos) manda el orden del índice, que es el de creación
+    orden = sorted(enumerate(entradas), key=lambda par: (par[1]['fecha'], par[0]), reverse=True)
+    recientes = [entrada for _, entrada in orden]
+    conservar = seguridad | ({recientes[0]['archivo']} if recientes else set())
+    for patron, cantidad in reglas:
+        periodos = set()
+        for entrada in recientes:
+            if len(periodos) >= cantidad:
+                break
+            periodo = datetime.fromisoformat(entrada['fecha']).strftime(patron)
+            if periodo not in periodos:
+                periodos.add(periodo)
+                conservar.add(entrada['archivo'])
+    return conservar
+
+def _aplicar_retencion(directorio, indice, ahora=None):
+    conservar = a_conservar(indice, ahora=ahora)
+    for entrada in indice:
+        if entrada['archivo'] not in conservar:
+            try:
+                os.remove(os.path.join(directorio, entrada['archivo']))
+            except FileNotFoundError:
+                pass
+    indice[:] = [entrada for entrada in indice if entrada['archivo'] in conservar]
+    escribir_json(os.path.join(directorio, INDICE), indice)
+
+def marcar_subida(archivo):
+    """Anota en el índice que la copia `archivo` se ha subido por SFTP"""
+    directorio = directorio_copias()
+    with _bloqueo(directorio):
+        indice = listar_copias()
+        for entrada in indice:
+            if entrada['archivo'] == archivo:
+                entrada['subido'] = True
+        escribir_json(os.path.join(directorio, INDICE), indice)
+
+def ruta_copia(entrada):
+    return os.path.join(directorio_copias(), entrada['archivo'])
+
+def extraer_copia(entrada, destino):
+    """Descomprime la copia de `entrada` en el archivo `destino` (un .db listo para usar)"""
+    descompresor = _descompresor(entrada['formato'])
+    with open(ruta_copia(entrada), 'rb') as fuente, open(destino, 'wb') as salida:
+        while True:
+            trozo = fuente.read(TROZO)
+            if not trozo:
+                break
+            salida.write(descompresor.decompress(trozo))
+        salida.write(descompresor.flush())
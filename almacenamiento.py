@@ -0,0 +1,39 @@
+"""
+Directorios de trabajo en el disco persistente
+
+Los archivos que genera la aplicación (caché de PDF, importaciones, copias) van junto al archivo
+SQLite, que está en el disco persistente; con PostgreSQL, en PERSISTENT_DISK_PATH o en instance/.
+"""
+import json
+import os
+import tempfile
+
+from flask import current_app
+
+from models import db
+
+def directorio_persistente(nombre):
+    """Ruta del subdirectorio `nombre` en el disco persistente (se crea si no existe)"""
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        base = os.path.dirname(os.path.abspath(url.database))
+    else:
+        base = os.environ.get('PERSISTENT_DISK_PATH') or current_app.instance_path
+    directorio = os.path.join(base, nombre)
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+def escribir_json(ruta, datos):
+    """Escribe `datos` en `ruta` en un temporal y lo renombra: quien lo lea nunca ve un JSON a medias"""
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+def leer_json(ruta):
+    """Contenido del JSON de `ruta`, o None si no existe"""
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
@@ -188,9 +188,69 @@ def create_app():
                                     traceback.print_exc()
                     else:
                         print("[INFO] La tabla 'solicitudes_socio' no existe aún, se creará con db.create_all()")
+
+                    # Añadir inscritos_count a actividades si no existe y calcularlo desde las inscripciones
+                    if 'actividades' in inspector.get_table_names():
+                        columnas_actividades = [col['name'] for col in inspector.get_columns('actividades')]
+                        if 'inscritos_count' not in columnas_actividades:
+                            try:
+                                with db.engine.connect() as conn:
+                                    conn.execute(text('ALTER TABLE actividades ADD COLUMN inscritos_count INTEGER NOT NULL DEFAULT 0'))
+                                    conn.commit()
+                                from models import recalcular_inscritos
+                                recalcular_inscritos()
+                                db.session.commit()
+                                print("[INFO] Columna 'inscritos_count' añadida y recalculada en 'actividades'")
+                            except Exception as e:
+                                db.session.rollback()
+                                error_msg = str(e).lower()
+                                if "duplicate column name" in error_msg or "already exists" in error_msg:
+                                    print("[INFO] La columna 'inscritos_count' ya existe en 'actividades'")
+                                else:
+                                    print(f"[WARNING] No se pudo añadir la columna 'inscritos_count': {e}")
+                    
+                    # Añadir nombre_norm (nombre normalizado para búsquedas) donde falte; se rellena más abajo
+                    for tabla_norm, longitud in (('users', 100), ('beneficiarios', 300), ('solicitudes_socio', 300)):
+                        if tabla_norm not in inspector.get_table_names():
+                            continue
+                        if 'nombre_norm' in [col['name'] for col in inspector.get_columns(tabla_norm)]:
+                            continue
+                        try:
+                            with db.engine.connect() as conn:
+                                conn.execute(text(f'ALTER TABLE {tabla_norm} ADD COLUMN nombre_norm VARCHAR({longitud})'))
+                                conn.commit()
+                            print(f"[INFO] Columna 'nombre_norm' añadida automáticamente a '{tabla_norm}'")
+                        except Exception as e:
+                            print(f"[WARNING] No se pudo añadir la columna 'nombre_norm' a '{tabla_norm}': {e}")
             except Exception as e:
                 print(f"[WARNING] Error al verificar columnas: {e}")
             
+            # Crear los índices declarados en los modelos que falten en BDs ya existentes
+            # (db.create_all() solo los crea junto con tablas nuevas). Válido para SQLite y PostgreSQL.
+            for tabla in db.metadata.sorted_tables:
+                for indice in tabla.indexes:
+                    try:
+                        indice.create(bind=db.engine, checkfirst=True)
+                    except Exception as e:
+                        print(f"[WARNING] No se pudo crear el índice '{indice.name}': {e}")
+            
+            # Rellenar nombre_norm en las filas que aún no lo tienen (BDs anteriores a la columna)
+            try:
+                from models import rellenar_nombres_normalizados
+                rellenados = rellenar_nombres_normalizados()
+                if rellenados:
+                    print(f"[INFO] nombre_norm calculado en {rellenados} fila(s)")
+            except Exception as e:
+                db.session.rollback()
+                print(f"[WARNING] No se pudo rellenar nombre_norm: {e}")
+            
+            # Índice de búsqueda de texto completo (FTS5 en SQLite, tsvector/GIN en PostgreSQL)
+            try:
+                from busqueda import instalar_busqueda
+                instalar_busqueda()
+            except Exception as e:
+                print(f"[WARNING] No se pudo crear el índice de búsqueda: {e}")
+            
             # Crear usuarios administradores automáticamente si no existen
             from models import User
             from datetime import datetime, timedelta, timezone
@@ -252,4 +312,8 @@ except Exception as e:
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
+    # Con el recargador de desarrollo solo en el proceso que sirve las peticiones
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from copias_programadas import iniciar_planificador
+        iniciar_planificador(app)
     app.run(host='0.0.0.0', port=port, debug=debug)
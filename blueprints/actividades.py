@@ -2,26 +2,41 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import Actividad, Inscripcion, Beneficiario, db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
+from versiones import version_actividad, version_familia, leer_versiones, etag_condicional, no_modificado, marcar_etag
 
 actividades_bp = Blueprint('actividades', __name__)
 
 @actividades_bp.route('/<int:actividad_id>')
 @login_required
 def detalle_actividad(actividad_id):
+    # ETag: la actividad con sus inscripciones y la familia del usuario (versiones antes que los datos)
+    versiones = leer_versiones(version_actividad(actividad_id), version_familia(current_user.id))
     actividad = Actividad.query.get_or_404(actividad_id)
+    ahora = datetime.utcnow()
+    
+    etag = etag_condicional('actividades.detalle_actividad', actividad_id, current_user.id, current_user.rol,
+                            actividad.fecha > ahora, datetime.now().year, *versiones.values())
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
     
     # Obtener todas las inscripciones del socio para esta actividad
     inscripciones_actividad = []
     beneficiarios = []
     if current_user.is_socio():
-        inscripciones_actividad = Inscripcion.query.filter_by(
+        inscripciones_actividad = Inscripcion.query.options(joinedload(Inscripcion.beneficiario)).filter_by(
             user_id=current_user.id,
             actividad_id=actividad_id
         ).all()
         beneficiarios = Beneficiario.query.filter_by(socio_id=current_user.id).order_by(Beneficiario.nombre).all()
     
-    return render_template('actividades/detalle.html', 
-                         actividad=actividad, 
-                         inscripciones_actividad=inscripciones_actividad,
-                         beneficiarios=beneficiarios,
-                         ahora=datetime.utcnow())
+    # Índice (actividad_id, beneficiario_id) construido con las inscripciones ya cargadas
+    indice_inscritos = {(insc.actividad_id, insc.beneficiario_id) for insc in inscripciones_actividad}
+    
+    return marcar_etag(render_template('actividades/detalle.html', 
+                                       actividad=actividad, 
+                                       inscripciones_actividad=inscripciones_actividad,
+                                       indice_inscritos=indice_inscritos,
+                                       beneficiarios=beneficiarios,
+                                       ahora=ahora), etag)
@@ -1,37 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
-from models import User, SolicitudSocio, BeneficiarioSolicitud, db
+from models import User, SolicitudSocio, BeneficiarioSolicitud, db, siguiente_numero_socio, asignar_nombres_usuario
+from normalizacion import quitar_acentos
+from copias_programadas import solicitar_copia, reintentar_planificador
 from datetime import datetime
 import re
-import unicodedata
-import os
-import shutil
-import threading
 import secrets
-try:
-    import paramiko
-    SFTP_AVAILABLE = True
-except ImportError:
-    SFTP_AVAILABLE = False
-    print("[WARNING] paramiko no está instalado. SFTP no estará disponible.")
 
 auth_bp = Blueprint('auth', __name__)
 
-def quitar_acentos(texto):
-    """Convierte texto a mayúsculas y quita acentos, pero preserva la ñ"""
-    # Usar un marcador único que no puede aparecer en el texto
-    MARKER = '\uE000'  # Carácter privado Unicode que no se usa
-    # Preservar la ñ antes de quitar acentos
-    texto = texto.replace('ñ', MARKER).replace('Ñ', MARKER)
-    # Normalizar a NFD (descomponer caracteres)
-    texto = unicodedata.normalize('NFD', texto)
-    # Filtrar solo caracteres sin acentos
-    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
-    # Restaurar la ñ
-    texto = texto.replace(MARKER, 'Ñ')
-    # Convertir a mayúsculas
-    return texto.upper()
-
 @auth_bp.route('/login')
 def login():
     """Página principal/portada sin formulario de login"""
@@ -70,185 +47,16 @@ def acceso_socios():
     
     return render_template('auth/acceso_socios.html')
 
-def crear_backup_bd():
-    """Crea un backup de la base de datos SQLite y lo sube a FTP"""
-    try:
-        # Obtener la URL de la base de datos desde la configuración de Flask
-        from flask import current_app
-        database_url = current_app.config.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///asociacion.db')
-        fecha_str = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Solo funciona con SQLite
-        if 'postgres' in database_url.lower():
-            print("[INFO] Backup automático solo disponible para SQLite")
-            return False
-        
-        # SQLite - copiar archivo
-        db_path = database_url.replace('sqlite:///', '')
-        if not os.path.isabs(db_path):
-            # Ruta relativa, buscar en instance/
-            db_path = os.path.join('instance', db_path)
-        
-        backup_filename = f'backup_sqlite_{fecha_str}.db'
-        try:
-            if os.path.exists(db_path):
-                # IMPORTANTE: Hacer checkpoint de WAL antes de copiar para asegurar consistencia
-                from models import db
-                from sqlalchemy import text
-                try:
-                    # Cerrar todas las conexiones activas
-                    db.session.close_all()
-                    db.engine.dispose()
-                    
-                    # Hacer checkpoint completo de WAL para asegurar que todos los cambios están en el archivo principal
-                    with db.engine.connect() as conn:
-                        conn.execute(text('PRAGMA wal_checkpoint(FULL);'))
-                        conn.commit()
-                    
-                    # Cerrar de nuevo después del checkpoint
-                    db.session.close_all()
-                    db.engine.dispose()
-                except Exception as e:
-                    print(f"[WARNING] No se pudo hacer checkpoint de WAL antes del backup: {e}")
-                    # Continuar con el backup de todas formas
-                
-                # Copiar el archivo principal y los archivos WAL si existen
-                shutil.copy2(db_path, backup_filename)
-                
-                # También copiar archivos WAL y SHM si existen (para backup completo)
-                wal_file = f"{db_path}-wal"
-                shm_file = f"{db_path}-shm"
-                if os.path.exists(wal_file):
-                    shutil.copy2(wal_file, f"{backup_filename}-wal")
-                if os.path.exists(shm_file):
-                    shutil.copy2(shm_file, f"{backup_filename}-shm")
-                
-                print(f"[OK] Backup creado: {backup_filename}")
-            else:
-                print(f"[ERROR] Archivo de BD no encontrado: {db_path}")
-                return False
-        except Exception as e:
-            print(f"[ERROR] Error al copiar SQLite: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
-        
-        # Subir a FTP
-        if subir_backup_ftp(backup_filename):
-            # Eliminar archivo local después de subir
-            try:
-                if os.path.exists(backup_filename):
-                    os.remove(backup_filename)
-                    print(f"[OK] Archivo local eliminado después de subir")
-            except Exception as e:
-                print(f"[ADVERTENCIA] No se pudo eliminar archivo local: {e}")
-            return True
-        else:
-            # Si no se pudo subir, dejar el archivo local
-            print(f"[INFO] Backup guardado localmente: {backup_filename}")
-            return False
-            
-    except Exception as e:
-        print(f"[ERROR] Error general en backup: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
-def subir_backup_ftp(backup_filename):
-    """Sube el archivo de backup al servidor SFTP"""
-    try:
-        if not SFTP_AVAILABLE:
-            print("[ERROR] paramiko no está disponible. No se puede subir el backup.")
-            return False
-        
-        # Obtener credenciales SFTP de variables de entorno
-        # Acepta tanto FTP_PASSWORD como FTP_PASS para compatibilidad
-        sftp_host = os.environ.get('FTP_HOST')
-        sftp_user = os.environ.get('FTP_USER')
-        sftp_password = os.environ.get('FTP_PASSWORD') or os.environ.get('FTP_PASS')
-        sftp_directory = os.environ.get('FTP_DIRECTORY', '/')
-        
-        # Obtener puerto SFTP (por defecto 22)
-        sftp_port = int(os.environ.get('SFTP_PORT', '22'))
-        
-        if not all([sftp_host, sftp_user, sftp_password]):
-            print(f"[INFO] Variables SFTP no configuradas completamente:")
-            print(f"  FTP_HOST: {'✓' if sftp_host else '✗'}")
-            print(f"  FTP_USER: {'✓' if sftp_user else '✗'}")
-            print(f"  FTP_PASSWORD/FTP_PASS: {'✓' if sftp_password else '✗'}")
-            print(f"  Saltando subida a SFTP")
-            return False
-        
-        if not os.path.exists(backup_filename):
-            print(f"[ERROR] Archivo de backup no encontrado: {backup_filename}")
-            return False
-        
-        # Conectar a SFTP
-        transport = paramiko.Transport((sftp_host, sftp_port))
-        transport.connect(username=sftp_user, password=sftp_password)
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        
-        # Cambiar al directorio si se especifica
-        if sftp_directory and sftp_directory != '/':
-            try:
-                sftp.chdir(sftp_directory)
-            except IOError:
-                # Intentar crear el directorio si no existe
-                try:
-                    # Crear directorios recursivamente si no existen
-                    dirs = sftp_directory.strip('/').split('/')
-                    current_path = ''
-                    for dir_name in dirs:
-                        if dir_name:
-                            current_path = current_path + '/' + dir_name if current_path else '/' + dir_name
-                            try:
-                                sftp.chdir(current_path)
-                            except IOError:
-                                sftp.mkdir(current_path)
-                                sftp.chdir(current_path)
-                except Exception as e:
-                    print(f"[WARNING] No se pudo crear/entrar al directorio {sftp_directory}: {e}")
-        
-        # Subir archivo
-        remote_path = os.path.join(sftp_directory, backup_filename).replace('\\', '/')
-        sftp.put(backup_filename, remote_path)
-        
-        sftp.close()
-        transport.close()
-        print(f"[OK] Backup subido a SFTP: {remote_path}")
-        return True
-        
-    except Exception as e:
-        print(f"[ERROR] Error al subir backup a SFTP: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
 @auth_bp.route('/logout')
 @login_required
 def logout():
-    """Cierra sesión y crea backup automático de la BD"""
-    from flask import current_app
-    
-    # Obtener la instancia de la app antes de crear el hilo
-    app_instance = current_app._get_current_object()
-    
-    # Crear backup en segundo plano (no bloquear el logout)
-    def backup_async():
-        try:
-            # Necesitamos el contexto de la aplicación Flask
-            with app_instance.app_context():
-                crear_backup_bd()
-        except Exception as e:
-            print(f"[ERROR] Error en backup asíncrono: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    # Ejecutar backup en un hilo separado para no bloquear
-    thread = threading.Thread(target=backup_async)
-    thread.daemon = True
-    thread.start()
+    """Cierra sesión y pide una copia de seguridad de la BD (el planificador agrupa las peticiones)"""
+    try:
+        solicitar_copia()
+        # Por si el worker que tenía el planificador ha muerto
+        reintentar_planificador()
+    except Exception as e:
+        print(f"[ERROR] No se pudo pedir el backup automático: {e}")
     
     logout_user()
     flash('Has cerrado sesión correctamente.', 'info')
@@ -493,38 +301,11 @@ def confirmacion_solicitud(token):
     solicitud = SolicitudSocio.query.filter_by(token=token).first_or_404()
     
     # Generar nombre de usuario de forma predictiva (igual que en admin.py)
-    # Calcular el próximo número de socio
-    from models import User
-    ultimo_socio = User.query.filter(User.numero_socio.isnot(None)).order_by(User.numero_socio.desc()).first()
-    if ultimo_socio and ultimo_socio.numero_socio:
-        try:
-            ultimo_numero = int(ultimo_socio.numero_socio)
-            nuevo_numero = ultimo_numero + 1
-        except ValueError:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    numero_socio = f"{nuevo_numero:04d}"  # Formato 0001, 0002, etc.
-    
-    # Generar nombre de usuario: nombre + iniciales de los dos apellidos + año de nacimiento
-    nombre_limpio = solicitud.nombre.lower().replace(' ', '').replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u').replace('ñ', 'n')
-    
-    # Obtener iniciales de los apellidos
-    inicial_primer_apellido = solicitud.primer_apellido[0].lower() if solicitud.primer_apellido else ''
-    inicial_segundo_apellido = solicitud.segundo_apellido[0].lower() if solicitud.segundo_apellido else ''
-    
-    # Obtener año de nacimiento
-    ano_nacimiento = solicitud.fecha_nacimiento.year if solicitud.fecha_nacimiento else ''
-    
-    nombre_usuario = f"{nombre_limpio}{inicial_primer_apellido}{inicial_segundo_apellido}{ano_nacimiento}"
+    # Próximo número de socio según el contador (orientativo: se asigna al confirmar la solicitud)
+    numero_socio = siguiente_numero_socio()
     
-    # Verificar si el nombre de usuario ya existe y generar uno único
-    contador = 1
-    nombre_usuario_original = nombre_usuario
-    while User.query.filter_by(nombre_usuario=nombre_usuario).first():
-        nombre_usuario = f"{nombre_limpio}{inicial_primer_apellido}{inicial_segundo_apellido}{ano_nacimiento}{contador}"
-        contador += 1
+    # Generar nombre de usuario único: nombre + iniciales de los dos apellidos + año de nacimiento
+    nombre_usuario = asignar_nombres_usuario([solicitud])[0]
     
     # Números de pago (estos deberían estar en configuración, por ahora hardcodeados)
     NUMERO_BIZUM = "614 66 53 54"
@@ -1,6 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import User, Actividad, Inscripcion, Beneficiario, db
+from models import User, Actividad, Inscripcion, Beneficiario, ListaEspera, db, indice_inscripciones, posiciones_lista_espera, promover_lista_espera
+from cache_actividades import actividades_proximas
+from versiones import GENERACION_ACTIVIDADES, LISTA_ESPERA, version_familia, leer_versiones, etag_condicional, no_modificado, marcar_etag
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
 socios_bp = Blueprint('socios', __name__)
@@ -12,13 +15,14 @@ def dashboard():
         flash('No tienes permisos para acceder a esta página.', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    # Todas las actividades disponibles
-    actividades_disponibles = Actividad.query.filter(
-        Actividad.fecha > datetime.utcnow()
-    ).order_by(Actividad.fecha).all()
+    # Todas las actividades disponibles (caché compartida hasta que cambie alguna actividad)
+    actividades_disponibles = actividades_proximas()
     
     # Obtener todas las inscripciones del socio (suyas y de sus beneficiarios)
-    inscripciones = Inscripcion.query.filter_by(user_id=current_user.id).all()
+    inscripciones = Inscripcion.query.options(joinedload(Inscripcion.beneficiario)).filter_by(user_id=current_user.id).all()
+    
+    # Índice (actividad_id, beneficiario_id) para que la plantilla no consulte la BD por cada actividad
+    indice_inscritos = {(insc.actividad_id, insc.beneficiario_id) for insc in inscripciones}
     
     # Obtener actividades únicas de las inscripciones
     actividades_ids = {insc.actividad_id for insc in inscripciones}
@@ -34,10 +38,19 @@ def dashboard():
     # Cargar beneficiarios del socio
     beneficiarios = Beneficiario.query.filter_by(socio_id=current_user.id).order_by(Beneficiario.nombre).all()
     
+    # Listas de espera de la familia con su posición
+    entradas_espera = ListaEspera.query.options(
+        joinedload(ListaEspera.actividad), joinedload(ListaEspera.beneficiario)
+    ).filter_by(user_id=current_user.id).order_by(ListaEspera.id).all()
+    posiciones_espera = posiciones_lista_espera(current_user.id)
+    
     return render_template('socios/dashboard.html',
                          actividades_disponibles=actividades_disponibles,
                          actividades_inscrito=actividades_inscrito,
                          inscripciones_por_actividad=inscripciones_por_actividad,
+                         indice_inscritos=indice_inscritos,
+                         entradas_espera=entradas_espera,
+                         posiciones_espera=posiciones_espera,
                          beneficiarios=beneficiarios)
 
 @socios_bp.route('/perfil')
@@ -56,15 +69,32 @@ def actividades():
         flash('No tienes permisos para acceder a esta página.', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    # Todas las actividades disponibles
-    actividades = Actividad.query.filter(
-        Actividad.fecha > datetime.utcnow()
-    ).order_by(Actividad.fecha).all()
+    # ETag: actividades, listas de espera y familia del socio (versiones leídas antes que los datos)
+    versiones = leer_versiones(GENERACION_ACTIVIDADES, LISTA_ESPERA, version_familia(current_user.id))
+    
+    # Todas las actividades disponibles (caché compartida hasta que cambie alguna actividad)
+    actividades = actividades_proximas()
+    
+    # La lista cambia cuando empieza una actividad y las restricciones de edad con el año
+    etag = etag_condicional('socios.actividades', current_user.id, datetime.now().year,
+                            [actividad.id for actividad in actividades], *versiones.values())
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
     
     # Cargar beneficiarios del socio
     beneficiarios = Beneficiario.query.filter_by(socio_id=current_user.id).order_by(Beneficiario.nombre).all()
     
-    return render_template('socios/actividades.html', actividades=actividades, beneficiarios=beneficiarios)
+    # Inscripciones de la familia en las actividades listadas, en una sola consulta
+    indice_inscritos = indice_inscripciones(
+        current_user.id,
+        [actividad.id for actividad in actividades],
+        [ben.id for ben in beneficiarios]
+    )
+    posiciones_espera = posiciones_lista_espera(current_user.id, [actividad.id for actividad in actividades])
+    
+    return marcar_etag(render_template('socios/actividades.html', actividades=actividades, beneficiarios=beneficiarios,
+                                       indice_inscritos=indice_inscritos, posiciones_espera=posiciones_espera), etag)
 
 @socios_bp.route('/actividades/<int:actividad_id>/inscribir', methods=['POST'])
 @login_required
@@ -109,9 +139,9 @@ def inscribir_actividad(actividad_id):
         
         ano_nacimiento = current_user.ano_nacimiento
     
-    # Verificar si hay plazas disponibles
+    # Comprobación rápida sin bloquear la BD; la definitiva es reservar_plaza()
     if not actividad.tiene_plazas_disponibles():
-        flash('No hay plazas disponibles para esta actividad.', 'error')
+        flash('No hay plazas disponibles para esta actividad. Puedes apuntarte a la lista de espera.', 'error')
         return redirect(url_for('socios.actividades'))
     
     # Verificar si la actividad no ha pasado
@@ -134,6 +164,11 @@ def inscribir_actividad(actividad_id):
     )
     
     try:
+        # Reservar la plaza y crear la inscripción en la misma transacción
+        if not actividad.reservar_plaza():
+            db.session.rollback()
+            flash('No hay plazas disponibles para esta actividad. Puedes apuntarte a la lista de espera.', 'error')
+            return redirect(url_for('socios.actividades'))
         db.session.add(inscripcion)
         db.session.commit()
         
@@ -203,6 +238,9 @@ def cancelar_inscripcion(actividad_id):
     # Permitir cancelar en cualquier momento (sin restricción de tiempo)
     try:
         db.session.delete(inscripcion)
+        actividad.restar_inscrito()
+        # La plaza liberada pasa al primero de la lista de espera en la misma transacción
+        promover_lista_espera(actividad)
         db.session.commit()
         
         if beneficiario_id and beneficiario_id != 'socio':
@@ -218,6 +256,110 @@ def cancelar_inscripcion(actividad_id):
         traceback.print_exc()
         return redirect(url_for('socios.dashboard'))
 
+@socios_bp.route('/actividades/<int:actividad_id>/lista-espera', methods=['POST'])
+@login_required
+def unirse_lista_espera(actividad_id):
+    if not current_user.is_socio():
+        flash('No tienes permisos para realizar esta acción.', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    actividad = Actividad.query.get_or_404(actividad_id)
+    beneficiario_id = request.form.get('beneficiario_id', '').strip()
+    
+    # Determinar si es el socio o uno de sus beneficiarios
+    beneficiario = None
+    if beneficiario_id and beneficiario_id != 'socio':
+        try:
+            beneficiario = Beneficiario.query.filter_by(id=int(beneficiario_id), socio_id=current_user.id).first()
+        except ValueError:
+            flash('ID de beneficiario inválido.', 'error')
+            return redirect(url_for('socios.actividades'))
+        if not beneficiario:
+            flash('El beneficiario no pertenece a tu cuenta.', 'error')
+            return redirect(url_for('socios.actividades'))
+    beneficiario_id_int = beneficiario.id if beneficiario else None
+    ano_nacimiento = beneficiario.ano_nacimiento if beneficiario else current_user.ano_nacimiento
+    
+    if actividad.fecha <= datetime.utcnow():
+        flash('Esta actividad ya ha terminado.', 'error')
+        return redirect(url_for('socios.actividades'))
+    
+    if Inscripcion.query.filter_by(user_id=current_user.id, actividad_id=actividad.id, beneficiario_id=beneficiario_id_int).first():
+        flash('Ya está inscrito en esta actividad.', 'warning')
+        return redirect(url_for('socios.actividades'))
+    
+    if actividad.tiene_plazas_disponibles():
+        flash('Todavía quedan plazas: puedes inscribirte directamente.', 'info')
+        return redirect(url_for('socios.actividades'))
+    
+    if actividad.tiene_restriccion_edad():
+        puede_inscribirse, mensaje_error = actividad.puede_inscribirse_por_edad(ano_nacimiento)
+        if not puede_inscribirse:
+            flash(f'No se puede inscribir en esta actividad: {mensaje_error}', 'error')
+            return redirect(url_for('socios.actividades'))
+    
+    if ListaEspera.query.filter_by(user_id=current_user.id, actividad_id=actividad.id, beneficiario_id=beneficiario_id_int).first():
+        flash('Ya está en la lista de espera de esta actividad.', 'warning')
+        return redirect(url_for('socios.actividades'))
+    
+    try:
+        db.session.add(ListaEspera(user_id=current_user.id, actividad_id=actividad.id, beneficiario_id=beneficiario_id_int))
+        db.session.commit()
+        posicion = posiciones_lista_espera(current_user.id, [actividad.id]).get((actividad.id, beneficiario_id_int))
+        flash(f'Apuntado a la lista de espera de "{actividad.nombre}" (posición {posicion}). '
+              f'Si queda una plaza libre se hará la inscripción automáticamente.', 'success')
+        return redirect(url_for('socios.actividades'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al apuntarse a la lista de espera: {str(e)}. Por favor, inténtalo de nuevo.', 'error')
+        import traceback
+        traceback.print_exc()
+        return redirect(url_for('socios.actividades'))
+
+@socios_bp.route('/actividades/<int:actividad_id>/lista-espera/salir', methods=['POST'])
+@login_required
+def salir_lista_espera(actividad_id):
+    if not current_user.is_socio():
+        flash('No tienes permisos para realizar esta acción.', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    beneficiario_id = request.form.get('beneficiario_id', '').strip()
+    try:
+        beneficiario_id_int = int(beneficiario_id) if beneficiario_id and beneficiario_id != 'socio' else None
+    except ValueError:
+        flash('ID de beneficiario inválido.', 'error')
+        return redirect(url_for('socios.actividades'))
+    
+    # Solo entradas del propio socio (user_id), así no se puede tocar la de otra familia
+    entrada = ListaEspera.query.filter_by(user_id=current_user.id, actividad_id=actividad_id, beneficiario_id=beneficiario_id_int).first()
+    if not entrada:
+        flash('No está en la lista de espera de esta actividad.', 'error')
+        return redirect(url_for('socios.actividades'))
+    
+    try:
+        db.session.delete(entrada)
+        db.session.commit()
+        flash('Has salido de la lista de espera.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al salir de la lista de espera: {str(e)}. Por favor, inténtalo de nuevo.', 'error')
+        import traceback
+        traceback.print_exc()
+    return redirect(url_for('socios.actividades'))
+
+@socios_bp.route('/lista-espera/posiciones')
+@login_required
+def posiciones_espera():
+    """Posición en las listas de espera (JSON), para consultarla sin recargar el listado de actividades"""
+    if not current_user.is_socio():
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    posiciones = posiciones_lista_espera(current_user.id)
+    return jsonify({'posiciones': [
+        {'actividad_id': actividad_id, 'beneficiario_id': beneficiario_id, 'posicion': posicion}
+        for (actividad_id, beneficiario_id), posicion in sorted(posiciones.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+    ]})
+
 @socios_bp.route('/mis-actividades')
 @login_required
 def mis_actividades():
@@ -0,0 +1,189 @@
+"""
+Índice de búsqueda de texto completo para los listados de la directiva
+
+Sustituye los LIKE '%texto%' sobre varias columnas por un índice mantenido por la propia BD:
+- SQLite: tablas virtuales FTS5 (una por tabla indexada) sincronizadas con triggers.
+- PostgreSQL: columna tsvector 'busqueda' rellenada por un trigger e indexada con GIN; incluye
+  nombre_norm para que las búsquedas sin acentos encuentren nombres guardados con acentos.
+- Otros motores (o SQLite sin FTS5): LIKE por cada término (también sobre nombre_norm), sin índice.
+
+Las búsquedas son por prefijo (cada palabra escrita es el comienzo de una palabra indexada),
+sin distinguir mayúsculas/acentos en SQLite, y devuelven un 'rango' donde menor es mejor.
+"""
+import re
+import sqlite3
+from sqlalchemy import text, Integer, Float
+from models import db, User, Beneficiario, Actividad
+from normalizacion import quitar_acentos
+
+# Tabla indexada -> (modelo, columnas indexadas con su tipo: 'texto' o 'fecha')
+INDICES = {
+    'users': (User, (('nombre', 'texto'), ('nombre_usuario', 'texto'),
+                     ('numero_socio', 'texto'), ('fecha_validez', 'fecha'))),
+    'beneficiarios': (Beneficiario, (('nombre', 'texto'), ('primer_apellido', 'texto'),
+                                     ('segundo_apellido', 'texto'), ('numero_beneficiario', 'texto'))),
+    'actividades': (Actividad, (('nombre', 'texto'), ('descripcion', 'texto'), ('fecha', 'fecha'))),
+}
+
+def terminos(texto):
+    """Palabras de la búsqueda (letras y dígitos); fechas y números se parten por '/', '-', etc."""
+    return re.findall(r'[^\W_]+', texto or '')
+
+class BusquedaFTS5:
+    """SQLite: tabla virtual <tabla>_fts con rowid = id de la fila original"""
+    nombre = 'fts5'
+
+    def _expresiones(self, columnas, prefijo):
+        return [f"strftime('%d/%m/%Y', {prefijo}.{columna})" if tipo == 'fecha' else f"{prefijo}.{columna}"
+                for columna, tipo in columnas]
+
+    def instalar(self, conn, tabla, columnas):
+        tabla_fts = f'{tabla}_fts'
+        nombres = ', '.join(columna for columna, _ in columnas)
+        existe = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nombre"),
+                              {'nombre': tabla_fts}).first() is not None
+        if not existe:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {tabla_fts} USING fts5({nombres}, "
+                f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            ))
+
+        valores_new = ', '.join(self._expresiones(columnas, 'new'))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ai AFTER INSERT ON {tabla} BEGIN "
+            f"INSERT INTO {tabla_fts}(rowid, {nombres}) VALUES (new.id, {valores_new}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ad AFTER DELETE ON {tabla} BEGIN "
+            f"DELETE FROM {tabla_fts} WHERE rowid = old.id; END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {tabla_fts}_au AFTER UPDATE OF id, {nombres} ON {tabla} BEGIN "
+            f"DELETE FROM {tabla_fts} WHERE rowid = old.id; "
+            f"INSERT INTO {tabla_fts}(rowid, {nombres}) VALUES (new.id, {valores_new}); END"
+        ))
+
+        if not existe:
+            # Volcar las filas que ya había antes de crear el índice
+            conn.execute(text(
+                f"INSERT INTO {tabla_fts}(rowid, {nombres}) "
+                f"SELECT id, {', '.join(self._expresiones(columnas, tabla))} FROM {tabla}"
+            ))
+        return not existe
+
+    def coincidencias(self, tabla, palabras):
+        consulta = ' '.join('"' + palabra + '"*' for palabra in palabras)
+        return text(
+            f"SELECT rowid AS id, bm25({tabla}_fts) AS rango FROM {tabla}_fts WHERE {tabla}_fts MATCH :consulta"
+        ).bindparams(consulta=consulta).columns(id=Integer, rango=Float)
+
+class BusquedaPostgres:
+    """PostgreSQL: columna tsvector 'busqueda' mantenida por un trigger BEFORE INSERT/UPDATE e índice GIN"""
+    nombre = 'tsvector'
+
+    def _documento(self, tabla, columnas, prefijo):
+        partes = [f"to_char({prefijo}.{columna}, 'DD/MM/YYYY')" if tipo == 'fecha' else f"{prefijo}.{columna}"
+                  for columna, tipo in columnas]
+        if hasattr(INDICES[tabla][0], 'nombre_norm'):
+            partes.append(f"{prefijo}.nombre_norm")
+        # Separar por cualquier signo para que '0001-1' o '15/03/2026' se indexen como palabras sueltas
+        return f"to_tsvector('simple', regexp_replace(concat_ws(' ', {', '.join(partes)}), '[^[:alnum:]]+', ' ', 'g'))"
+
+    def instalar(self, conn, tabla, columnas):
+        existe = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = :tabla AND column_name = 'busqueda'"
+        ), {'tabla': tabla}).first() is not None
+        if not existe:
+            conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN busqueda tsvector"))
+
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {tabla}_busqueda_actualizar() RETURNS trigger AS $$ "
+            f"BEGIN NEW.busqueda := {self._documento(tabla, columnas, 'NEW')}; RETURN NEW; END "
+            f"$$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {tabla}_busqueda ON {tabla}"))
+        conn.execute(text(
+            f"CREATE TRIGGER {tabla}_busqueda BEFORE INSERT OR UPDATE ON {tabla} "
+            f"FOR EACH ROW EXECUTE PROCEDURE {tabla}_busqueda_actualizar()"
+        ))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_busqueda ON {tabla} USING GIN (busqueda)"))
+
+        if not existe:
+            conn.execute(text(f"UPDATE {tabla} SET busqueda = {self._documento(tabla, columnas, tabla)}"))
+        return not existe
+
+    def coincidencias(self, tabla, palabras):
+        # Cada palabra tal cual (columnas con acentos) o normalizada (nombre_norm)
+        alternativas = []
+        for palabra in palabras:
+            normalizada = quitar_acentos(palabra).lower()
+            if normalizada != palabra.lower():
+                alternativas.append(f'({palabra}:* | {normalizada}:*)')
+            else:
+                alternativas.append(f'{palabra}:*')
+        consulta = ' & '.join(alternativas)
+        # ts_rank: mayor es mejor; se invierte para ordenar igual que bm25
+        return text(
+            f"SELECT id, -ts_rank(busqueda, to_tsquery('simple', :consulta)) AS rango FROM {tabla} "
+            f"WHERE busqueda @@ to_tsquery('simple', :consulta)"
+        ).bindparams(consulta=consulta).columns(id=Integer, rango=Float)
+
+class BusquedaLike:
+    """Sin índice: cada palabra debe aparecer en alguna de las columnas de texto"""
+    nombre = 'like'
+
+    def instalar(self, conn, tabla, columnas):
+        return False
+
+    def coincidencias(self, tabla, palabras):
+        modelo, columnas = INDICES[tabla]
+        atributos = [getattr(modelo, columna) for columna, tipo in columnas if tipo == 'texto']
+        consulta = db.select(modelo.id.label('id'), db.literal(0.0, Float).label('rango'))
+        for palabra in palabras:
+            condiciones = [atributo.contains(palabra) for atributo in atributos]
+            if hasattr(modelo, 'nombre_norm'):
+                condiciones.append(modelo.nombre_norm.contains(quitar_acentos(palabra)))
+            consulta = consulta.where(db.or_(*condiciones))
+        return consulta
+
+_FTS5_DISPONIBLE = None
+
+def _fts5_disponible():
+    global _FTS5_DISPONIBLE
+    if _FTS5_DISPONIBLE is None:
+        try:
+            conexion = sqlite3.connect(':memory:')
+            conexion.execute('CREATE VIRTUAL TABLE prueba USING fts5(x)')
+            conexion.close()
+            _FTS5_DISPONIBLE = True
+        except sqlite3.OperationalError:
+            _FTS5_DISPONIBLE = False
+    return _FTS5_DISPONIBLE
+
+def backend():
+    """Backend de búsqueda adecuado al motor de la BD configurada"""
+    dialecto = db.engine.dialect.name
+    if dialecto == 'sqlite' and _fts5_disponible():
+        return BusquedaFTS5()
+    if dialecto == 'postgresql':
+        return BusquedaPostgres()
+    return BusquedaLike()
+
+def instalar_busqueda():
+    """Crea (si faltan) los índices de búsqueda y sus triggers; idempotente. Requiere app_context."""
+    motor = backend()
+    with db.engine.begin() as conn:
+        for tabla, (modelo, columnas) in INDICES.items():
+            if motor.instalar(conn, tabla, columnas):
+                print(f"[OK] Índice de búsqueda ({motor.nombre}) creado para '{tabla}'")
+    return motor.nombre
+
+def coincidencias(tabla, texto):
+    """Subconsulta (id, rango) con las filas de `tabla` que coinciden con `texto`, o None si no hay palabras.
+
+    Se usa con un JOIN sobre el id; ordenar por (rango, id) da primero las mejores coincidencias.
+    """
+    palabras = terminos(texto)
+    if not palabras:
+        return None
+    return backend().coincidencias(tabla, palabras).subquery()
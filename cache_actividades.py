@@ -0,0 +1,92 @@
+"""
+Caché de los listados de actividades con invalidación por generación
+
+Cada transacción que modifica actividades (altas, ediciones, bajas y el contador de inscritos
+que mantienen las inscripciones) sube en uno el contador 'generacion_actividades' de la tabla
+contadores, dentro de la misma transacción (ver versiones.py). Los listados se guardan en memoria del proceso
+junto con la generación con la que se calcularon; una lectura de la generación por clave
+primaria basta para saber si siguen valiendo, también cuando el cambio lo hizo otro worker.
+Las entradas caducan por TTL, por LRU y cuando empieza la primera actividad que contienen.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from models import Actividad
+from versiones import GENERACION_ACTIVIDADES, epoca, leer_version
+
+TTL = timedelta(minutes=5)
+MAX_ENTRADAS = 128
+
+_lock = threading.Lock()
+_entradas = OrderedDict()  # clave -> (caduca, valor)
+_generacion_vista = None
+
+class ActividadCacheada:
+    """Copia de solo lectura de una Actividad, independiente de la sesión, con sus mismos métodos"""
+    __slots__ = ('id', 'nombre', 'descripcion', 'fecha', 'aforo_maximo', 'edad_minima', 'edad_maxima',
+                 'fecha_creacion', 'inscritos_count')
+
+    def __init__(self, actividad):
+        for atributo in self.__slots__:
+            setattr(self, atributo, getattr(actividad, atributo))
+
+    plazas_disponibles = Actividad.plazas_disponibles
+    tiene_plazas_disponibles = Actividad.tiene_plazas_disponibles
+    numero_inscritos = Actividad.numero_inscritos
+    tiene_restriccion_edad = Actividad.tiene_restriccion_edad
+    puede_inscribirse_por_edad = Actividad.puede_inscribirse_por_edad
+
+    def __repr__(self):
+        return f'<ActividadCacheada {self.nombre}>'
+
+def generacion_actividades():
+    """Generación actual de las actividades (una lectura por clave primaria)"""
+    return leer_version(GENERACION_ACTIVIDADES)
+
+def en_cache(clave, calcular):
+    """Devuelve el valor guardado para `clave` o lo calcula con calcular() -> (valor, caduca).
+
+    `caduca` es el instante (UTC) a partir del cual el valor deja de valer aunque no cambie la
+    generación, por ejemplo la fecha de la primera actividad listada; None para solo el TTL.
+    """
+    global _generacion_vista
+    # Con la época: tras sustituir la BD entera la generación puede repetir un valor ya visto
+    generacion = generacion_actividades(), epoca()
+    ahora = datetime.utcnow()
+    with _lock:
+        if generacion != _generacion_vista:
+            _entradas.clear()
+            _generacion_vista = generacion
+        entrada = _entradas.get(clave)
+        if entrada and entrada[0] > ahora:
+            _entradas.move_to_end(clave)
+            return entrada[1]
+
+    valor, caduca = calcular()
+    caduca = min(caduca, ahora + TTL) if caduca else ahora + TTL
+    with _lock:
+        # Si otra petición ya vio una generación más nueva, este cálculo puede estar desfasado
+        if generacion == _generacion_vista:
+            _entradas[clave] = (caduca, valor)
+            _entradas.move_to_end(clave)
+            while len(_entradas) > MAX_ENTRADAS:
+                _entradas.popitem(last=False)
+    return valor
+
+def vaciar_cache():
+    """Olvida todas las entradas (la generación en la BD no cambia)"""
+    global _generacion_vista
+    with _lock:
+        _entradas.clear()
+        _generacion_vista = None
+
+def actividades_proximas():
+    """Actividades que aún no han empezado, ordenadas por fecha (tupla de ActividadCacheada)"""
+    def calcular():
+        actividades = tuple(ActividadCacheada(actividad) for actividad in Actividad.query.filter(
+            Actividad.fecha > datetime.utcnow()
+        ).order_by(Actividad.fecha, Actividad.id))
+        # Cuando empiece la primera, deja de ser "próxima"
+        return actividades, actividades[0].fecha if actividades else None
+    return en_cache('proximas', calcular)
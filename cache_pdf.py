@@ -0,0 +1,96 @@
+"""
+Caché en disco de los PDF generados
+
+Los PDF se guardan en el disco persistente, en un directorio junto al archivo SQLite, con el
+nombre <clave>_<versión>.pdf: la versión sale de los contadores de versión de los datos, así que
+un cambio en los datos hace que se genere un archivo nuevo y el anterior de la misma clave se
+borra. Cada acierto actualiza la fecha de modificación del archivo; cuando el directorio supera
+MAX_BYTES se borran los usados hace más tiempo (LRU).
+"""
+import glob
+import os
+import tempfile
+
+from almacenamiento import directorio_persistente
+
+MAX_BYTES = 50 * 1024 * 1024
+DIRECTORIO = 'cache_pdf'
+
+def directorio_cache():
+    """Directorio de la caché: junto al SQLite, o en el disco persistente / instance con PostgreSQL"""
+    return directorio_persistente(DIRECTORIO)
+
+def _archivos(directorio, clave):
+    return glob.glob(os.path.join(glob.escape(directorio), f'{glob.escape(clave)}_*.pdf'))
+
+def pdf_en_cache(clave, version, generar):
+    """Devuelve el PDF de `clave` en su `version` abierto para leer; si no está, lo crea con generar() -> bytes.
+
+    Se devuelve el archivo ya abierto para que una limpieza simultánea no lo borre antes de enviarlo.
+    """
+    archivo = leer_pdf(clave, version)
+    if archivo is None:
+        archivo = guardar_pdf(clave, version, generar())
+    return archivo
+
+def leer_pdf(clave, version):
+    """El PDF guardado de `clave` en su `version` abierto para leer, o None si no está"""
+    ruta = os.path.join(directorio_cache(), f'{clave}_{version}.pdf')
+    try:
+        archivo = open(ruta, 'rb')
+    except FileNotFoundError:
+        return None
+    os.utime(ruta)
+    return archivo
+
+def guardar_pdf(clave, version, contenido):
+    """Guarda `contenido` como el PDF de `clave` en su `version`, borra las versiones anteriores y lo devuelve abierto"""
+    directorio = directorio_cache()
+    ruta = os.path.join(directorio, f'{clave}_{version}.pdf')
+    # Escribir en un temporal y renombrar: nadie lee nunca un PDF a medio escribir
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as salida:
+        salida.write(contenido)
+    os.replace(temporal, ruta)
+    archivo = open(ruta, 'rb')
+
+    for anterior in _archivos(directorio, clave):
+        if anterior != ruta:
+            _borrar(anterior)
+    _recortar(directorio)
+    return archivo
+
+def invalidar_pdf(clave):
+    """Borra todas las versiones guardadas del PDF `clave`"""
+    for ruta in _archivos(directorio_cache(), clave):
+        _borrar(ruta)
+
+def vaciar_cache_pdf():
+    """Borra todos los PDF guardados (tras sustituir la BD entera)"""
+    directorio = directorio_cache()
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.pdf'):
+            _borrar(os.path.join(directorio, nombre))
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+def _recortar(directorio):
+    """Borra los PDF usados hace más tiempo hasta que el directorio quepa en MAX_BYTES"""
+    archivos = []
+    for entrada in os.scandir(directorio):
+        if entrada.is_file() and entrada.name.endswith('.pdf'):
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, entrada.path))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if total <= MAX_BYTES:
+            break
+        _borrar(ruta)
+        total -= tamano
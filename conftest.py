@@ -0,0 +1,112 @@
+"""
+Configuración de pytest: cada test usa una base de datos SQLite temporal
+"""
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import g
+from sqlalchemy import event
+
+# test_import.py es un script independiente (python test_import.py), no un módulo de pytest
+collect_ignore = ['test_import.py']
+
+# Importar app con una BD temporal para no tocar instance/asociacion.db
+os.environ['PERSISTENT_DISK_PATH'] = tempfile.mkdtemp(prefix='asociacion_test_')
+# Sin planificador de copias de seguridad en segundo plano (los tests lo manejan a mano)
+os.environ['BACKUP_AUTOMATICO'] = '0'
+
+from app import create_app
+from estadisticas import invalidar_estadisticas
+from cache_actividades import vaciar_cache
+from models import db, User, SolicitudSocio, BeneficiarioSolicitud
+
+
+@pytest.fixture
+def app():
+    """Aplicación con una base de datos SQLite nueva para cada test"""
+    os.environ['PERSISTENT_DISK_PATH'] = tempfile.mkdtemp(prefix='asociacion_test_')
+    app = create_app()
+    app.config['TESTING'] = True
+
+    # Las peticiones del cliente reutilizan el app_context del test (y su g): olvidar el usuario
+    # que Flask-Login guarda en g para que cada cliente se identifique con su propia sesión
+    @app.before_request
+    def olvidar_usuario_anterior():
+        g.pop('_login_user', None)
+
+    # Las estadísticas y los listados se cachean en memoria del proceso: no arrastrarlos de otro test
+    invalidar_estadisticas()
+    vaciar_cache()
+
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def login(client, user):
+    """Inicia sesión en el cliente de pruebas sin pasar por el formulario"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def admin_client(app):
+    """Cliente autenticado como miembro de la directiva"""
+    admin = User.query.filter_by(rol='directiva').first()
+    return login(app.test_client(), admin)
+
+
+def crear_socio(nombre, nombre_usuario, numero_socio=None, ano_nacimiento=1980):
+    """Crea un socio con validez de un año (sin commit)"""
+    socio = User(
+        nombre=nombre,
+        nombre_usuario=nombre_usuario,
+        password_hash='x',
+        rol='socio',
+        fecha_alta=datetime.utcnow(),
+        fecha_validez=datetime.utcnow() + timedelta(days=365),
+        ano_nacimiento=ano_nacimiento,
+        numero_socio=numero_socio
+    )
+    db.session.add(socio)
+    return socio
+
+
+def crear_solicitud(i, beneficiarios=0, nombre=None):
+    """Crea una solicitud por confirmar con `beneficiarios` beneficiarios (sin commit)"""
+    solicitud = SolicitudSocio(
+        nombre=nombre or f'NOMBRE{i}', primer_apellido='PRUEBA', segundo_apellido='TEST', movil='600000000',
+        fecha_nacimiento=date(1980, 1, 1), miembros_unidad_familiar=1 + beneficiarios, forma_de_pago='bizum',
+        password_solicitud='secreto', calle='MAYOR', numero='1', poblacion='MADRID', token=f'token{i}'
+    )
+    db.session.add(solicitud)
+    db.session.flush()
+    for j in range(beneficiarios):
+        db.session.add(BeneficiarioSolicitud(solicitud_id=solicitud.id, nombre=f'HIJO{j}', primer_apellido='PRUEBA',
+                                             segundo_apellido='TEST', ano_nacimiento=2015))
+    return solicitud
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque with"""
+
+    def __init__(self):
+        self.sentencias = []
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._registrar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._registrar)
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        self.sentencias.append(statement)
+
+    @property
+    def total(self):
+        return len(self.sentencias)
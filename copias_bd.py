@@ -0,0 +1,224 @@
+"""
+Copias de la base de datos completa
+
+La copia de SQLite se hace con la API de backup en línea de SQLite (sqlite3.Connection.backup)
+desde una conexión del pool: se copian PAGINAS páginas por paso y entre paso y paso la BD queda
+libre para el resto de peticiones, sin cerrar las conexiones ni hacer checkpoint del WAL. El
+resultado es una instantánea consistente en un archivo temporal que se envía a trozos desde disco.
+
+Con PostgreSQL la salida de pg_dump se envía según se genera y el archivo de una restauración se
+pasa a psql / pg_restore por la entrada estándar a trozos: la memoria no depende del tamaño de la BD.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import closing
+
+from sqlalchemy.engine import make_url
+
+from almacenamiento import directorio_persistente
+from cache_actividades import vaciar_cache
+from cache_pdf import vaciar_cache_pdf
+from estadisticas import invalidar_estadisticas
+from models import db
+from versiones import renovar_epoca, subir_todas_las_versiones
+
+PAGINAS = 1024  # páginas por paso del backup (4 MB con páginas de 4 KB)
+PAUSA = 0.005  # segundos entre pasos, para dejar paso a las escrituras
+TROZO = 256 * 1024
+TEMPORALES = 'temporales'
+
+def ruta_sqlite():
+    """Ruta absoluta del archivo SQLite de la aplicación, o None si la BD no es un archivo SQLite"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return os.path.abspath(url.database)
+
+def instantanea_sqlite(destino):
+    """Copia la BD SQLite en el archivo `destino` con la API de backup, sin parar la aplicación"""
+    conexion = db.engine.raw_connection()
+    try:
+        with closing(sqlite3.connect(destino)) as copia:
+            conexion.driver_connection.backup(copia, pages=PAGINAS, sleep=PAUSA)
+    finally:
+        conexion.close()
+
+def instantanea_temporal():
+    """Hace una instantánea de la BD en un temporal del disco persistente y devuelve su ruta"""
+    descriptor, ruta = tempfile.mkstemp(dir=directorio_persistente(TEMPORALES), suffix='.db')
+    os.close(descriptor)
+    try:
+        instantanea_sqlite(ruta)
+    except BaseException:
+        os.remove(ruta)
+        raise
+    return ruta
+
+def leer_y_borrar(ruta):
+    """Genera el contenido del archivo a trozos de TROZO bytes y lo borra al terminar (o si se corta el envío)"""
+    try:
+        with open(ruta, 'rb') as archivo:
+            while True:
+                trozo = archivo.read(TROZO)
+                if not trozo:
+                    break
+                yield trozo
+    finally:
+        os.remove(ruta)
+
+def bd_reemplazada():
+    """Deja la aplicación lista tras sustituir la BD entera (restauración o importación de un archivo SQLite).
+
+    Una copia antigua puede no tener alguna tabla nueva (contadores...) y sus contadores de versión
+    pueden repetir valores ya vistos: se suben y se cambia la época, que entra en todas las huellas
+    (ETag y nombres de los PDF). Se borran los PDF guardados, se olvidan las cachés del proceso y
+    el planificador de copias reabre su conexión a la BD.
+    """
+    db.create_all()
+    subir_todas_las_versiones()
+    renovar_epoca()
+    db.session.commit()
+    vaciar_cache()
+    vaciar_cache_pdf()
+    invalidar_estadisticas()
+    # Import aquí: copias_programadas importa este módulo
+    from copias_programadas import reabrir_conexion
+    reabrir_conexion()
+
+class ErrorCopia(Exception):
+    """pg_dump, psql o pg_restore no están disponibles o han fallado; el mensaje se muestra tal cual"""
+
+PG_DUMP = 'pg_dump'
+PSQL = 'psql'
+PG_RESTORE = 'pg_restore'
+CABECERA_CUSTOM = b'PGDMP'  # volcados de pg_dump -Fc
+MAX_ERROR = 2000
+TIEMPO_RESTAURACION = 600  # segundos (10 minutos máximo)
+
+def _conexion_pg(database_url):
+    """Argumentos de conexión de los programas de PostgreSQL y su entorno (la contraseña va en PGPASSWORD)"""
+    url = make_url(database_url)
+    entorno = os.environ.copy()
+    if url.password:
+        entorno['PGPASSWORD'] = url.password
+    argumentos = ['-h', url.host or 'localhost', '-p', str(url.port or 5432), '-U', url.username or '']
+    return argumentos, url.database, entorno
+
+def _error(programa, errores):
+    errores.seek(0)
+    texto = errores.read().decode('utf-8', 'replace').strip()[-MAX_ERROR:]
+    return ErrorCopia(f'Error de {os.path.basename(programa)}: {texto or "error desconocido"}')
+
+def _lanzar(comando, entorno, **opciones):
+    try:
+        return subprocess.Popen(comando, env=entorno, **opciones)
+    except OSError:
+        raise ErrorCopia(f'{os.path.basename(comando[0])} no está disponible en el sistema. Las copias de PostgreSQL requieren que esté instalado.')
+
+def volcado_postgres(database_url, formato='sql', comprimir=False):
+    """Lanza pg_dump y devuelve un generador de trozos de su salida, que se lee según se envía.
+
+    `formato` es 'sql' (texto plano, que se puede comprimir con gzip) o 'custom' (pg_dump -Fc, ya
+    comprimido). Si pg_dump falla antes de dar nada lanza ErrorCopia aquí mismo; si falla a mitad,
+    el generador lanza ErrorCopia y la descarga queda cortada.
+    """
+    argumentos, base, entorno = _conexion_pg(database_url)
+    comando = [PG_DUMP, *argumentos, '-d', base, '--no-owner', '--no-acl', '--clean', '--if-exists']
+    if formato == 'custom':
+        comando.append('-Fc')
+    errores = tempfile.TemporaryFile()
+    try:
+        proceso = _lanzar(comando, entorno, stdout=subprocess.PIPE, stderr=errores)
+    except ErrorCopia:
+        errores.close()
+        raise
+    # Leer el primer trozo antes de empezar la respuesta: los errores de conexión aún se pueden avisar
+    primero = proceso.stdout.read(TROZO)
+    if not primero and proceso.wait() != 0:
+        proceso.stdout.close()
+        with errores:
+            raise _error(PG_DUMP, errores)
+    trozos = _salida(proceso, primero, errores)
+    if comprimir and formato != 'custom':
+        trozos = _gzip(trozos)
+    return trozos
+
+def _salida(proceso, primero, errores):
+    try:
+        trozo = primero
+        while trozo:
+            yield trozo
+            trozo = proceso.stdout.read(TROZO)
+        if proceso.wait() != 0:
+            raise _error(PG_DUMP, errores)
+    finally:
+        # Si el cliente corta la descarga, no dejar pg_dump colgado
+        if proceso.poll() is None:
+            proceso.kill()
+            proceso.wait()
+        proceso.stdout.close()
+        errores.close()
+
+def _gzip(trozos):
+    compresor = zlib.compressobj(wbits=31)  # 31: cabecera y cola gzip
+    for trozo in trozos:
+        comprimido = compresor.compress(trozo)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+def restaurar_postgres(database_url, archivo):
+    """Restaura en PostgreSQL el volcado del archivo binario `archivo`, pasándolo a trozos por la entrada estándar.
+
+    Los volcados -Fc van a pg_restore; los SQL (también en gzip) a psql. Lanza ErrorCopia si falla.
+    """
+    argumentos, base, entorno = _conexion_pg(database_url)
+    cabecera = archivo.read(len(CABECERA_CUSTOM))
+    archivo.seek(0)
+    if cabecera.startswith(b'\x1f\x8b'):
+        archivo = gzip.GzipFile(fileobj=archivo)
+        cabecera = b''
+    if cabecera == CABECERA_CUSTOM:
+        programa = PG_RESTORE
+        comando = [PG_RESTORE, *argumentos, '-d', base, '--no-owner', '--no-acl', '--clean', '--if-exists']
+    else:
+        programa = PSQL
+        # ON_ERROR_STOP: parar en la primera sentencia que falle y salir con error, no a medio restaurar
+        comando = [PSQL, *argumentos, '-d', base, '-v', 'ON_ERROR_STOP=1', '-f', '-']  # Leer desde stdin
+
+    limite = time.monotonic() + TIEMPO_RESTAURACION
+    with tempfile.TemporaryFile() as errores:
+        proceso = _lanzar(comando, entorno, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errores)
+        # Si el programa deja de leer, la escritura se quedaría bloqueada: matarlo al llegar al límite
+        vigilante = threading.Timer(TIEMPO_RESTAURACION, proceso.kill)
+        vigilante.start()
+        try:
+            shutil.copyfileobj(archivo, proceso.stdin, TROZO)
+        except BrokenPipeError:
+            # El programa ha terminado antes de leerlo todo: su error explica por qué
+            pass
+        except BaseException:
+            proceso.kill()
+            raise
+        finally:
+            vigilante.cancel()
+            try:
+                proceso.stdin.close()
+            except BrokenPipeError:
+                pass
+            try:
+                codigo = proceso.wait(timeout=max(limite - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+                codigo = proceso.wait()
+        if codigo != 0:
+            if time.monotonic() >= limite:
+                raise ErrorCopia('La operación de restauración tardó demasiado tiempo. Inténtalo de nuevo.')
+            raise _error(programa, errores)
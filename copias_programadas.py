@@ -0,0 +1,279 @@
+"""
+Copias de seguridad automáticas de la BD SQLite, subidas por SFTP
+
+Cerrar sesión ya no hace una copia completa cada vez: solo la pide (solicitar_copia()). Un
+planificador que corre en un único proceso (el worker de gunicorn que consigue el bloqueo de
+copias/planificador.lock) agrupa las peticiones. Lo arranca wsgi.py, no create_app(): los scripts
+que crean la aplicación no deben quedarse con el bloqueo ni hacer copias.
+
+  - una petición se atiende cuando han pasado INTERVALO_MINIMO segundos desde la última copia,
+    así que todas las que lleguen mientras tanto acaban en una sola;
+  - sin peticiones se hace igualmente una cada PERIODO;
+  - y solo si los datos han cambiado desde la última copia: PRAGMA data_version en una conexión
+    propia del planificador cambia cuando otra conexión confirma una escritura.
+
+Las peticiones de los demás workers llegan por la fecha de modificación de copias/solicitud. La
+copia se guarda comprimida en el almacén de copias (almacen_copias.py), que descarta las iguales a
+la anterior y aplica la retención, y se sube por SFTP ya comprimida. El resultado de la última
+ejecución queda en copias/estado.json (estado_copias()).
+"""
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: sin bloqueo entre procesos (desarrollo con un solo proceso)
+try:
+    import paramiko
+    SFTP_AVAILABLE = True
+except ImportError:
+    SFTP_AVAILABLE = False
+    print("[WARNING] paramiko no está instalado. SFTP no estará disponible.")
+
+from almacenamiento import directorio_persistente, escribir_json, leer_json
+from almacen_copias import DIRECTORIO, copiar_bd, marcar_subida, ruta_copia
+from copias_bd import ruta_sqlite
+
+ESTADO = 'estado.json'
+SOLICITUD = 'solicitud'
+BLOQUEO = 'planificador.lock'
+
+# BACKUP_AUTOMATICO=0 desactiva el planificador (solo se anotan las peticiones)
+AUTOMATICO = os.environ.get('BACKUP_AUTOMATICO', '1') != '0'
+INTERVALO_MINIMO = int(os.environ.get('BACKUP_INTERVALO_MINUTOS', '15')) * 60
+PERIODO = int(os.environ.get('BACKUP_PERIODO_HORAS', '24')) * 3600
+SONDEO = 30  # segundos entre revisiones de las peticiones de otros workers
+
+_lock = threading.Lock()
+_planificador = None
+_archivo_bloqueo = None
+_app = None  # aplicación del servidor web que pidió el planificador (para reintentar_planificador)
+
+def _fecha_modificacion(ruta):
+    try:
+        return os.path.getmtime(ruta)
+    except FileNotFoundError:
+        return 0.0
+
+def solicitar_copia():
+    """Pide una copia de seguridad; varias peticiones seguidas se agrupan en una sola copia"""
+    ruta = os.path.join(directorio_persistente(DIRECTORIO), SOLICITUD)
+    with open(ruta, 'a'):
+        pass
+    os.utime(ruta)
+    if _planificador is not None:
+        _planificador.despertar.set()
+
+def estado_copias():
+    """Resultado de la última ejecución del planificador y si hay una petición pendiente"""
+    directorio = directorio_persistente(DIRECTORIO)
+    estado = leer_json(os.path.join(directorio, ESTADO)) or {}
+    estado['pendiente'] = _fecha_modificacion(os.path.join(directorio, SOLICITUD)) > estado.get('solicitud_atendida', 0)
+    return estado
+
+def iniciar_planificador(app):
+    """Arranca el planificador en este proceso si está activado y ningún otro proceso lo tiene.
+
+    Devuelve True si el planificador corre en este proceso.
+    """
+    global _planificador, _archivo_bloqueo, _app
+    with _lock:
+        if _planificador is not None:
+            return True
+        if not AUTOMATICO:
+            return False
+        _app = app
+        with app.app_context():
+            if ruta_sqlite() is None:
+                print("[INFO] Backup automático solo disponible para SQLite")
+                return False
+            directorio = directorio_persistente(DIRECTORIO)
+        archivo = open(os.path.join(directorio, BLOQUEO), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Otro worker ya tiene el planificador
+                archivo.close()
+                return False
+        # El archivo queda abierto (y bloqueado) mientras viva el proceso
+        _archivo_bloqueo = archivo
+        _planificador = Planificador(app, directorio)
+        threading.Thread(target=_planificador.bucle, name='copias', daemon=True).start()
+        print("[INFO] Planificador de copias de seguridad iniciado en este proceso")
+        return True
+
+def reintentar_planificador():
+    """Vuelve a intentar coger el bloqueo del planificador si este proceso lo pidió al arrancar y no lo consiguió.
+
+    Si el worker que lo tenía muere, el bloqueo queda libre y otro worker lo coge en su siguiente
+    llamada (cada cierre de sesión). No hace nada en procesos que no son el servidor web.
+    """
+    if _app is not None and _planificador is None:
+        iniciar_planificador(_app)
+
+def reabrir_conexion():
+    """Tras sustituir la BD en este proceso: el planificador (si corre aquí) reabre su conexión y copia sin comparar"""
+    if _planificador is not None:
+        _planificador.reabrir = True
+
+class Planificador:
+    """Decide cuándo hacer una copia (revisar()) y la hace; el hilo del planificador llama a bucle()"""
+
+    def __init__(self, app, directorio):
+        self.app = app
+        self.directorio = directorio
+        self.despertar = threading.Event()
+        self.conexion = None
+        self.archivo_conexion = None  # (inodo, mtime) del archivo cuando se abrió la conexión
+        self.reabrir = False
+        self.version_copiada = None
+        estado = leer_json(os.path.join(directorio, ESTADO)) or {}
+        # Tras un reinicio se respeta el intervalo desde la última ejecución, pero la primera
+        # revisión siempre copia: data_version solo se puede comparar dentro de una misma conexión
+        self.ultima = estado.get('marca', 0.0)
+        self.atendida = estado.get('solicitud_atendida', 0.0)
+
+    def bucle(self):
+        while True:
+            self.despertar.wait(SONDEO)
+            self.despertar.clear()
+            try:
+                self.revisar()
+            except Exception:
+                traceback.print_exc()
+
+    def _version_datos(self):
+        """data_version de la conexión propia, o None si acaba de (re)abrirse y hay que copiar sin comparar"""
+        with self.app.app_context():
+            ruta = ruta_sqlite()
+        info = os.stat(ruta)
+        archivo = (info.st_ino, info.st_mtime_ns)
+        # Una importación cambia el archivo por otro (os.replace) y una restauración lo reescribe: la
+        # conexión seguiría en el archivo anterior y data_version ya no cambiaría nunca
+        if self.conexion is not None and (self.reabrir or archivo != self.archivo_conexion):
+            self.conexion.close()
+            self.conexion = None
+        if self.conexion is None:
+            self.reabrir = False
+            self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+            self.archivo_conexion = archivo
+            self.version_copiada = None
+        return self.conexion.execute('PRAGMA data_version').fetchone()[0]
+
+    def revisar(self, ahora=None):
+        """Hace la copia si toca; devuelve True si se ha ejecutado (aunque fuera sin cambios)"""
+        ahora = time.time() if ahora is None else ahora
+        solicitud = _fecha_modificacion(os.path.join(self.directorio, SOLICITUD))
+        if solicitud <= self.atendida and ahora - self.ultima < PERIODO:
+            return False
+        if ahora - self.ultima < INTERVALO_MINIMO:
+            return False
+        self.ultima = ahora
+
+        estado = {'marca': ahora, 'ultima_ejecucion': datetime.now().isoformat(timespec='seconds')}
+        try:
+            version = self._version_datos()
+            if version == self.version_copiada:
+                estado.update(resultado='sin cambios', mensaje='Los datos no han cambiado desde la última copia')
+            else:
+                estado.update(self._copiar())
+                self.version_copiada = version
+        except Exception as e:
+            # La petición sigue pendiente: se reintenta pasado INTERVALO_MINIMO
+            traceback.print_exc()
+            estado.update(resultado='error', mensaje=f'Error al crear el backup: {e}')
+        else:
+            self.atendida = max(solicitud, self.atendida)
+        estado['solicitud_atendida'] = self.atendida
+        anterior = leer_json(os.path.join(self.directorio, ESTADO)) or {}
+        estado['ultima_copia'] = estado.get('archivo') or anterior.get('ultima_copia')
+        escribir_json(os.path.join(self.directorio, ESTADO), estado)
+        return True
+
+    def _copiar(self):
+        with self.app.app_context():
+            entrada, nueva = copiar_bd()
+            if not nueva:
+                return {'resultado': 'sin cambios', 'archivo': entrada['archivo'],
+                        'mensaje': 'La copia es igual a la anterior: no se guarda otra'}
+            print(f"[OK] Backup creado: {entrada['archivo']}")
+            subido = subir_backup_ftp(ruta_copia(entrada))
+            if subido:
+                marcar_subida(entrada['archivo'])
+        return {'resultado': 'ok', 'archivo': entrada['archivo'], 'subido': subido,
+                'mensaje': 'Backup creado y subido por SFTP' if subido else 'Backup guardado solo en el disco persistente'}
+
+def subir_backup_ftp(ruta):
+    """Sube el archivo de backup al servidor SFTP"""
+    try:
+        if not SFTP_AVAILABLE:
+            print("[ERROR] paramiko no está disponible. No se puede subir el backup.")
+            return False
+
+        # Obtener credenciales SFTP de variables de entorno
+        # Acepta tanto FTP_PASSWORD como FTP_PASS para compatibilidad
+        sftp_host = os.environ.get('FTP_HOST')
+        sftp_user = os.environ.get('FTP_USER')
+        sftp_password = os.environ.get('FTP_PASSWORD') or os.environ.get('FTP_PASS')
+        sftp_directory = os.environ.get('FTP_DIRECTORY', '/')
+
+        # Obtener puerto SFTP (por defecto 22)
+        sftp_port = int(os.environ.get('SFTP_PORT', '22'))
+
+        if not all([sftp_host, sftp_user, sftp_password]):
+            print(f"[INFO] Variables SFTP no configuradas completamente:")
+            print(f"  FTP_HOST: {'✓' if sftp_host else '✗'}")
+            print(f"  FTP_USER: {'✓' if sftp_user else '✗'}")
+            print(f"  FTP_PASSWORD/FTP_PASS: {'✓' if sftp_password else '✗'}")
+            print(f"  Saltando subida a SFTP")
+            return False
+
+        if not os.path.exists(ruta):
+            print(f"[ERROR] Archivo de backup no encontrado: {ruta}")
+            return False
+
+        # Conectar a SFTP
+        transport = paramiko.Transport((sftp_host, sftp_port))
+        transport.connect(username=sftp_user, password=sftp_password)
+        sftp = paramiko.SFTPClient.from_transport(transport)
+
+        # Cambiar al directorio si se especifica
+        if sftp_directory and sftp_directory != '/':
+            try:
+                sftp.chdir(sftp_directory)
+            except IOError:
+                # Intentar crear el directorio si no existe
+                try:
+                    # Crear directorios recursivamente si no existen
+                    dirs = sftp_directory.strip('/').split('/')
+                    current_path = ''
+                    for dir_name in dirs:
+                        if dir_name:
+                            current_path = current_path + '/' + dir_name if current_path else '/' + dir_name
+                            try:
+                                sftp.chdir(current_path)
+                            except IOError:
+                                sftp.mkdir(current_path)
+                                sftp.chdir(current_path)
+                except Exception as e:
+                    print(f"[WARNING] No se pudo crear/entrar al directorio {sftp_directory}: {e}")
+
+        # Subir archivo
+        remote_path = os.path.join(sftp_directory, os.path.basename(ruta)).replace('\\', '/')
+        sftp.put(ruta, remote_path)
+
+        sftp.close()
+        transport.close()
+        print(f"[OK] Backup subido a SFTP: {remote_path}")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] Error al subir backup a SFTP: {e}")
+        traceback.print_exc()
+        return False
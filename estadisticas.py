@@ -0,0 +1,99 @@
+"""
+Estadísticas del panel de la directiva
+
+Los contadores salen de una sola consulta agregada y las últimas actividades de un LIMIT sobre
+el índice de fechas. El resultado se guarda unos segundos en memoria; cualquier transacción que
+modifique socios, actividades o solicitudes lo invalida al hacer commit.
+"""
+import threading
+import time
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User, Actividad, SolicitudSocio
+
+TTL_SEGUNDOS = 30
+NUM_ACTIVIDADES = 5
+
+# Modelos cuyas escrituras cambian las estadísticas (las inscripciones actualizan Actividad.inscritos_count)
+MODELOS_OBSERVADOS = (User, Actividad, SolicitudSocio)
+
+_lock = threading.Lock()
+_cache = {}
+_generacion = 0  # Cambia en cada invalidación: no se guarda un cálculo que empezó antes de ella
+
+class ActividadResumen:
+    """Datos de una actividad que muestra el panel (no es un objeto de la sesión, se puede cachear)"""
+    __slots__ = ('id', 'nombre', 'fecha', 'aforo_maximo', 'inscritos_count')
+
+    def __init__(self, fila):
+        self.id = fila.id
+        self.nombre = fila.nombre
+        self.fecha = fila.fecha
+        self.aforo_maximo = fila.aforo_maximo
+        self.inscritos_count = fila.inscritos_count or 0
+
+def _calcular(num_actividades):
+    contadores = db.session.execute(db.select(
+        db.select(db.func.count(User.id)).where(User.rol == 'socio').scalar_subquery().label('total_socios'),
+        db.select(db.func.count(Actividad.id)).scalar_subquery().label('total_actividades'),
+        db.select(db.func.count(SolicitudSocio.id)).where(
+            SolicitudSocio.estado == 'por_confirmar'
+        ).scalar_subquery().label('solicitudes_pendientes'),
+    )).one()
+    actividades = db.session.execute(
+        db.select(Actividad.id, Actividad.nombre, Actividad.fecha, Actividad.aforo_maximo, Actividad.inscritos_count)
+        .order_by(Actividad.fecha.desc(), Actividad.id.desc())
+        .limit(num_actividades)
+    ).all()
+    return {
+        'total_socios': contadores.total_socios,
+        'total_actividades': contadores.total_actividades,
+        'solicitudes_pendientes': contadores.solicitudes_pendientes,
+        'actividades': tuple(ActividadResumen(fila) for fila in actividades),
+    }
+
+def estadisticas_dashboard(num_actividades=NUM_ACTIVIDADES):
+    """Devuelve los contadores del panel y las `num_actividades` actividades más recientes"""
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _cache.get(num_actividades)
+        if entrada and entrada[0] > ahora:
+            return entrada[1]
+        generacion = _generacion
+    datos = _calcular(num_actividades)
+    with _lock:
+        if generacion == _generacion:
+            _cache[num_actividades] = (ahora + TTL_SEGUNDOS, datos)
+    return datos
+
+def invalidar_estadisticas():
+    """Descarta las estadísticas guardadas; la siguiente visita al panel las recalcula"""
+    global _generacion
+    with _lock:
+        _generacion += 1
+        _cache.clear()
+
+# Las escrituras marcan la sesión y la invalidación se hace al confirmar la transacción,
+# así un rollback no tira la caché y nadie vuelve a cachear datos aún sin confirmar.
+@event.listens_for(Session, 'after_flush')
+def _marcar_flush(session, flush_context):
+    if any(isinstance(obj, MODELOS_OBSERVADOS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['estadisticas_modificadas'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _marcar_update_masivo(estado):
+    # INSERT/UPDATE/DELETE masivos (contadores de inscritos, importaciones) no pasan por el flush
+    if (estado.is_update or estado.is_delete or estado.is_insert) and any(mapper.class_ in MODELOS_OBSERVADOS for mapper in estado.all_mappers):
+        estado.session.info['estadisticas_modificadas'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_tras_commit(session):
+    if session.info.pop('estadisticas_modificadas', False):
+        invalidar_estadisticas()
+
+@event.listens_for(Session, 'after_rollback')
+def _olvidar_tras_rollback(session):
+    session.info.pop('estadisticas_modificadas', None)
@@ -0,0 +1,43 @@
+"""
+Script para exportar en un ZIP las hojas de inscritos de varias actividades
+
+Uso:
+    python exportar_inscritos.py hojas.zip 3 7 12                              # actividades indicadas
+    python exportar_inscritos.py hojas.zip --desde 2026-06-05 --hasta 2026-06-07   # por rango de fechas (incluidas)
+    python exportar_inscritos.py hojas.zip --desde 2026-06-05 --procesos 4
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from app import create_app
+from hojas_inscritos import cargar_hojas, zip_hojas
+
+def fecha(texto):
+    return datetime.strptime(texto, '%Y-%m-%d')
+
+def exportar(destino, actividad_ids=None, desde=None, hasta=None, procesos=None):
+    """Escribe el ZIP en `destino` y devuelve el número de hojas"""
+    app = create_app()
+
+    with app.app_context():
+        hojas = cargar_hojas(actividad_ids, desde, hasta + timedelta(days=1) if hasta else None)
+        if not hojas:
+            print("[INFO] No hay actividades con esos criterios")
+            return 0
+        with open(destino, 'wb') as salida:
+            for trozo in zip_hojas(hojas, procesos):
+                salida.write(trozo)
+        print(f"[SUCCESS] {len(hojas)} hoja(s) de inscritos exportadas a {destino}")
+        return len(hojas)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta en un ZIP las hojas de inscritos de varias actividades')
+    parser.add_argument('destino', help='archivo ZIP que se crea')
+    parser.add_argument('ids', nargs='*', type=int, help='ids de las actividades')
+    parser.add_argument('--desde', type=fecha, help='fecha inicial AAAA-MM-DD')
+    parser.add_argument('--hasta', type=fecha, help='fecha final AAAA-MM-DD (incluida)')
+    parser.add_argument('--procesos', type=int, help='procesos para generar los PDF (por defecto, uno por CPU)')
+    args = parser.parse_args()
+    if not (args.ids or args.desde or args.hasta):
+        parser.error('indica los ids de las actividades o un rango de fechas')
+    exportar(args.destino, args.ids, args.desde, args.hasta, args.procesos)
@@ -0,0 +1,129 @@
+"""
+Exportación en bloque de las hojas de inscritos: un ZIP con el PDF de cada actividad
+
+Las consultas se hacen todas antes de empezar: una para elegir las actividades, una para sus
+versiones y una (más la de sus inscripciones) para los datos de las hojas que no estén ya en la
+caché de PDF. Las hojas que faltan se maquetan en paralelo en un ProcessPoolExecutor (los procesos,
+sin fork, solo reciben datos simples y ejecutan ReportLab) y el ZIP se envía a trozos según van saliendo.
+"""
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from models import db, Actividad, Inscripcion
+from informes_pdf import pdf_inscritos, datos_actividad, datos_inscripcion
+from cache_pdf import leer_pdf, guardar_pdf
+from versiones import SOCIOS, version_actividad, leer_versiones, huella
+
+MAX_ACTIVIDADES = 100
+# Sin fork: el worker ya tiene otros hilos (importaciones, copias, peticiones) y un hijo creado con
+# fork podría quedarse bloqueado en un lock que otro hilo tenía al hacer la copia del proceso
+ARRANQUE = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def partes_hoja(actividad_id, versiones):
+    """Partes del ETag y de la versión guardada de la hoja de inscritos de una actividad"""
+    return ('admin.inscritos_pdf', actividad_id, versiones[version_actividad(actividad_id)], versiones[SOCIOS])
+
+def versiones_hojas(*actividad_ids):
+    """Versiones que usan las hojas de inscritos de las actividades indicadas (una consulta)"""
+    return leer_versiones(*(version_actividad(actividad_id) for actividad_id in actividad_ids), SOCIOS)
+
+class HojaInscritos:
+    """Hoja de inscritos de una actividad: o el PDF guardado (`archivo`) o los datos para generarlo (`datos`)"""
+    __slots__ = ('actividad_id', 'nombre_archivo', 'clave', 'version', 'archivo', 'datos')
+
+    def __init__(self, actividad_id, nombre, fecha, versiones):
+        self.actividad_id = actividad_id
+        nombre = nombre.replace(' ', '_').replace('/', '-')
+        self.nombre_archivo = f"inscritos_{fecha.strftime('%Y%m%d')}_{actividad_id}_{nombre}.pdf"
+        self.clave = f'inscritos_{actividad_id}'
+        self.version = huella(*partes_hoja(actividad_id, versiones))
+        self.archivo = leer_pdf(self.clave, self.version)
+        self.datos = None
+
+def cargar_hojas(actividad_ids=None, desde=None, hasta=None):
+    """Prepara las hojas de las actividades indicadas y/o con fecha en [desde, hasta), por fecha.
+
+    Lanza ValueError si son más de MAX_ACTIVIDADES.
+    """
+    consulta = db.select(Actividad.id, Actividad.nombre, Actividad.fecha).order_by(Actividad.fecha, Actividad.id)
+    if actividad_ids:
+        consulta = consulta.where(Actividad.id.in_(actividad_ids))
+    if desde:
+        consulta = consulta.where(Actividad.fecha >= desde)
+    if hasta:
+        consulta = consulta.where(Actividad.fecha < hasta)
+    actividades = db.session.execute(consulta.limit(MAX_ACTIVIDADES + 1)).all()
+    if len(actividades) > MAX_ACTIVIDADES:
+        raise ValueError(f'Como máximo se pueden exportar {MAX_ACTIVIDADES} actividades a la vez')
+
+    # Versiones antes que los datos: una hoja nunca se guarda con una versión más nueva que su contenido
+    versiones = versiones_hojas(*(actividad_id for actividad_id, _, _ in actividades))
+    hojas = [HojaInscritos(actividad_id, nombre, fecha, versiones) for actividad_id, nombre, fecha in actividades]
+
+    pendientes = {hoja.actividad_id: hoja for hoja in hojas if hoja.archivo is None}
+    if pendientes:
+        ahora = datetime.utcnow()
+        cargadas = Actividad.query.options(
+            db.selectinload(Actividad.inscripciones).joinedload(Inscripcion.usuario),
+            db.selectinload(Actividad.inscripciones).joinedload(Inscripcion.beneficiario),
+        ).filter(Actividad.id.in_(pendientes))
+        for actividad in cargadas:
+            inscripciones = sorted(actividad.inscripciones, key=lambda inscripcion: inscripcion.fecha_inscripcion)
+            pendientes[actividad.id].datos = (
+                datos_actividad(actividad), [datos_inscripcion(inscripcion) for inscripcion in inscripciones], ahora
+            )
+    # Una actividad borrada entre las dos consultas se queda sin hoja
+    return [hoja for hoja in hojas if hoja.archivo is not None or hoja.datos is not None]
+
+def _pdfs(hojas, procesos):
+    """(hoja, contenido) de cada hoja: primero las guardadas y luego las generadas según terminan"""
+    pendientes = []
+    for hoja in hojas:
+        if hoja.archivo is None:
+            pendientes.append(hoja)
+            continue
+        with hoja.archivo:
+            yield hoja, hoja.archivo.read()
+
+    if len(pendientes) == 1:
+        # Para una sola hoja no compensa arrancar procesos
+        yield pendientes[0], pdf_inscritos(*pendientes[0].datos)
+    elif pendientes:
+        procesos = min(len(pendientes), procesos or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context(ARRANQUE)) as pool:
+            futuros = {pool.submit(pdf_inscritos, *hoja.datos): hoja for hoja in pendientes}
+            for futuro in as_completed(futuros):
+                yield futuros[futuro], futuro.result()
+
+class _Salida:
+    """Destino del ZipFile que acumula lo escrito hasta que se entrega (no admite seek)"""
+
+    def __init__(self):
+        self.trozos = []
+
+    def write(self, datos):
+        self.trozos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.trozos)
+        self.trozos.clear()
+        return datos
+
+def zip_hojas(hojas, procesos=None):
+    """Genera el ZIP con las hojas a trozos (bytes); las hojas generadas se guardan en la caché"""
+    salida = _Salida()
+    # Los PDF ya van comprimidos por dentro: se guardan en el ZIP sin volver a comprimir
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+        for hoja, contenido in _pdfs(hojas, procesos):
+            if hoja.archivo is None:
+                guardar_pdf(hoja.clave, hoja.version, contenido).close()
+            archivo_zip.writestr(hoja.nombre_archivo, contenido)
+            yield salida.vaciar()
+    yield salida.vaciar()
@@ -0,0 +1,363 @@
+"""
+Importación en bloque de una exportación completa (ver volcado_datos.py)
+
+Las claves que ya existen (nombres de usuario, números de socio y de beneficiario) se cargan una
+vez por tabla; cada registro se valida en memoria contra esos conjuntos y los aceptados se
+insertan por lotes con un insert() executemany (con RETURNING cuando hacen falta los ids nuevos).
+Los ids de la exportación se traducen a los de la BD con un diccionario por tabla, así los
+beneficiarios, inscripciones y listas de espera quedan unidos a su socio y actividad aunque
+cambien los ids.
+Los registros rechazados se cuentan por tabla con unos pocos ejemplos del motivo.
+"""
+from datetime import datetime
+
+from models import (db, User, Actividad, Inscripcion, Beneficiario, SolicitudSocio, BeneficiarioSolicitud,
+                    ListaEspera, recalcular_inscritos, reiniciar_contadores)
+from normalizacion import normalizar
+from versiones import subir_todas_las_versiones
+
+LOTE = 500
+MAX_EJEMPLOS = 5
+
+class ResultadoTabla:
+    """Registros importados y rechazados de una tabla, con algunos motivos de rechazo de ejemplo"""
+    __slots__ = ('procesados', 'importados', 'rechazados', 'motivos')
+
+    def __init__(self):
+        self.procesados = 0
+        self.importados = 0
+        self.rechazados = 0
+        self.motivos = []
+
+    def rechazar(self, motivo):
+        self.rechazados += 1
+        if len(self.motivos) < MAX_EJEMPLOS:
+            self.motivos.append(motivo)
+
+def _fecha_hora(valor, defecto=None):
+    return datetime.fromisoformat(valor) if valor else defecto
+
+def _fecha(valor):
+    return datetime.fromisoformat(valor).date() if valor else None
+
+def _obligatorios(modelo):
+    """Columnas NOT NULL sin valor por defecto: un None en una de ellas haría fallar todo el lote"""
+    return [columna.name for columna in modelo.__table__.columns
+            if not columna.nullable and not columna.primary_key
+            and columna.default is None and columna.server_default is None]
+
+class _Insercion:
+    """Acumula filas de un modelo y las inserta por lotes; `mapa` traduce id de la exportación -> id nuevo"""
+
+    def __init__(self, modelo, resultado, con_ids=False):
+        self.modelo = modelo
+        self.resultado = resultado
+        self.obligatorios = _obligatorios(modelo)
+        self.con_ids = con_ids
+        self.mapa = {}
+        self.pendientes = []
+
+    def anadir(self, id_original, valores, descripcion):
+        """Añade la fila al lote; False si se rechaza por dejar vacía una columna obligatoria"""
+        faltan = [columna for columna in self.obligatorios if valores.get(columna) is None]
+        if faltan:
+            self.resultado.rechazar(f"{descripcion}: falta {', '.join(faltan)}")
+            return False
+        self.pendientes.append((id_original, valores))
+        if len(self.pendientes) >= LOTE:
+            self.vaciar()
+        return True
+
+    def vaciar(self):
+        if not self.pendientes:
+            return
+        filas = [valores for _, valores in self.pendientes]
+        if self.con_ids:
+            insercion = db.insert(self.modelo).returning(self.modelo.id, sort_by_parameter_order=True)
+            nuevos = db.session.execute(insercion, filas).scalars().all()
+            self.mapa.update(zip((id_original for id_original, _ in self.pendientes), nuevos))
+        else:
+            db.session.execute(db.insert(self.modelo), filas)
+        self.resultado.importados += len(filas)
+        self.pendientes = []
+
+def _motivo(error):
+    return f'falta el campo {error}' if isinstance(error, KeyError) else str(error)
+
+def vaciar_bd():
+    """Borra todos los datos importables, hijos antes que padres; no hace commit"""
+    for modelo in (ListaEspera, Inscripcion, Beneficiario, BeneficiarioSolicitud, SolicitudSocio, Actividad, User):
+        db.session.execute(db.delete(modelo), execution_options={'synchronize_session': False})
+
+def _importar_usuarios(registros, limpiar, resultado):
+    # Claves existentes: una consulta por columna única
+    existentes = {} if limpiar else dict(db.session.execute(db.select(User.nombre_usuario, User.id)).all())
+    numeros = set() if limpiar else set(db.session.scalars(db.select(User.numero_socio).where(User.numero_socio.isnot(None))))
+    insercion = _Insercion(User, resultado, con_ids=True)
+    vistos = set()
+    for registro in registros:
+        # Compatibilidad con datos antiguos que usan 'email'
+        nombre_usuario = registro.get('nombre_usuario') or registro.get('email')
+        if not nombre_usuario:
+            resultado.rechazar('usuario sin nombre_usuario')
+            continue
+        if nombre_usuario in existentes:
+            # Sus beneficiarios e inscripciones se asocian al usuario que ya existe
+            insercion.mapa[registro.get('id')] = existentes[nombre_usuario]
+            resultado.rechazar(f'{nombre_usuario}: ya existe')
+            continue
+        if nombre_usuario in vistos:
+            resultado.rechazar(f'{nombre_usuario}: repetido en el archivo')
+            continue
+        numero_socio = registro.get('numero_socio')
+        if numero_socio and numero_socio in numeros:
+            resultado.rechazar(f'{nombre_usuario}: el número de socio {numero_socio} ya existe')
+            continue
+        try:
+            valores = {
+                'nombre': registro['nombre'],
+                'nombre_usuario': nombre_usuario,
+                'password_hash': registro['password_hash'],
+                'password_plain': registro.get('password_plain'),
+                'rol': registro['rol'],
+                'fecha_alta': _fecha_hora(registro.get('fecha_alta'), datetime.utcnow()),
+                'fecha_validez': _fecha_hora(registro.get('fecha_validez'), datetime.utcnow()),
+                'ano_nacimiento': registro.get('ano_nacimiento'),
+                'fecha_nacimiento': _fecha(registro.get('fecha_nacimiento')),
+                'numero_socio': numero_socio,
+                'calle': registro.get('calle'),
+                'numero': registro.get('numero'),
+                'piso': registro.get('piso'),
+                'poblacion': registro.get('poblacion'),
+                # El INSERT masivo no pasa por los eventos del modelo
+                'nombre_norm': normalizar(registro['nombre']),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            resultado.rechazar(f'{nombre_usuario}: {_motivo(e)}')
+            continue
+        if insercion.anadir(registro.get('id'), valores, nombre_usuario):
+            vistos.add(nombre_usuario)
+            numeros.add(numero_socio)
+    insercion.vaciar()
+    return insercion.mapa
+
+def _importar_actividades(registros, resultado):
+    insercion = _Insercion(Actividad, resultado, con_ids=True)
+    for registro in registros:
+        nombre = registro.get('nombre', 'desconocida')
+        try:
+            valores = {
+                'nombre': registro['nombre'],
+                'descripcion': registro.get('descripcion'),
+                'fecha': _fecha_hora(registro.get('fecha'), datetime.utcnow()),
+                'aforo_maximo': registro['aforo_maximo'],
+                'edad_minima': registro.get('edad_minima'),
+                'edad_maxima': registro.get('edad_maxima'),
+                'fecha_creacion': _fecha_hora(registro.get('fecha_creacion'), datetime.utcnow()),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            resultado.rechazar(f'{nombre}: {_motivo(e)}')
+            continue
+        insercion.anadir(registro.get('id'), valores, nombre)
+    insercion.vaciar()
+    return insercion.mapa
+
+def _importar_beneficiarios(registros, limpiar, usuarios, resultado):
+    numeros = set() if limpiar else set(db.session.scalars(
+        db.select(Beneficiario.numero_beneficiario).where(Beneficiario.numero_beneficiario.isnot(None))
+    ))
+    insercion = _Insercion(Beneficiario, resultado, con_ids=True)
+    for registro in registros:
+        nombre = f"{registro.get('nombre', '')} {registro.get('primer_apellido', '')}".strip() or 'desconocido'
+        socio_id = usuarios.get(registro.get('socio_id'))
+        if socio_id is None:
+            resultado.rechazar(f'{nombre}: su socio no está en la importación')
+            continue
+        numero_beneficiario = registro.get('numero_beneficiario')
+        if numero_beneficiario and numero_beneficiario in numeros:
+            resultado.rechazar(f'{nombre}: el número de beneficiario {numero_beneficiario} ya existe')
+            continue
+        try:
+            valores = {
+                'socio_id': socio_id,
+                'nombre': registro['nombre'],
+                'primer_apellido': registro['primer_apellido'],
+                'segundo_apellido': registro.get('segundo_apellido'),
+                'ano_nacimiento': registro['ano_nacimiento'],
+                'fecha_validez': _fecha_hora(registro.get('fecha_validez'), datetime.utcnow()),
+                'numero_beneficiario': numero_beneficiario,
+                'nombre_norm': normalizar(registro['nombre'], registro['primer_apellido'], registro.get('segundo_apellido')),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            resultado.rechazar(f'{nombre}: {_motivo(e)}')
+            continue
+        if insercion.anadir(registro.get('id'), valores, nombre):
+            numeros.add(numero_beneficiario)
+    insercion.vaciar()
+    return insercion.mapa
+
+def _importar_inscripciones(registros, usuarios, actividades, beneficiarios, resultado):
+    insercion = _Insercion(Inscripcion, resultado)
+    vistas = set()
+    for registro in registros:
+        descripcion = f"inscripción {registro.get('id', '')}".strip()
+        user_id = usuarios.get(registro.get('user_id'))
+        actividad_id = actividades.get(registro.get('actividad_id'))
+        beneficiario_id = beneficiarios.get(registro['beneficiario_id']) if registro.get('beneficiario_id') else None
+        if user_id is None or actividad_id is None or (registro.get('beneficiario_id') and beneficiario_id is None):
+            resultado.rechazar(f'{descripcion}: su socio, actividad o beneficiario no está en la importación')
+            continue
+        clave = (user_id, actividad_id, beneficiario_id)
+        if clave in vistas:
+            resultado.rechazar(f'{descripcion}: repetida')
+            continue
+        try:
+            valores = {
+                'user_id': user_id,
+                'actividad_id': actividad_id,
+                'beneficiario_id': beneficiario_id,
+                'fecha_inscripcion': _fecha_hora(registro.get('fecha_inscripcion'), datetime.utcnow()),
+                'asiste': bool(registro.get('asiste', False)),
+            }
+        except (TypeError, ValueError) as e:
+            resultado.rechazar(f'{descripcion}: {_motivo(e)}')
+            continue
+        if insercion.anadir(registro.get('id'), valores, descripcion):
+            vistas.add(clave)
+    insercion.vaciar()
+
+def _importar_lista_espera(registros, limpiar, usuarios, actividades, beneficiarios, resultado):
+    # Se insertan en el orden de la exportación (por id): los ids nuevos conservan el orden de llegada
+    insercion = _Insercion(ListaEspera, resultado)
+    vistas = set() if limpiar else set(db.session.execute(
+        db.select(ListaEspera.user_id, ListaEspera.actividad_id, ListaEspera.beneficiario_id)
+    ).all())
+    for registro in registros:
+        descripcion = f"lista de espera {registro.get('id', '')}".strip()
+        user_id = usuarios.get(registro.get('user_id'))
+        actividad_id = actividades.get(registro.get('actividad_id'))
+        beneficiario_id = beneficiarios.get(registro['beneficiario_id']) if registro.get('beneficiario_id') else None
+        if user_id is None or actividad_id is None or (registro.get('beneficiario_id') and beneficiario_id is None):
+            resultado.rechazar(f'{descripcion}: su socio, actividad o beneficiario no está en la importación')
+            continue
+        clave = (user_id, actividad_id, beneficiario_id)
+        if clave in vistas:
+            resultado.rechazar(f'{descripcion}: repetida')
+            continue
+        try:
+            valores = {
+                'user_id': user_id,
+                'actividad_id': actividad_id,
+                'beneficiario_id': beneficiario_id,
+                'fecha_alta': _fecha_hora(registro.get('fecha_alta'), datetime.utcnow()),
+            }
+        except (TypeError, ValueError) as e:
+            resultado.rechazar(f'{descripcion}: {_motivo(e)}')
+            continue
+        if insercion.anadir(registro.get('id'), valores, descripcion):
+            vistas.add(clave)
+    insercion.vaciar()
+
+def _importar_solicitudes(registros, resultado):
+    insercion = _Insercion(SolicitudSocio, resultado, con_ids=True)
+    for registro in registros:
+        nombre = f"{registro.get('nombre', '')} {registro.get('primer_apellido', '')}".strip() or 'desconocida'
+        try:
+            valores = {
+                'nombre': registro['nombre'],
+                'primer_apellido': registro['primer_apellido'],
+                'segundo_apellido': registro.get('segundo_apellido'),
+                'movil': registro['movil'],
+                'movil2': registro.get('movil2'),
+                'fecha_nacimiento': _fecha(registro.get('fecha_nacimiento')),
+                'miembros_unidad_familiar': registro['miembros_unidad_familiar'],
+                'forma_de_pago': registro['forma_de_pago'],
+                'estado': registro['estado'],
+                'fecha_solicitud': _fecha_hora(registro.get('fecha_solicitud'), datetime.utcnow()),
+                'fecha_confirmacion': _fecha_hora(registro.get('fecha_confirmacion')),
+                'password_solicitud': registro.get('password_solicitud'),
+                'calle': registro.get('calle'),
+                'numero': registro.get('numero'),
+                'piso': registro.get('piso'),
+                'poblacion': registro.get('poblacion'),
+                'nombre_norm': normalizar(registro['nombre'], registro['primer_apellido'], registro.get('segundo_apellido')),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            resultado.rechazar(f'{nombre}: {_motivo(e)}')
+            continue
+        insercion.anadir(registro.get('id'), valores, nombre)
+    insercion.vaciar()
+    return insercion.mapa
+
+def _importar_beneficiarios_solicitud(registros, solicitudes, resultado):
+    insercion = _Insercion(BeneficiarioSolicitud, resultado)
+    for registro in registros:
+        nombre = f"{registro.get('nombre', '')} {registro.get('primer_apellido', '')}".strip() or 'desconocido'
+        solicitud_id = solicitudes.get(registro.get('solicitud_id'))
+        if solicitud_id is None:
+            resultado.rechazar(f'{nombre}: su solicitud no está en la importación')
+            continue
+        try:
+            valores = {
+                'solicitud_id': solicitud_id,
+                'nombre': registro['nombre'],
+                'primer_apellido': registro['primer_apellido'],
+                'segundo_apellido': registro.get('segundo_apellido'),
+                'ano_nacimiento': registro['ano_nacimiento'],
+            }
+        except KeyError as e:
+            resultado.rechazar(f'{nombre}: {_motivo(e)}')
+            continue
+        insercion.anadir(registro.get('id'), valores, nombre)
+    insercion.vaciar()
+
+def _contar(registros, tabla, resultado, progreso):
+    """Recorre `registros` contando los procesados y llamando a progreso(tabla, resultado) cada LOTE y al final"""
+    for registro in registros:
+        yield registro
+        resultado.procesados += 1
+        if progreso and resultado.procesados % LOTE == 0:
+            progreso(tabla, resultado)
+    if progreso:
+        progreso(tabla, resultado)
+
+def importar_volcado(datos, limpiar=False, progreso=None):
+    """Importa el diccionario de leer_datos() en la transacción actual; no hace commit.
+
+    `datos` puede dar cualquier iterable por tabla (se recorre una sola vez), por ejemplo un generador
+    que lea del disco. Con `limpiar` se borran antes todos los datos. progreso(tabla, ResultadoTabla)
+    se llama cada LOTE registros y al terminar cada tabla. Devuelve {tabla: ResultadoTabla} en orden
+    de importación.
+    """
+    resultados = {tabla: ResultadoTabla() for tabla in ('usuarios', 'actividades', 'beneficiarios', 'inscripciones',
+                                                         'lista_espera', 'solicitudes_socio', 'beneficiarios_solicitud')}
+
+    def registros(tabla):
+        return _contar(datos.get(tabla, ()), tabla, resultados[tabla], progreso)
+
+    if limpiar:
+        vaciar_bd()
+
+    usuarios = _importar_usuarios(registros('usuarios'), limpiar, resultados['usuarios'])
+    actividades = _importar_actividades(registros('actividades'), resultados['actividades'])
+    beneficiarios = _importar_beneficiarios(registros('beneficiarios'), limpiar, usuarios, resultados['beneficiarios'])
+    _importar_inscripciones(registros('inscripciones'), usuarios, actividades, beneficiarios, resultados['inscripciones'])
+    _importar_lista_espera(registros('lista_espera'), limpiar, usuarios, actividades, beneficiarios, resultados['lista_espera'])
+    solicitudes = _importar_solicitudes(registros('solicitudes_socio'), resultados['solicitudes_socio'])
+    _importar_beneficiarios_solicitud(registros('beneficiarios_solicitud'), solicitudes, resultados['beneficiarios_solicitud'])
+
+    # Contadores de inscritos de las actividades nuevas, números desde los datos y versiones (cachés, ETag)
+    recalcular_inscritos(actividades.values())
+    reiniciar_contadores()
+    subir_todas_las_versiones()
+    return resultados
+
+def resumen_rechazos(resultados):
+    """Texto con los registros rechazados por tabla y unos ejemplos; '' si no hubo"""
+    partes = []
+    for tabla, resultado in resultados.items():
+        if resultado.rechazados:
+            ejemplos = '; '.join(resultado.motivos)
+            mas = ', ...' if resultado.rechazados > len(resultado.motivos) else ''
+            partes.append(f'{tabla}: {resultado.rechazados} ({ejemplos}{mas})')
+    return ' | '.join(partes)
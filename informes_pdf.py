@@ -0,0 +1,192 @@
+"""
+Generación con ReportLab de los PDF de la directiva (listado de actividades y hoja de inscritos)
+
+Las funciones reciben datos simples (diccionarios y tuplas, no objetos de la sesión), así que
+pueden ejecutarse fuera de la petición. Los estilos se crean una sola vez por proceso.
+"""
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+@lru_cache(maxsize=None)
+def _estilos():
+    """Estilos de párrafo comunes (getSampleStyleSheet() es caro: se construye una vez)"""
+    styles = getSampleStyleSheet()
+    return {
+        'titulo': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#333333'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        'fecha': ParagraphStyle('Fecha', parent=styles['Normal'],
+                                fontSize=10, textColor=colors.grey,
+                                alignment=TA_CENTER),
+        'normal': styles['Normal'],
+        'encabezado': styles['Heading2'],
+    }
+
+def _construir(story):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            rightMargin=2*cm, leftMargin=2*cm,
+                            topMargin=2*cm, bottomMargin=2*cm)
+    doc.build(story)
+    return buffer.getvalue()
+
+def _cabecera(titulo, ahora):
+    estilos = _estilos()
+    return [
+        Paragraph(titulo, estilos['titulo']),
+        Paragraph(f"Generado el {ahora.strftime('%d/%m/%Y a las %H:%M')}", estilos['fecha']),
+        Spacer(1, 0.5*cm),
+    ]
+
+def datos_actividad(actividad):
+    """Datos de una actividad que usan los PDF"""
+    return {
+        'id': actividad.id,
+        'nombre': actividad.nombre,
+        'descripcion': actividad.descripcion,
+        'fecha': actividad.fecha,
+        'aforo_maximo': actividad.aforo_maximo,
+        'inscritos': actividad.numero_inscritos(),
+    }
+
+def datos_inscripcion(inscripcion):
+    """(nombre, nombre de usuario a mostrar, fecha de inscripción, asiste) de una inscripción"""
+    if inscripcion.beneficiario:
+        nombre_completo = f"{inscripcion.beneficiario.nombre} {inscripcion.beneficiario.primer_apellido}"
+        nombre_usuario_mostrar = f"Beneficiario de {inscripcion.usuario.nombre}"
+    else:
+        nombre_completo = inscripcion.usuario.nombre
+        nombre_usuario_mostrar = inscripcion.usuario.nombre_usuario
+    return (nombre_completo, nombre_usuario_mostrar, inscripcion.fecha_inscripcion, inscripcion.asiste)
+
+def pdf_actividades(actividades, ahora):
+    """PDF con el listado de actividades (lista de datos_actividad())"""
+    normal_style = _estilos()['normal']
+    story = _cabecera("Listado de Actividades", ahora)
+
+    # Información
+    story.append(Paragraph(f"<b>Total de actividades:</b> {len(actividades)}", normal_style))
+    story.append(Spacer(1, 0.3*cm))
+
+    # Tabla de actividades
+    if actividades:
+        data = [['Actividad', 'Fecha', 'Inscritos', 'Estado']]
+
+        for actividad in actividades:
+            estado = "Próxima" if actividad['fecha'] > ahora else "Pasada"
+            fecha_str = f"{actividad['fecha'].strftime('%d/%m/%Y')}<br/>{actividad['fecha'].strftime('%H:%M')}"
+            inscritos_str = f"{actividad['inscritos']}/{actividad['aforo_maximo']}"
+
+            descripcion = actividad['descripcion'] or ""
+            if len(descripcion) > 50:
+                descripcion = descripcion[:50] + "..."
+            nombre_completo = f"<b>{actividad['nombre']}</b>"
+            if descripcion:
+                nombre_completo += f"<br/><i>{descripcion}</i>"
+
+            data.append([
+                Paragraph(nombre_completo, normal_style),
+                Paragraph(fecha_str, normal_style),
+                Paragraph(inscritos_str, normal_style),
+                Paragraph(estado, normal_style)
+            ])
+
+        table = Table(data, colWidths=[7*cm, 3*cm, 3*cm, 3*cm])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#333333')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+        ]))
+        story.append(table)
+    else:
+        story.append(Paragraph("No hay actividades registradas.", normal_style))
+
+    return _construir(story)
+
+def pdf_inscritos(actividad, inscripciones, ahora):
+    """Hoja de inscritos de una actividad (datos_actividad() y lista de datos_inscripcion())"""
+    estilos = _estilos()
+    normal_style = estilos['normal']
+    story = _cabecera("Listado de Inscritos", ahora)
+
+    # Información de la actividad
+    story.append(Paragraph(f"<b>{actividad['nombre']}</b>", estilos['encabezado']))
+    if actividad['descripcion']:
+        story.append(Paragraph(f"<i>{actividad['descripcion']}</i>", normal_style))
+    story.append(Paragraph(f"<b>Fecha:</b> {actividad['fecha'].strftime('%d/%m/%Y a las %H:%M')}", normal_style))
+    story.append(Paragraph(f"<b>Aforo máximo:</b> {actividad['aforo_maximo']} personas", normal_style))
+    story.append(Spacer(1, 0.3*cm))
+
+    # Estadísticas
+    asistentes = sum(1 for inscripcion in inscripciones if inscripcion[3])
+    no_asistentes = len(inscripciones) - asistentes
+    plazas_libres = actividad['aforo_maximo'] - actividad['inscritos']
+
+    stats_data = [
+        ['Total Inscritos', 'Asistieron', 'No Asistieron', 'Plazas Libres'],
+        [str(len(inscripciones)), str(asistentes), str(no_asistentes), str(plazas_libres)]
+    ]
+    stats_table = Table(stats_data, colWidths=[4*cm, 4*cm, 4*cm, 4*cm])
+    stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#333333')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, 1), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    story.append(stats_table)
+    story.append(Spacer(1, 0.5*cm))
+
+    # Tabla de inscritos
+    if inscripciones:
+        data = [['#', 'Nombre', 'Nombre de Usuario', 'Fecha de Inscripción', 'Asistencia']]
+
+        for idx, (nombre_completo, nombre_usuario_mostrar, fecha_inscripcion, asiste) in enumerate(inscripciones, 1):
+            data.append([
+                str(idx),
+                nombre_completo,
+                nombre_usuario_mostrar,
+                fecha_inscripcion.strftime('%d/%m/%Y %H:%M'),
+                "Asistió" if asiste else "No asistió"
+            ])
+
+        table = Table(data, colWidths=[1*cm, 5*cm, 5*cm, 4*cm, 3*cm])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#333333')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),  # Columna #
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+        ]))
+        story.append(table)
+    else:
+        story.append(Paragraph("No hay inscripciones para esta actividad.", normal_style))
+
+    return _construir(story)
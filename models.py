@@ -2,6 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from normalizacion import normalizar
 
 # Inicializar SQLAlchemy aquí
 db = SQLAlchemy()
@@ -24,10 +27,22 @@ class User(UserMixin, db.Model):
     numero = db.Column(db.String(20), nullable=True)
     piso = db.Column(db.String(20), nullable=True)  # Opcional
     poblacion = db.Column(db.String(100), nullable=True)
+    nombre_norm = db.Column(db.String(100), nullable=True)  # Nombre sin acentos en mayúsculas (normalizar), para buscar
     
     # Relaciones
     inscripciones = db.relationship('Inscripcion', backref='usuario', lazy=True, cascade='all, delete-orphan')
     
+    # Índices: socios por vencer (rol + fecha_validez), listado de socios ordenado por nombre
+    # y búsqueda por prefijo del nombre normalizado
+    __table_args__ = (
+        db.Index('ix_users_rol_fecha_validez', 'rol', 'fecha_validez'),
+        db.Index('ix_users_rol_nombre', 'rol', 'nombre', 'id'),
+        db.Index('ix_users_nombre_norm', 'nombre_norm', postgresql_ops={'nombre_norm': 'text_pattern_ops'}),
+    )
+    
+    def nombre_normalizado(self):
+        return normalizar(self.nombre)
+    
     def calcular_edad(self):
         """Calcula la edad del usuario basándose en el año de nacimiento"""
         if not self.ano_nacimiento:
@@ -74,21 +89,48 @@ class Actividad(db.Model):
     edad_minima = db.Column(db.Integer, nullable=True)  # Edad mínima requerida (None = sin restricción)
     edad_maxima = db.Column(db.Integer, nullable=True)  # Edad máxima permitida (None = sin restricción)
     fecha_creacion = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    inscritos_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Contador materializado de inscripciones
+    
+    # Índices: actividades próximas y listados ordenados por fecha
+    __table_args__ = (
+        db.Index('ix_actividades_fecha', 'fecha', 'id'),
+    )
     
     # Relaciones
     inscripciones = db.relationship('Inscripcion', backref='actividad', lazy=True, cascade='all, delete-orphan')
     
     def plazas_disponibles(self):
         """Calcula las plazas disponibles"""
-        return self.aforo_maximo - len(self.inscripciones)
+        return self.aforo_maximo - self.numero_inscritos()
     
     def tiene_plazas_disponibles(self):
         """Verifica si hay plazas disponibles"""
         return self.plazas_disponibles() > 0
     
     def numero_inscritos(self):
-        """Retorna el número de inscritos"""
-        return len(self.inscripciones)
+        """Retorna el número de inscritos (contador almacenado, sin cargar las inscripciones)"""
+        return self.inscritos_count or 0
+    
+    def reservar_plaza(self):
+        """Ocupa una plaza con un UPDATE condicional (inscritos_count < aforo_maximo); no hace commit.
+        
+        Devuelve False si la actividad está completa. La BD serializa los UPDATE sobre la fila
+        (bloqueo de escritura en SQLite, bloqueo de fila en PostgreSQL) y vuelve a evaluar la
+        condición, así que peticiones simultáneas nunca superan el aforo. El INSERT de la
+        inscripción debe ir en la misma transacción para que un rollback libere la plaza.
+        """
+        resultado = db.session.execute(
+            db.update(Actividad)
+            .where(Actividad.id == self.id, Actividad.inscritos_count < Actividad.aforo_maximo)
+            .values(inscritos_count=Actividad.inscritos_count + 1),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.expire(self, ['inscritos_count'])
+        return resultado.rowcount == 1
+    
+    def restar_inscrito(self):
+        """Decrementa el contador en la misma transacción que el DELETE de la inscripción"""
+        self.inscritos_count = Actividad.inscritos_count - 1
     
     def usuario_inscrito(self, user_id):
         """Verifica si un usuario está inscrito (sin beneficiario)"""
@@ -138,13 +180,147 @@ class Inscripcion(db.Model):
     beneficiario = db.relationship('Beneficiario', backref='inscripciones')
     
     # Restricción única: un usuario o beneficiario solo puede inscribirse una vez por actividad
-    __table_args__ = (db.UniqueConstraint('user_id', 'actividad_id', 'beneficiario_id', name='unique_inscripcion'),)
+    # (su índice también sirve para las búsquedas por user_id, que es su primera columna)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'actividad_id', 'beneficiario_id', name='unique_inscripcion'),
+        db.Index('ix_inscripciones_actividad_id', 'actividad_id', 'beneficiario_id'),
+        db.Index('ix_inscripciones_beneficiario_id', 'beneficiario_id'),
+    )
     
     def __repr__(self):
         if self.beneficiario_id:
             return f'<Inscripcion Beneficiario {self.beneficiario_id} - Actividad {self.actividad_id}>'
         return f'<Inscripcion User {self.user_id} - Actividad {self.actividad_id}>'
 
+def recalcular_inscritos(actividad_ids=None):
+    """Recalcula inscritos_count desde la tabla de inscripciones (todas o solo las indicadas).
+    
+    No hace commit: el llamador decide cuándo confirmar la transacción.
+    """
+    total = db.select(db.func.count(Inscripcion.id)).where(
+        Inscripcion.actividad_id == Actividad.id
+    ).scalar_subquery()
+    stmt = db.update(Actividad).values(inscritos_count=total)
+    if actividad_ids is not None:
+        actividad_ids = list(actividad_ids)
+        if not actividad_ids:
+            return 0
+        stmt = stmt.where(Actividad.id.in_(actividad_ids))
+    result = db.session.execute(stmt, execution_options={'synchronize_session': False})
+    db.session.expire_all()
+    return result.rowcount
+
+def indice_inscripciones(user_id, actividad_ids, beneficiario_ids=()):
+    """Devuelve un set de (actividad_id, beneficiario_id) con las inscripciones del socio y sus beneficiarios.
+    
+    beneficiario_id es None para la inscripción del propio socio. Una sola consulta para todas
+    las actividades, sustituye a usuario_inscrito()/beneficiario_inscrito() en los listados.
+    """
+    actividad_ids = list(actividad_ids)
+    if not actividad_ids:
+        return set()
+    condiciones = [db.and_(Inscripcion.user_id == user_id, Inscripcion.beneficiario_id.is_(None))]
+    beneficiario_ids = list(beneficiario_ids)
+    if beneficiario_ids:
+        condiciones.append(Inscripcion.beneficiario_id.in_(beneficiario_ids))
+    filas = db.session.query(Inscripcion.actividad_id, Inscripcion.beneficiario_id).filter(
+        Inscripcion.actividad_id.in_(actividad_ids),
+        db.or_(*condiciones)
+    ).all()
+    return {(fila.actividad_id, fila.beneficiario_id) for fila in filas}
+
+class ListaEspera(db.Model):
+    """Socio o beneficiario esperando plaza en una actividad completa (orden de llegada = id)"""
+    __tablename__ = 'lista_espera'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    actividad_id = db.Column(db.Integer, db.ForeignKey('actividades.id', ondelete='CASCADE'), nullable=False)
+    beneficiario_id = db.Column(db.Integer, db.ForeignKey('beneficiarios.id', ondelete='CASCADE'), nullable=True)  # None: el propio socio
+    fecha_alta = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Relaciones
+    usuario = db.relationship('User')
+    actividad = db.relationship('Actividad')
+    beneficiario = db.relationship('Beneficiario')
+    
+    # Índices: cola de cada actividad en orden de llegada y entradas de cada socio
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'actividad_id', 'beneficiario_id', name='unique_lista_espera'),
+        db.Index('ix_lista_espera_actividad', 'actividad_id', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<ListaEspera actividad={self.actividad_id} user={self.user_id} beneficiario={self.beneficiario_id}>'
+
+def posiciones_lista_espera(user_id, actividad_ids=None):
+    """Devuelve {(actividad_id, beneficiario_id): posición} de las entradas del socio y su familia.
+    
+    Una sola consulta: la posición es el número de entradas de la misma actividad con id <= el suyo.
+    """
+    anterior = db.aliased(ListaEspera)
+    posicion = db.select(db.func.count(anterior.id)).where(
+        anterior.actividad_id == ListaEspera.actividad_id,
+        anterior.id <= ListaEspera.id
+    ).scalar_subquery()
+    consulta = db.select(ListaEspera.actividad_id, ListaEspera.beneficiario_id, posicion.label('posicion')).where(
+        ListaEspera.user_id == user_id
+    )
+    if actividad_ids is not None:
+        actividad_ids = list(actividad_ids)
+        if not actividad_ids:
+            return {}
+        consulta = consulta.where(ListaEspera.actividad_id.in_(actividad_ids))
+    return {(fila.actividad_id, fila.beneficiario_id): fila.posicion for fila in db.session.execute(consulta)}
+
+def promover_lista_espera(actividad):
+    """Inscribe, por orden de llegada, a los que esperan plaza mientras queden plazas; no hace commit.
+    
+    Se llama en la misma transacción que libera la plaza (cancelación o aumento de aforo). Se salta
+    a quien ya no cumple la restricción de edad y descarta a quien ya estaba inscrito. Cada entrada
+    se reclama con un DELETE comprobando las filas afectadas, así dos cancelaciones simultáneas no
+    promueven a la misma persona. Devuelve las entradas promovidas.
+    """
+    db.session.flush()
+    promovidas = []
+    if actividad.fecha <= datetime.utcnow():
+        return promovidas
+    
+    entradas = ListaEspera.query.options(
+        db.joinedload(ListaEspera.usuario), db.joinedload(ListaEspera.beneficiario)
+    ).filter_by(actividad_id=actividad.id).order_by(ListaEspera.id).all()
+    
+    # Inscripciones de la actividad, en una sola consulta
+    inscritos = set(db.session.execute(
+        db.select(Inscripcion.user_id, Inscripcion.beneficiario_id).where(Inscripcion.actividad_id == actividad.id)
+    ).all())
+    
+    for entrada in entradas:
+        ya_inscrito = (entrada.user_id, entrada.beneficiario_id) in inscritos
+        if not ya_inscrito and actividad.tiene_restriccion_edad():
+            ano_nacimiento = entrada.beneficiario.ano_nacimiento if entrada.beneficiario else entrada.usuario.ano_nacimiento
+            if not actividad.puede_inscribirse_por_edad(ano_nacimiento)[0]:
+                continue
+        
+        if not ya_inscrito and not actividad.reservar_plaza():
+            break
+        reclamada = db.session.execute(
+            db.delete(ListaEspera).where(ListaEspera.id == entrada.id),
+            execution_options={'synchronize_session': False}
+        ).rowcount == 1
+        db.session.expunge(entrada)
+        if ya_inscrito:
+            continue
+        if not reclamada:
+            # Otra petición ya la promovió: devolver la plaza reservada
+            actividad.restar_inscrito()
+            db.session.flush()
+            continue
+        
+        db.session.add(Inscripcion(user_id=entrada.user_id, actividad_id=actividad.id, beneficiario_id=entrada.beneficiario_id))
+        promovidas.append(entrada)
+    return promovidas
+
 class SolicitudSocio(db.Model):
     __tablename__ = 'solicitudes_socio'
     
@@ -166,18 +342,62 @@ class SolicitudSocio(db.Model):
     numero = db.Column(db.String(20), nullable=False)
     piso = db.Column(db.String(20), nullable=True)  # Opcional
     poblacion = db.Column(db.String(100), nullable=False)
+    nombre_norm = db.Column(db.String(300), nullable=True)  # Nombre y apellidos normalizados, para buscar
     
     # Relaciones
     beneficiarios = db.relationship('BeneficiarioSolicitud', backref='solicitud', lazy=True, cascade='all, delete-orphan')
     
+    # Índices: solicitudes por estado ordenadas por fecha y búsqueda por prefijo del nombre
+    __table_args__ = (
+        db.Index('ix_solicitudes_socio_estado_fecha', 'estado', 'fecha_solicitud', 'id'),
+        db.Index('ix_solicitudes_socio_fecha', 'fecha_solicitud', 'id'),
+        db.Index('ix_solicitudes_socio_nombre_norm', 'nombre_norm', postgresql_ops={'nombre_norm': 'text_pattern_ops'}),
+    )
+    
+    def nombre_normalizado(self):
+        return normalizar(self.nombre, self.primer_apellido, self.segundo_apellido)
+    
     def __repr__(self):
         return f'<SolicitudSocio {self.nombre} {self.primer_apellido} - {self.estado}>'
 
+def nombre_usuario_base(solicitud):
+    """Nombre de usuario sin sufijo: nombre + iniciales de los dos apellidos + año de nacimiento"""
+    nombre_limpio = solicitud.nombre.lower().replace(' ', '').replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u').replace('ñ', 'n')
+    inicial_primer_apellido = solicitud.primer_apellido[0].lower() if solicitud.primer_apellido else ''
+    inicial_segundo_apellido = solicitud.segundo_apellido[0].lower() if solicitud.segundo_apellido else ''
+    ano_nacimiento = solicitud.fecha_nacimiento.year if solicitud.fecha_nacimiento else ''
+    return f"{nombre_limpio}{inicial_primer_apellido}{inicial_segundo_apellido}{ano_nacimiento}"
+
+def asignar_nombres_usuario(solicitudes):
+    """Devuelve un nombre de usuario libre para cada solicitud, en el mismo orden.
+    
+    Una sola consulta trae los nombres de usuario existentes que empiezan por alguno de los
+    nombres base; los sufijos (base, base1, base2...) se eligen en memoria. Dos solicitudes
+    con la misma base reciben nombres distintos, así sirve también para confirmar varias a la vez.
+    """
+    bases = [nombre_usuario_base(solicitud) for solicitud in solicitudes]
+    ocupados = set()
+    if bases:
+        ocupados.update(fila.nombre_usuario for fila in db.session.query(User.nombre_usuario).filter(
+            db.or_(*(User.nombre_usuario.startswith(base, autoescape=True) for base in set(bases)))
+        ))
+    
+    nombres = []
+    for base in bases:
+        nombre_usuario = base
+        contador = 1
+        while nombre_usuario in ocupados:
+            nombre_usuario = f"{base}{contador}"
+            contador += 1
+        ocupados.add(nombre_usuario)
+        nombres.append(nombre_usuario)
+    return nombres
+
 class BeneficiarioSolicitud(db.Model):
     __tablename__ = 'beneficiarios_solicitud'
     
     id = db.Column(db.Integer, primary_key=True)
-    solicitud_id = db.Column(db.Integer, db.ForeignKey('solicitudes_socio.id'), nullable=False)
+    solicitud_id = db.Column(db.Integer, db.ForeignKey('solicitudes_socio.id'), nullable=False, index=True)
     nombre = db.Column(db.String(100), nullable=False)
     primer_apellido = db.Column(db.String(100), nullable=False)
     segundo_apellido = db.Column(db.String(100), nullable=False)
@@ -197,9 +417,157 @@ class Beneficiario(db.Model):
     ano_nacimiento = db.Column(db.Integer, nullable=False)
     fecha_validez = db.Column(db.DateTime, nullable=False)  # Misma fecha que el socio
     numero_beneficiario = db.Column(db.String(15), unique=True, nullable=True)  # Número de beneficiario (0001-1, 0001-2, etc.)
+    nombre_norm = db.Column(db.String(300), nullable=True)  # Nombre y apellidos normalizados, para buscar
     
     # Relaciones
     socio = db.relationship('User', backref='beneficiarios')
     
+    # Índices: beneficiarios de un socio ordenados por nombre y búsqueda por prefijo del nombre
+    __table_args__ = (
+        db.Index('ix_beneficiarios_socio_nombre', 'socio_id', 'nombre'),
+        db.Index('ix_beneficiarios_nombre_norm', 'nombre_norm', postgresql_ops={'nombre_norm': 'text_pattern_ops'}),
+    )
+    
+    def nombre_normalizado(self):
+        return normalizar(self.nombre, self.primer_apellido, self.segundo_apellido)
+    
     def __repr__(self):
         return f'<Beneficiario {self.nombre} {self.primer_apellido}>'
+
+# Modelos con columna nombre_norm: se rellena al guardar, venga de donde venga el cambio
+MODELOS_CON_NOMBRE_NORM = (User, Beneficiario, SolicitudSocio)
+
+def _actualizar_nombre_norm(mapper, connection, objetivo):
+    objetivo.nombre_norm = objetivo.nombre_normalizado()
+
+for _modelo in MODELOS_CON_NOMBRE_NORM:
+    event.listen(_modelo, 'before_insert', _actualizar_nombre_norm)
+    event.listen(_modelo, 'before_update', _actualizar_nombre_norm)
+
+def rellenar_nombres_normalizados(lote=500):
+    """Calcula nombre_norm en las filas que no lo tienen, por lotes de `lote` filas.
+    
+    Hace commit tras cada lote para no mantener bloqueada la BD. Devuelve las filas actualizadas.
+    """
+    total = 0
+    for modelo in MODELOS_CON_NOMBRE_NORM:
+        ultimo_id = 0
+        while True:
+            filas = modelo.query.filter(
+                modelo.nombre_norm.is_(None), modelo.id > ultimo_id
+            ).order_by(modelo.id).limit(lote).all()
+            if not filas:
+                break
+            db.session.execute(db.update(modelo), [
+                {'id': fila.id, 'nombre_norm': fila.nombre_normalizado()} for fila in filas
+            ])
+            db.session.commit()
+            ultimo_id = filas[-1].id
+            total += len(filas)
+    return total
+
+class Contador(db.Model):
+    """Contador con nombre para repartir números correlativos (numero_socio, sufijos de numero_beneficiario)"""
+    __tablename__ = 'contadores'
+    
+    nombre = db.Column(db.String(50), primary_key=True)  # 'numero_socio', 'numero_beneficiario:<socio_id>' o una versión (versiones.py)
+    valor = db.Column(db.Integer, nullable=False, default=0)  # Último número entregado
+    
+    def __repr__(self):
+        return f'<Contador {self.nombre}={self.valor}>'
+
+CONTADOR_SOCIOS = 'numero_socio'
+
+def _contador_beneficiarios(socio_id):
+    return f'numero_beneficiario:{socio_id}'
+
+def _sufijo_numerico(numero):
+    """'0042-3' -> 3 (sufijo tras el último guion); None si no es un número"""
+    if not numero or '-' not in numero:
+        return None
+    parte = numero.rsplit('-', 1)[1]
+    return int(parte) if parte.isdigit() else None
+
+def _ultimo_numero_socio():
+    """Mayor numero_socio numérico existente (valor inicial del contador; solo se calcula una vez)"""
+    numeros = (fila.numero_socio.strip() for fila in db.session.query(User.numero_socio).filter(User.numero_socio.isnot(None)))
+    return max((int(n) for n in numeros if n.isdigit()), default=0)
+
+def _ultimo_numero_beneficiario(socio_id):
+    """Mayor sufijo de numero_beneficiario entre los beneficiarios del socio"""
+    numeros = (_sufijo_numerico(fila.numero_beneficiario) for fila in db.session.query(Beneficiario.numero_beneficiario).filter(
+        Beneficiario.socio_id == socio_id, Beneficiario.numero_beneficiario.isnot(None)))
+    return max((n for n in numeros if n is not None), default=0)
+
+def _incrementar_contador(nombre, cantidad, valor_inicial):
+    """Suma `cantidad` al contador con un UPDATE atómico y devuelve el nuevo valor; no hace commit.
+    
+    La BD serializa los UPDATE sobre la fila (bloqueo de escritura en SQLite, bloqueo de fila en
+    PostgreSQL), así que dos transacciones nunca reciben el mismo número. Si la fila aún no existe
+    se crea con valor_inicial() dentro de un SAVEPOINT; si otra petición la crea antes, se reintenta.
+    """
+    condicion = Contador.nombre == nombre
+    for _ in range(2):
+        actualizado = db.session.execute(
+            db.update(Contador).where(condicion).values(valor=Contador.valor + cantidad),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if actualizado:
+            return db.session.execute(db.select(Contador.valor).where(condicion)).scalar_one()
+        try:
+            with db.session.begin_nested():
+                db.session.add(Contador(nombre=nombre, valor=valor_inicial()))
+        except IntegrityError:
+            pass
+    raise RuntimeError(f'No se pudo inicializar el contador {nombre}')
+
+def asignar_numeros_socio(cantidad=1):
+    """Reserva `cantidad` números de socio consecutivos ('0001', '0002'...) con una sola escritura; no hace commit"""
+    ultimo = _incrementar_contador(CONTADOR_SOCIOS, cantidad, _ultimo_numero_socio)
+    return [f"{numero:04d}" for numero in range(ultimo - cantidad + 1, ultimo + 1)]
+
+def asignar_numeros_beneficiario(socio, cantidad=1):
+    """Reserva `cantidad` números de beneficiario del socio ('0001-1', '0001-2'...); no hace commit.
+    
+    Devuelve una lista de None si el socio no tiene número de socio.
+    """
+    if not socio.numero_socio:
+        return [None] * cantidad
+    if cantidad <= 0:
+        return []
+    ultimo = _incrementar_contador(_contador_beneficiarios(socio.id), cantidad, lambda: _ultimo_numero_beneficiario(socio.id))
+    return [f"{socio.numero_socio}-{numero}" for numero in range(ultimo - cantidad + 1, ultimo + 1)]
+
+def siguiente_numero_socio():
+    """Número de socio que recibirá la próxima confirmación (solo lectura, no lo reserva)"""
+    valor = db.session.execute(db.select(Contador.valor).where(Contador.nombre == CONTADOR_SOCIOS)).scalar()
+    if valor is None:
+        valor = _ultimo_numero_socio()
+    return f"{valor + 1:04d}"
+
+def _elevar_contador(nombre, minimo, valor_inicial):
+    """Sube el contador hasta `minimo` si está por debajo (UPDATE condicional); no hace commit"""
+    _incrementar_contador(nombre, 0, valor_inicial)
+    db.session.execute(
+        db.update(Contador).where(Contador.nombre == nombre, Contador.valor < minimo).values(valor=minimo),
+        execution_options={'synchronize_session': False}
+    )
+
+def ajustar_contador_socios(numero_socio):
+    """Tras fijar a mano un numero_socio, garantiza que el contador no vuelva a entregarlo; no hace commit"""
+    if numero_socio and numero_socio.isdigit():
+        _elevar_contador(CONTADOR_SOCIOS, int(numero_socio), _ultimo_numero_socio)
+
+def ajustar_contador_beneficiarios(socio_id, ultimo):
+    """Tras renumerar los beneficiarios de un socio (1..ultimo), evita que el contador entregue esos sufijos"""
+    _elevar_contador(_contador_beneficiarios(socio_id), ultimo, lambda: _ultimo_numero_beneficiario(socio_id))
+
+def reiniciar_contadores():
+    """Borra los contadores de números para que se recalculen desde los datos (tras importar o limpiar la BD); no hace commit.
+    
+    Los contadores de versión (versiones.py) de la misma tabla no se tocan: una versión nunca debe volver atrás.
+    """
+    db.session.execute(db.delete(Contador).where(db.or_(
+        Contador.nombre == CONTADOR_SOCIOS,
+        Contador.nombre.startswith(_contador_beneficiarios(''), autoescape=True),
+    )), execution_options={'synchronize_session': False})
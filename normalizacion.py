@@ -0,0 +1,40 @@
+"""
+Normalización de nombres para guardarlos y buscarlos sin distinguir mayúsculas ni acentos
+"""
+import unicodedata
+from sqlalchemy import and_
+
+# Mayor carácter Unicode: cualquier texto que empiece por un prefijo es menor que prefijo + TOPE
+TOPE = chr(0x10FFFF)
+
+def quitar_acentos(texto):
+    """Convierte texto a mayúsculas y quita acentos, pero preserva la ñ"""
+    # Usar un marcador único que no puede aparecer en el texto
+    MARKER = '\uE000'  # Carácter privado Unicode que no se usa
+    # Preservar la ñ antes de quitar acentos
+    texto = texto.replace('ñ', MARKER).replace('Ñ', MARKER)
+    # Normalizar a NFD (descomponer caracteres)
+    texto = unicodedata.normalize('NFD', texto)
+    # Filtrar solo caracteres sin acentos
+    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn')
+    # Restaurar la ñ
+    texto = texto.replace(MARKER, 'Ñ')
+    # Convertir a mayúsculas
+    return texto.upper()
+
+def normalizar(*partes):
+    """Une las partes no vacías de un nombre en la forma con la que se guarda en las columnas nombre_norm"""
+    texto = ' '.join(parte for parte in partes if parte)
+    return ' '.join(quitar_acentos(texto).split())
+
+def filtro_prefijo(columna, texto):
+    """Condición 'columna empieza por normalizar(texto)' que la BD resuelve con un rango del índice.
+
+    En SQLite LIKE no usa índices sobre columnas BINARY, así que se expresa como rango;
+    en PostgreSQL LIKE 'prefijo%' usa el índice declarado con text_pattern_ops.
+    """
+    from models import db
+    prefijo = normalizar(texto)
+    if db.engine.dialect.name == 'postgresql':
+        return columna.startswith(prefijo, autoescape=True)
+    return and_(columna >= prefijo, columna < prefijo + TOPE)
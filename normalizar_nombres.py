@@ -0,0 +1,47 @@
+"""
+Script para añadir las columnas nombre_norm (nombre sin acentos en mayúsculas) y rellenarlas por lotes
+
+Uso:
+    python normalizar_nombres.py          # lotes de 500 filas
+    python normalizar_nombres.py 2000     # lotes de 2000 filas
+"""
+import sys
+from app import create_app
+from models import db, rellenar_nombres_normalizados
+from sqlalchemy import text
+
+TABLAS = (('users', 100), ('beneficiarios', 300), ('solicitudes_socio', 300))
+
+def normalizar_nombres(lote=500):
+    """Añade la columna y su índice donde falten (SQLite y PostgreSQL) y rellena las filas pendientes"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            for tabla, longitud in TABLAS:
+                try:
+                    with db.engine.connect() as conn:
+                        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN nombre_norm VARCHAR({longitud})"))
+                        conn.commit()
+                    print(f"[OK] Campo 'nombre_norm' agregado a la tabla '{tabla}'")
+                except Exception as e:
+                    if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                        print(f"[INFO] El campo 'nombre_norm' ya existe en '{tabla}'")
+                    else:
+                        print(f"[ERROR] Error al agregar 'nombre_norm' a '{tabla}': {e}")
+
+                for indice in db.metadata.tables[tabla].indexes:
+                    if 'nombre_norm' in indice.columns:
+                        indice.create(bind=db.engine, checkfirst=True)
+
+            actualizadas = rellenar_nombres_normalizados(lote)
+            print(f"\n[SUCCESS] nombre_norm calculado en {actualizadas} fila(s)")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error al normalizar los nombres: {e}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == '__main__':
+    normalizar_nombres(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,94 @@
+"""
+Paginación por clave (keyset / seek) para los listados de la directiva
+
+En lugar de OFFSET, cada página se pide con un cursor que contiene los valores de las columnas
+de ordenación de la última (o primera) fila mostrada, de modo que la BD salta directamente a
+esa posición aunque el listado tenga miles de filas.
+"""
+import base64
+import json
+from datetime import datetime, date
+from sqlalchemy import DateTime, Date, tuple_, literal
+
+POR_PAGINA = 50
+
+class Pagina:
+    """Resultado de una página: filas, cursores de navegación y total de filas del listado"""
+    __slots__ = ('items', 'siguiente', 'anterior', 'total')
+
+    def __init__(self, items, siguiente, anterior, total):
+        self.items = items
+        self.siguiente = siguiente
+        self.anterior = anterior
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def codificar_cursor(valores):
+    """Convierte los valores de la clave de ordenación en un token apto para la URL"""
+    serializables = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in valores]
+    datos = json.dumps(serializables, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+def decodificar_cursor(token, columnas):
+    """Recupera los valores del cursor con el tipo de cada columna; None si el token no es válido"""
+    if not token:
+        return None
+    try:
+        relleno = '=' * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno).decode('utf-8'))
+        if not isinstance(valores, list) or len(valores) != len(columnas):
+            return None
+        resultado = []
+        for valor, columna in zip(valores, columnas):
+            if isinstance(columna.type, DateTime) and valor is not None:
+                valor = datetime.fromisoformat(valor)
+            elif isinstance(columna.type, Date) and valor is not None:
+                valor = date.fromisoformat(valor)
+            resultado.append(valor)
+        return resultado
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+def paginar(query, columnas, clave, descendente=False, despues=None, antes=None, por_pagina=POR_PAGINA):
+    """Devuelve una Pagina de `query` ordenada por `columnas` (todas en el mismo sentido).
+
+    `columnas` debe identificar cada fila de forma única (terminar en la clave primaria) y
+    `clave(fila)` devolver los valores de esas columnas para una fila. `despues`/`antes` son
+    cursores obtenidos de una página anterior. El total sale de un COUNT aparte.
+    """
+    total = query.order_by(None).count()
+
+    hacia_atras = False
+    cursor = decodificar_cursor(despues, columnas)
+    if cursor is None and antes:
+        cursor = decodificar_cursor(antes, columnas)
+        hacia_atras = cursor is not None
+
+    # Al retroceder se recorre el índice en sentido contrario y luego se invierte el resultado
+    orden_desc = descendente != hacia_atras
+    if cursor is not None:
+        valores = tuple_(*[literal(valor, columna.type) for valor, columna in zip(cursor, columnas)])
+        if orden_desc:
+            query = query.filter(tuple_(*columnas) < valores)
+        else:
+            query = query.filter(tuple_(*columnas) > valores)
+    query = query.order_by(*[columna.desc() if orden_desc else columna.asc() for columna in columnas])
+
+    filas = query.limit(por_pagina + 1).all()
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+
+    if hacia_atras:
+        filas.reverse()
+        anterior = codificar_cursor(clave(filas[0])) if hay_mas and filas else None
+        siguiente = codificar_cursor(clave(filas[-1])) if filas else None
+    else:
+        siguiente = codificar_cursor(clave(filas[-1])) if hay_mas else None
+        anterior = codificar_cursor(clave(filas[0])) if cursor is not None and filas else None
+
+    return Pagina(filas, siguiente, anterior, total)
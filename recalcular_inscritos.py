@@ -0,0 +1,43 @@
+"""
+Script para recalcular el contador inscritos_count de las actividades desde la tabla de inscripciones
+
+Uso:
+    python recalcular_inscritos.py            # todas las actividades
+    python recalcular_inscritos.py 3 7 12     # solo las actividades indicadas
+"""
+import sys
+from app import create_app
+from models import db, recalcular_inscritos
+from sqlalchemy import text
+
+def recalcular(actividad_ids=None):
+    """Añade la columna si falta y recalcula los contadores"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            # Agregar inscritos_count a actividades si no existe (SQLite y PostgreSQL)
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text("ALTER TABLE actividades ADD COLUMN inscritos_count INTEGER NOT NULL DEFAULT 0"))
+                    conn.commit()
+                print("[OK] Campo 'inscritos_count' agregado a la tabla 'actividades'")
+            except Exception as e:
+                if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                    print("[INFO] El campo 'inscritos_count' ya existe en 'actividades'")
+                else:
+                    print(f"[ERROR] Error al agregar 'inscritos_count' a 'actividades': {e}")
+
+            actualizadas = recalcular_inscritos(actividad_ids)
+            db.session.commit()
+            print(f"\n[SUCCESS] Contadores recalculados en {actualizadas} actividad(es)")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Error al recalcular los contadores: {e}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == '__main__':
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    recalcular(ids)
@@ -0,0 +1,113 @@
+"""
+Tests del almacén de copias de seguridad comprimidas
+"""
+import gzip
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import almacen_copias
+from almacen_copias import a_conservar, copiar_bd, extraer_copia, guardar_copia, listar_copias
+from conftest import crear_socio
+from models import db, User
+
+
+def test_comprime_y_descarta_copias_iguales(app, tmp_path):
+    for i in range(200):
+        crear_socio(f'SOCIO NÚMERO {i}', f'socio{i}')
+    db.session.commit()
+
+    entrada, nueva = copiar_bd()
+    assert nueva
+    ruta = almacen_copias.ruta_copia(entrada)
+    assert entrada['formato'] == 'gzip' and ruta.endswith('.db.gz')
+    assert entrada['comprimido'] == os.path.getsize(ruta)
+    assert entrada['comprimido'] * 5 < entrada['tamano']
+    with gzip.open(ruta) as archivo:
+        assert archivo.read(16) == b'SQLite format 3\x00'
+
+    # Sin cambios la instantánea es idéntica: no se guarda otra
+    repetida, nueva = copiar_bd()
+    assert not nueva and repetida == entrada
+    assert listar_copias() == [entrada]
+
+    crear_socio('OTRO', 'otro')
+    db.session.commit()
+    ultima, nueva = copiar_bd('antes de importar')
+    assert nueva and ultima['motivo'] == 'antes de importar'
+    # La copia previa a importar no cuenta para la retención: la automática sigue siendo la última de su hora
+    assert listar_copias() == [entrada, ultima]
+    assert ultima['conservar_hasta'] > ultima['fecha']
+
+    extraer_copia(ultima, tmp_path / 'copia.db')
+    with closing(sqlite3.connect(tmp_path / 'copia.db')) as conexion:
+        assert conexion.execute('SELECT COUNT(*) FROM users').fetchone()[0] == User.query.count()
+
+
+def entradas(inicio, cada, cantidad):
+    return [{'archivo': f'copia{i}', 'fecha': (inicio + cada * i).isoformat(timespec='seconds')}
+            for i in range(cantidad)]
+
+
+def test_retencion_por_horas_dias_y_meses():
+    # Una copia cada 20 minutos durante 3 días
+    lista = entradas(datetime(2026, 3, 1), timedelta(minutes=20), 3 * 24 * 3)
+    conservar = a_conservar(lista, horas=4, dias=3, meses=2)
+    # La última de cada una de las 4 últimas horas + la última de los 2 días anteriores
+    assert conservar == {'copia215', 'copia212', 'copia209', 'copia206', 'copia143', 'copia71'}
+
+    # Meses: la última de cada mes, hasta el número indicado
+    lista = entradas(datetime(2025, 1, 15), timedelta(days=10), 40)
+    conservar = a_conservar(lista, horas=0, dias=0, meses=3)
+    fechas = sorted(datetime.fromisoformat(e['fecha']) for e in lista if e['archivo'] in conservar)
+    assert [(fecha.year, fecha.month) for fecha in fechas] == [(2025, 12), (2026, 1), (2026, 2)]
+    assert a_conservar([], horas=1, dias=1, meses=1) == set()
+
+
+def test_guardar_aplica_la_retencion(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_copias, 'CONSERVAR_HORAS', 2)
+    monkeypatch.setattr(almacen_copias, 'CONSERVAR_DIAS', 1)
+    monkeypatch.setattr(almacen_copias, 'CONSERVAR_MESES', 0)
+    inicio = datetime.now() - timedelta(hours=5)
+    for i in range(6):
+        origen = tmp_path / f'datos{i}.db'
+        origen.write_bytes(f'contenido {i}'.encode() * 100)
+        guardar_copia(origen, fecha=inicio + timedelta(hours=i))
+
+    indice = listar_copias()
+    assert [entrada['fecha'] for entrada in indice] == [
+        (inicio + timedelta(hours=i)).isoformat(timespec='seconds') for i in (4, 5)]
+    archivos = {nombre for nombre in os.listdir(almacen_copias.directorio_copias()) if nombre.startswith('backup_')}
+    assert archivos == {entrada['archivo'] for entrada in indice}
+
+
+def test_la_copia_previa_a_restaurar_sobrevive_a_las_automaticas(app):
+    # Copia automática y, en la misma hora, la restauración: su copia previa coincide con ella
+    automatica, _ = copiar_bd()
+    previa, nueva = copiar_bd('antes de restaurar')
+    assert not nueva and previa['archivo'] == automatica['archivo']
+    assert previa['motivo'] == 'antes de restaurar'
+
+    # Tras restaurar los datos cambian y la siguiente copia automática es de la misma hora
+    crear_socio('RESTAURADO', 'restaurado')
+    db.session.commit()
+    siguiente, nueva = copiar_bd()
+    assert nueva
+    crear_socio('OTRO', 'otro')
+    db.session.commit()
+    ultima, _ = copiar_bd()
+
+    # La previa se conserva; de las automáticas de esa hora solo queda la más reciente
+    assert [entrada['archivo'] for entrada in listar_copias()] == [previa['archivo'], ultima['archivo']]
+    assert os.path.exists(almacen_copias.ruta_copia(previa))
+    assert not os.path.exists(almacen_copias.ruta_copia(siguiente))
+
+
+def test_las_copias_de_seguridad_caducan():
+    previa = {'archivo': 'previa', 'fecha': '2026-03-01T10:00:00', 'motivo': 'antes de importar',
+              'conservar_hasta': '2026-03-31T10:00:00'}
+    automatica = {'archivo': 'automatica', 'fecha': '2026-03-01T10:30:00', 'motivo': 'automática'}
+    assert a_conservar([previa, automatica], 24, 30, 12, ahora=datetime(2026, 3, 30)) == {'previa', 'automatica'}
+    # Pasado el plazo se reparte como una copia más: la de la misma hora más reciente manda
+    assert a_conservar([previa, automatica], 24, 30, 12, ahora=datetime(2026, 4, 1)) == {'automatica'}
@@ -0,0 +1,82 @@
+"""
+Tests del índice de búsqueda de texto completo (FTS5 en SQLite)
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from busqueda import coincidencias, backend, instalar_busqueda
+from models import db, Actividad, Beneficiario
+from conftest import crear_socio
+
+
+def ids_encontrados(tabla, texto_busqueda):
+    encontrados = coincidencias(tabla, texto_busqueda)
+    return {fila.id for fila in db.session.execute(db.select(encontrados.c.id))}
+
+
+def test_backend_sqlite_es_fts5(app):
+    assert backend().nombre == 'fts5'
+
+
+def test_busqueda_por_prefijo_sin_acentos(app):
+    socio = crear_socio('MARTÍNEZ LÓPEZ ANA', 'analopez', numero_socio='0042')
+    otro = crear_socio('GARCIA RUIZ PEDRO', 'pedrog', numero_socio='0043')
+    db.session.commit()
+
+    assert ids_encontrados('users', 'mart lop') == {socio.id}
+    assert ids_encontrados('users', 'Martinez') == {socio.id}
+    assert ids_encontrados('users', '004') == {socio.id, otro.id}
+    assert ids_encontrados('users', 'martinez pedro') == set()
+    # Sin palabras no hay búsqueda
+    assert coincidencias('users', ' -/ ') is None
+
+
+def test_triggers_mantienen_el_indice(app):
+    socio = crear_socio('PEREZ SANZ LUIS', 'luisp', numero_socio='0007')
+    db.session.flush()
+    beneficiario = Beneficiario(socio_id=socio.id, nombre='NURIA', primer_apellido='PEREZ',
+                                ano_nacimiento=2015, numero_beneficiario='0007-1',
+                                fecha_validez=datetime(2030, 12, 31))
+    actividad = Actividad(nombre='Taller de cerámica', descripcion='Modelado con barro',
+                          fecha=datetime(2030, 3, 15, 10, 0), aforo_maximo=10)
+    db.session.add_all([beneficiario, actividad])
+    db.session.commit()
+
+    assert ids_encontrados('beneficiarios', '0007-1') == {beneficiario.id}
+    assert ids_encontrados('actividades', 'ceramica') == {actividad.id}
+    assert ids_encontrados('actividades', '15/03/2030') == {actividad.id}
+
+    socio.nombre = 'GOMEZ SANZ LUIS'
+    actividad.nombre = 'Taller de pintura'
+    db.session.commit()
+    assert ids_encontrados('users', 'perez') == set()
+    assert ids_encontrados('users', 'gomez') == {socio.id}
+    assert ids_encontrados('actividades', 'ceramica') == set()
+
+    db.session.delete(beneficiario)
+    db.session.commit()
+    assert ids_encontrados('beneficiarios', 'nuria') == set()
+
+
+def test_instalar_indexa_filas_existentes(app):
+    socio = crear_socio('ROMERO VIDAL EVA', 'evar')
+    db.session.commit()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE users_fts'))
+
+    instalar_busqueda()
+    assert ids_encontrados('users', 'romero') == {socio.id}
+
+
+def test_listado_de_socios_ordenado_por_relevancia(admin_client):
+    crear_socio('ANA ANA ANA', 'ana1')
+    crear_socio('ANA LOPEZ RUIZ', 'ana2')
+    crear_socio('PEDRO LOPEZ RUIZ', 'pedro')
+    db.session.commit()
+
+    respuesta = admin_client.get('/admin/socios?search=ana')
+    assert respuesta.status_code == 200
+    html = respuesta.get_data(as_text=True)
+    assert 'PEDRO LOPEZ RUIZ' not in html
+    assert html.index('ANA ANA ANA') < html.index('ANA LOPEZ RUIZ')
@@ -0,0 +1,109 @@
+"""
+Tests de la caché de listados de actividades (generación compartida en la BD, TTL y LRU)
+"""
+import time
+from datetime import datetime, timedelta
+
+import cache_actividades
+from cache_actividades import actividades_proximas, en_cache, generacion_actividades
+from conftest import ContadorConsultas, crear_socio, login
+from models import db, Actividad, Contador, CONTADOR_SOCIOS, reiniciar_contadores
+
+
+def nueva_actividad(nombre, dentro_de=timedelta(days=7)):
+    actividad = Actividad(nombre=nombre, fecha=datetime.utcnow() + dentro_de, aforo_maximo=10)
+    db.session.add(actividad)
+    db.session.commit()
+    return actividad
+
+
+def consultas_de_listado(consultas):
+    return [s for s in consultas.sentencias if 'FROM actividades' in s and 'actividades.fecha >' in s]
+
+
+def test_segunda_visita_no_consulta_actividades(app):
+    nueva_actividad('EXCURSION')
+    socio = crear_socio('ANA', 'ana')
+    db.session.commit()
+    cliente = login(app.test_client(), socio)
+
+    assert 'EXCURSION' in cliente.get('/socios/actividades').get_data(as_text=True)
+    with ContadorConsultas() as consultas:
+        assert 'EXCURSION' in cliente.get('/socios/actividades').get_data(as_text=True)
+        assert 'EXCURSION' in cliente.get('/socios/dashboard').get_data(as_text=True)
+    assert not consultas_de_listado(consultas)
+
+
+def test_escrituras_suben_la_generacion(app):
+    actividad = nueva_actividad('EXCURSION')
+    generacion = generacion_actividades()
+    assert [a.nombre for a in actividades_proximas()] == ['EXCURSION']
+
+    actividad.nombre = 'EXCURSION AL MONTE'
+    db.session.commit()
+    assert generacion_actividades() == generacion + 1
+    assert [a.nombre for a in actividades_proximas()] == ['EXCURSION AL MONTE']
+
+    # El contador de inscritos se actualiza con un UPDATE masivo
+    assert actividad.reservar_plaza()
+    db.session.commit()
+    assert generacion_actividades() == generacion + 2
+    assert actividades_proximas()[0].numero_inscritos() == 1
+
+    # Un rollback deshace también la subida de generación
+    actividad.nombre = 'OTRA'
+    db.session.flush()
+    db.session.rollback()
+    assert generacion_actividades() == generacion + 2
+
+
+def test_reiniciar_contadores_no_toca_la_generacion(app):
+    nueva_actividad('EXCURSION')
+    crear_socio('ANA', 'ana')
+    db.session.commit()
+    generacion = generacion_actividades()
+    assert generacion > 0
+
+    reiniciar_contadores()
+    db.session.commit()
+    assert generacion_actividades() == generacion
+    assert db.session.get(Contador, CONTADOR_SOCIOS) is None
+
+
+def test_cambio_hecho_por_otro_worker(app):
+    nueva_actividad('EXCURSION')
+    assert len(actividades_proximas()) == 1
+
+    # Otro proceso inserta una actividad sin pasar por esta sesión y sube la generación
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO actividades (nombre, fecha, aforo_maximo, fecha_creacion, inscritos_count) VALUES (?, ?, 10, ?, 0)",
+            ('TALLER', datetime.utcnow() + timedelta(days=3), datetime.utcnow())
+        )
+        conn.exec_driver_sql("UPDATE contadores SET valor = valor + 1 WHERE nombre = 'generacion_actividades'")
+    db.session.commit()
+
+    assert [a.nombre for a in actividades_proximas()] == ['TALLER', 'EXCURSION']
+
+
+def test_caduca_cuando_empieza_la_primera_actividad(app):
+    nueva_actividad('YA EMPIEZA', dentro_de=timedelta(seconds=1))
+    nueva_actividad('EXCURSION')
+    assert len(actividades_proximas()) == 2
+
+    time.sleep(1.2)
+    assert [a.nombre for a in actividades_proximas()] == ['EXCURSION']
+
+
+def test_lru_limita_las_entradas(app, monkeypatch):
+    monkeypatch.setattr(cache_actividades, 'MAX_ENTRADAS', 2)
+    calculos = []
+
+    def calcular(clave):
+        calculos.append(clave)
+        return clave, None
+
+    for clave in ('a', 'b', 'a', 'c', 'a', 'b'):
+        en_cache(clave, lambda: calcular(clave))
+    # 'b' se descarta al entrar 'c' (la menos usada recientemente) y se vuelve a calcular
+    assert calculos == ['a', 'b', 'c', 'b']
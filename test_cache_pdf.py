@@ -0,0 +1,82 @@
+"""
+Tests de la caché en disco de los PDF
+"""
+import os
+from datetime import datetime, timedelta
+
+import blueprints.admin
+import cache_pdf
+from cache_pdf import directorio_cache, pdf_en_cache
+from conftest import crear_socio
+from models import db, Actividad, Inscripcion
+
+
+def actividad_con_inscrito(nombre, socio):
+    actividad = Actividad(nombre=nombre, fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=10, inscritos_count=1)
+    db.session.add(actividad)
+    db.session.flush()
+    inscripcion = Inscripcion(user_id=socio.id, actividad_id=actividad.id)
+    db.session.add(inscripcion)
+    db.session.commit()
+    return actividad, inscripcion
+
+
+def guardados(prefijo):
+    return [nombre for nombre in os.listdir(directorio_cache()) if nombre.startswith(prefijo)]
+
+
+def test_se_guarda_junto_a_la_bd(app):
+    assert os.path.dirname(directorio_cache()) == os.environ['PERSISTENT_DISK_PATH']
+
+
+def test_hoja_de_inscritos_se_genera_una_vez(app, admin_client, monkeypatch):
+    socio = crear_socio('ANA', 'ana')
+    db.session.commit()
+    actividad, _ = actividad_con_inscrito('EXCURSION', socio)
+
+    generados = []
+    original = blueprints.admin.pdf_inscritos
+    monkeypatch.setattr(blueprints.admin, 'pdf_inscritos', lambda *args: generados.append(args) or original(*args))
+
+    url = f'/admin/actividades/{actividad.id}/inscritos/pdf'
+    primera = admin_client.get(url)
+    segunda = admin_client.get(url)
+    assert primera.status_code == segunda.status_code == 200
+    assert primera.get_data() == segunda.get_data()
+    assert primera.get_data().startswith(b'%PDF')
+    assert 'inline' in segunda.headers['Content-Disposition']
+    assert len(generados) == 1
+
+
+def test_asistencia_invalida_solo_su_actividad(app, admin_client):
+    socio = crear_socio('ANA', 'ana')
+    db.session.commit()
+    excursion, inscripcion = actividad_con_inscrito('EXCURSION', socio)
+    taller, _ = actividad_con_inscrito('TALLER', socio)
+    for actividad in (excursion, taller):
+        admin_client.get(f'/admin/actividades/{actividad.id}/inscritos/pdf')
+    assert guardados(f'inscritos_{excursion.id}_') and guardados(f'inscritos_{taller.id}_')
+
+    admin_client.post(f'/admin/actividades/{excursion.id}/marcar-asistencia/{inscripcion.id}')
+    assert not guardados(f'inscritos_{excursion.id}_')
+    assert guardados(f'inscritos_{taller.id}_')
+
+
+def test_nueva_version_sustituye_a_la_anterior(app):
+    pdf_en_cache('prueba', 'v1', lambda: b'uno').close()
+    with pdf_en_cache('prueba', 'v2', lambda: b'dos') as archivo:
+        assert archivo.read() == b'dos'
+    assert guardados('prueba_') == ['prueba_v2.pdf']
+
+
+def test_lru_limita_el_tamano(app, monkeypatch):
+    monkeypatch.setattr(cache_pdf, 'MAX_BYTES', 25)
+    pdf_en_cache('a', 'v', lambda: b'x' * 10).close()
+    pdf_en_cache('b', 'v', lambda: b'x' * 10).close()
+    # 'b' lleva tiempo sin usarse; 'a' se vuelve a pedir y no se regenera
+    os.utime(os.path.join(directorio_cache(), 'b_v.pdf'), (0, 0))
+    with pdf_en_cache('a', 'v', lambda: b'no se regenera') as archivo:
+        assert archivo.read() == b'x' * 10
+    pdf_en_cache('c', 'v', lambda: b'x' * 10).close()
+
+    assert sorted(guardados('')) == ['a_v.pdf', 'c_v.pdf']
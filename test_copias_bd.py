@@ -0,0 +1,77 @@
+"""
+Tests de la descarga de la base de datos completa
+"""
+import io
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import copias_bd
+from cache_actividades import actividades_proximas
+from cache_pdf import directorio_cache, guardar_pdf
+from conftest import crear_socio
+from models import db, User, Actividad
+from versiones import GENERACION_ACTIVIDADES, huella, leer_version
+
+
+def test_descarga_sqlite_con_la_api_de_backup(app, admin_client, tmp_path, monkeypatch):
+    for i in range(20):
+        crear_socio(f'SOCIO {i}', f'socio{i}')
+    db.session.commit()
+    # Una página por paso: la copia se hace en varios pasos
+    monkeypatch.setattr(copias_bd, 'PAGINAS', 1)
+    monkeypatch.setattr(copias_bd, 'TROZO', 4096)
+
+    respuesta = admin_client.get('/admin/descargar-base-datos')
+    assert respuesta.status_code == 200
+    assert respuesta.is_streamed
+    assert 'backup_bd_completa_' in respuesta.headers['Content-Disposition']
+    temporales = copias_bd.directorio_persistente(copias_bd.TEMPORALES)
+    assert len(os.listdir(temporales)) == 1
+
+    trozos = list(respuesta.response)
+    respuesta.close()
+    assert len(trozos) > 1
+    contenido = b''.join(trozos)
+    assert len(contenido) == int(respuesta.headers['Content-Length'])
+    # El temporal se borra al terminar el envío
+    assert os.listdir(temporales) == []
+
+    copia = tmp_path / 'copia.db'
+    copia.write_bytes(contenido)
+    with closing(sqlite3.connect(copia)) as conexion:
+        assert conexion.execute('SELECT COUNT(*) FROM users').fetchone()[0] == User.query.count()
+        assert conexion.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    # La aplicación sigue usando su pool sin haber cerrado las conexiones
+    assert User.query.filter_by(nombre_usuario='socio3').one().nombre == 'SOCIO 3'
+
+
+def test_restaurar_sqlite_invalida_versiones_y_caches(app, admin_client):
+    actividad = Actividad(nombre='TALLER', fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=10)
+    db.session.add(actividad)
+    db.session.commit()
+    db_path = db.engine.url.database
+    copia = db_path + '.copia'
+    with closing(sqlite3.connect(db_path)) as origen, closing(sqlite3.connect(copia)) as destino:
+        origen.backup(destino)
+    actividad.nombre = 'TALLER DE PINTURA'
+    db.session.commit()
+
+    # Listado en la caché del proceso, un PDF en disco y el ETag que tiene el navegador
+    assert [a.nombre for a in actividades_proximas()] == ['TALLER DE PINTURA']
+    generacion = leer_version(GENERACION_ACTIVIDADES)
+    antes = huella('actividades', generacion)
+    guardar_pdf('actividades', antes, b'%PDF antiguo').close()
+    with open(copia, 'rb') as archivo:
+        contenido = archivo.read()
+
+    respuesta = admin_client.post('/admin/restaurar-base-datos', data={
+        'confirmacion': 'RESTAURAR', 'archivo': (io.BytesIO(contenido), 'copia.db'),
+    }, content_type='multipart/form-data')
+    assert respuesta.status_code == 302
+
+    assert leer_version(GENERACION_ACTIVIDADES) == generacion
+    assert huella('actividades', generacion) != antes
+    assert not [nombre for nombre in os.listdir(directorio_cache()) if nombre.endswith('.pdf')]
+    assert [a.nombre for a in actividades_proximas()] == ['TALLER']
@@ -0,0 +1,212 @@
+"""
+Tests del planificador de copias de seguridad automáticas
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+import almacen_copias
+import copias_programadas
+from app import create_app
+from conftest import crear_socio, login
+from copias_bd import bd_reemplazada
+from copias_programadas import Planificador, solicitar_copia, estado_copias
+from models import db, User
+
+
+@pytest.fixture
+def planificador(app, monkeypatch):
+    monkeypatch.setattr(copias_programadas, 'subir_backup_ftp', lambda ruta: False)
+    return Planificador(app, copias_programadas.directorio_persistente(copias_programadas.DIRECTORIO))
+
+
+def copias(planificador):
+    return sorted(nombre for nombre in os.listdir(planificador.directorio) if nombre.startswith('backup_sqlite_'))
+
+
+def contar(archivo, tmp_path, condicion=''):
+    """Usuarios en la copia `archivo` del almacén"""
+    entrada = next(entrada for entrada in almacen_copias.listar_copias() if entrada['archivo'] == archivo)
+    almacen_copias.extraer_copia(entrada, tmp_path / 'copia.db')
+    with closing(sqlite3.connect(tmp_path / 'copia.db')) as conexion:
+        return conexion.execute(f'SELECT COUNT(*) FROM users {condicion}').fetchone()[0]
+
+
+def test_cerrar_sesion_solo_pide_la_copia(app):
+    cliente = login(app.test_client(), User.query.filter_by(rol='directiva').first())
+    assert estado_copias()['pendiente'] is False
+    for _ in range(3):
+        cliente.get('/auth/logout')
+        login(cliente, User.query.filter_by(rol='directiva').first())
+    assert estado_copias()['pendiente'] is True
+    assert not any(nombre.startswith('backup_sqlite_') for nombre in
+                   os.listdir(copias_programadas.directorio_persistente(copias_programadas.DIRECTORIO)))
+
+
+def test_agrupa_peticiones_y_solo_copia_si_hay_cambios(app, planificador, tmp_path):
+    ahora = time.time()
+    solicitud = os.path.join(planificador.directorio, copias_programadas.SOLICITUD)
+    intervalo = copias_programadas.INTERVALO_MINIMO
+
+    # Nunca se ha copiado: la primera revisión copia
+    assert planificador.revisar(ahora) is True
+    assert len(copias(planificador)) == 1
+    estado = estado_copias()
+    assert estado['resultado'] == 'ok' and estado['subido'] is False
+    assert contar(estado['archivo'], tmp_path) == User.query.count()
+
+    # Dentro del intervalo mínimo las peticiones esperan y se agrupan
+    for _ in range(10):
+        solicitar_copia()
+    assert planificador.revisar(ahora + 60) is False
+    assert estado_copias()['pendiente'] is True
+
+    # Pasado el intervalo se atienden todas a la vez; sin cambios en los datos no se copia
+    assert planificador.revisar(ahora + intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'sin cambios' and estado['pendiente'] is False
+    assert estado['ultima_copia'] == copias(planificador)[0]
+    assert len(copias(planificador)) == 1
+
+    # Con cambios sí se copia
+    crear_socio('NUEVO', 'nuevo')
+    db.session.commit()
+    solicitar_copia()
+    os.utime(solicitud, (ahora + 100, ahora + 100))
+    assert planificador.revisar(ahora + 2 * intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'ok'
+    assert contar(estado['archivo'], tmp_path, "WHERE nombre_usuario = 'nuevo'") == 1
+    assert copias(planificador) == [estado['archivo']]  # la anterior es de la misma hora
+
+    # Sin peticiones no se vuelve a revisar hasta que pasa el periodo
+    assert planificador.revisar(ahora + 3 * intervalo) is False
+
+
+def test_sigue_copiando_tras_sustituir_el_archivo(app, planificador, tmp_path):
+    ahora = time.time()
+    intervalo = copias_programadas.INTERVALO_MINIMO
+    assert planificador.revisar(ahora) is True
+
+    # Importación de un archivo SQLite: el archivo se cambia por otro con os.replace
+    db_path = db.engine.url.database
+    copia = db_path + '.copia'
+    with closing(sqlite3.connect(db_path)) as origen, closing(sqlite3.connect(copia)) as destino:
+        origen.backup(destino)
+        destino.execute("UPDATE users SET nombre = 'IMPORTADO' WHERE rol = 'directiva'")
+        destino.commit()
+    db.session.remove()
+    db.engine.dispose()
+    for auxiliar in (f'{db_path}-shm', f'{db_path}-wal'):
+        if os.path.exists(auxiliar):
+            os.remove(auxiliar)
+    os.replace(copia, db_path)
+
+    solicitar_copia()
+    assert planificador.revisar(ahora + intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'ok'
+    assert contar(estado['archivo'], tmp_path, "WHERE nombre = 'IMPORTADO'") > 0
+
+    # Y los cambios posteriores en el archivo nuevo se siguen detectando
+    crear_socio('DESPUES', 'despues')
+    db.session.commit()
+    solicitar_copia()
+    assert planificador.revisar(ahora + 2 * intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'ok'
+    assert contar(estado['archivo'], tmp_path, "WHERE nombre_usuario = 'despues'") == 1
+
+
+def test_bd_reemplazada_reabre_la_conexion(app, planificador, monkeypatch):
+    monkeypatch.setattr(copias_programadas, '_planificador', planificador)
+    planificador.revisar()
+    conexion = planificador.conexion
+    bd_reemplazada()
+    planificador._version_datos()
+    assert planificador.conexion is not conexion and planificador.version_copiada is None
+
+
+def test_un_error_deja_la_peticion_pendiente(app, planificador, monkeypatch):
+    ahora = time.time()
+    intervalo = copias_programadas.INTERVALO_MINIMO
+    assert planificador.revisar(ahora) is True
+    crear_socio('NUEVO', 'nuevo')
+    db.session.commit()
+    solicitar_copia()
+
+    def fallar():
+        raise OSError('disco lleno')
+    monkeypatch.setattr(planificador, '_copiar', fallar)
+    assert planificador.revisar(ahora + intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'error' and 'disco lleno' in estado['mensaje']
+    assert estado['pendiente'] is True
+
+    # Se reintenta en cuanto pasa el intervalo mínimo, sin esperar al periodo
+    monkeypatch.undo()
+    monkeypatch.setattr(copias_programadas, 'subir_backup_ftp', lambda ruta: False)
+    assert planificador.revisar(ahora + intervalo + 60) is False
+    assert planificador.revisar(ahora + 2 * intervalo) is True
+    estado = estado_copias()
+    assert estado['resultado'] == 'ok' and estado['pendiente'] is False
+
+
+def test_un_solo_proceso_planifica(app, monkeypatch):
+    monkeypatch.setattr(copias_programadas, 'AUTOMATICO', True)
+    if copias_programadas.fcntl is None:
+        pytest.skip('sin bloqueo de archivos en esta plataforma')
+    directorio = copias_programadas.directorio_persistente(copias_programadas.DIRECTORIO)
+    # Otro worker tiene el bloqueo
+    with open(os.path.join(directorio, copias_programadas.BLOQUEO), 'a') as otro:
+        copias_programadas.fcntl.flock(otro, copias_programadas.fcntl.LOCK_EX | copias_programadas.fcntl.LOCK_NB)
+        assert copias_programadas.iniciar_planificador(app) is False
+    assert copias_programadas._planificador is None
+
+
+class HiloFalso:
+    def __init__(self, **opciones):
+        pass
+
+    def start(self):
+        pass
+
+
+def test_solo_el_servidor_web_arranca_el_planificador(app, monkeypatch):
+    if copias_programadas.fcntl is None:
+        pytest.skip('sin bloqueo de archivos en esta plataforma')
+    monkeypatch.setattr(copias_programadas, 'AUTOMATICO', True)
+    monkeypatch.setattr(copias_programadas.threading, 'Thread', HiloFalso)
+    for nombre in ('_planificador', '_app', '_archivo_bloqueo'):
+        monkeypatch.setattr(copias_programadas, nombre, None)
+
+    # Los scripts usan create_app(): ni planificador ni bloqueo
+    create_app()
+    assert copias_programadas._planificador is None
+    # Un proceso que no es el servidor web no lo intenta al cerrar sesión
+    copias_programadas.reintentar_planificador()
+    assert copias_programadas._planificador is None
+
+    directorio = copias_programadas.directorio_persistente(copias_programadas.DIRECTORIO)
+    with open(os.path.join(directorio, copias_programadas.BLOQUEO), 'a') as otro:
+        copias_programadas.fcntl.flock(otro, copias_programadas.fcntl.LOCK_EX | copias_programadas.fcntl.LOCK_NB)
+        assert copias_programadas.iniciar_planificador(app) is False
+        copias_programadas.reintentar_planificador()
+        assert copias_programadas._planificador is None
+    # El worker que lo tenía ha muerto (bloqueo liberado): el siguiente intento lo coge
+    try:
+        copias_programadas.reintentar_planificador()
+        assert copias_programadas._planificador is not None
+    finally:
+        if copias_programadas._archivo_bloqueo is not None:
+            copias_programadas._archivo_bloqueo.close()
+
+
+def test_estado_en_el_panel(app, admin_client, planificador):
+    planificador.revisar()
+    estado = admin_client.get('/admin/copias/estado').get_json()
+    assert estado['resultado'] == 'ok'
+    assert estado['ultima_copia'].startswith('backup_sqlite_')
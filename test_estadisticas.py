@@ -0,0 +1,66 @@
+"""
+Tests del panel de la directiva (admin.dashboard) y de su caché de estadísticas
+"""
+from datetime import datetime, timedelta
+
+from conftest import ContadorConsultas, crear_socio, crear_solicitud
+from models import db, Actividad, Inscripcion
+from estadisticas import estadisticas_dashboard
+
+
+def _crear_actividades(cantidad, inicio=0):
+    for i in range(inicio, inicio + cantidad):
+        db.session.add(Actividad(nombre=f'ACTIVIDAD {i:03d}', fecha=datetime(2026, 1, 1) + timedelta(days=i), aforo_maximo=10))
+    db.session.commit()
+
+
+def _consultas_panel(client):
+    with ContadorConsultas() as consultas:
+        response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    return consultas.total, response.get_data(as_text=True)
+
+
+def test_panel_no_crece_con_el_historial(app, admin_client):
+    _crear_actividades(3)
+    consultas_pocas, _ = _consultas_panel(admin_client)
+
+    _crear_actividades(100, inicio=3)
+    consultas_muchas, html = _consultas_panel(admin_client)
+
+    assert consultas_muchas == consultas_pocas
+    assert 'ACTIVIDAD 102' in html and 'ACTIVIDAD 097' not in html
+
+
+def test_estadisticas_en_cache_hasta_una_escritura(app, admin_client):
+    _crear_actividades(2)
+    crear_socio('ANA', 'ana')
+    crear_solicitud(1)
+    db.session.commit()
+
+    estadisticas = estadisticas_dashboard()
+    assert (estadisticas['total_socios'], estadisticas['total_actividades'], estadisticas['solicitudes_pendientes']) == (1, 2, 1)
+
+    with ContadorConsultas() as consultas:
+        assert estadisticas_dashboard() is estadisticas
+    assert consultas.total == 0
+
+    # Una inscripción actualiza el contador de la actividad con un UPDATE masivo
+    socio = crear_socio('EVA', 'eva')
+    db.session.commit()
+    actividad = Actividad.query.order_by(Actividad.fecha.desc()).first()
+    assert actividad.reservar_plaza()
+    db.session.add(Inscripcion(user_id=socio.id, actividad_id=actividad.id))
+    db.session.commit()
+
+    estadisticas = estadisticas_dashboard()
+    assert estadisticas['total_socios'] == 2
+    assert estadisticas['actividades'][0].inscritos_count == 1
+
+
+def test_rollback_no_invalida(app):
+    estadisticas = estadisticas_dashboard()
+    crear_socio('ANA', 'ana')
+    db.session.flush()
+    db.session.rollback()
+    assert estadisticas_dashboard() is estadisticas
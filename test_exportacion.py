@@ -0,0 +1,108 @@
+"""
+Tests de la exportación de listados a CSV y XLSX
+"""
+import csv
+import io
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+import exportacion
+from conftest import crear_socio
+from models import db, Actividad, Beneficiario, Inscripcion
+
+
+def preparar():
+    ana = crear_socio('ANA GARCIA', 'ana', numero_socio='0001')
+    ana.calle, ana.numero, ana.poblacion = 'MAYOR', '3', 'MONTEALTO'
+    luis = crear_socio('LUIS PEREZ', 'luis', numero_socio='0002')
+    db.session.flush()
+    hijo = Beneficiario(socio_id=ana.id, nombre='PABLO', primer_apellido='GARCIA', ano_nacimiento=datetime.now().year - 8,
+                        fecha_validez=ana.fecha_validez, numero_beneficiario='0001-1')
+    db.session.add(hijo)
+    db.session.commit()
+    return ana, luis, hijo
+
+
+def leer_csv(respuesta):
+    texto = respuesta.get_data().decode('utf-8')
+    assert texto.startswith('\ufeff')
+    return list(csv.reader(io.StringIO(texto[1:]), delimiter=';'))
+
+
+def test_socios_csv_con_los_filtros_del_listado(app, admin_client):
+    preparar()
+    respuesta = admin_client.get('/admin/socios/exportar?formato=csv')
+    assert respuesta.status_code == 200
+    assert respuesta.is_streamed
+    assert respuesta.headers['Content-Type'].startswith('text/csv')
+    assert 'socios_' in respuesta.headers['Content-Disposition']
+
+    filas = leer_csv(respuesta)
+    assert filas[0][:3] == ['Nº socio', 'Nombre', 'Usuario']
+    assert [fila[1] for fila in filas[1:]] == ['ANA GARCIA', 'LUIS PEREZ']
+    assert filas[1][3:7] == ['MAYOR', '3', '', 'MONTEALTO']
+    assert filas[1][-1] == '1' and filas[2][-1] == '0'
+
+    # Solo los socios que son niños o tienen beneficiarios niños, como en la pantalla
+    filas = leer_csv(admin_client.get('/admin/socios/exportar?formato=csv&solo_ninos=on'))
+    assert [fila[1] for fila in filas[1:]] == ['ANA GARCIA']
+    filas = leer_csv(admin_client.get('/admin/socios/exportar?formato=csv&search=perez'))
+    assert [fila[1] for fila in filas[1:]] == ['LUIS PEREZ']
+
+
+def test_socios_xlsx(app, admin_client):
+    preparar()
+    respuesta = admin_client.get('/admin/socios/exportar?formato=xlsx')
+    assert respuesta.status_code == 200
+    hoja = load_workbook(io.BytesIO(respuesta.get_data()), read_only=True).active
+    filas = list(hoja.values)
+    assert filas[0][1] == 'Nombre'
+    assert [fila[1] for fila in filas[1:]] == ['ANA GARCIA', 'LUIS PEREZ']
+    assert isinstance(filas[1][8], datetime)
+
+
+def test_beneficiarios_con_edad(app, admin_client):
+    preparar()
+    filas = leer_csv(admin_client.get('/admin/beneficiarios/exportar?solo_ninos=on'))
+    assert filas[1:] == [[
+        '0001-1', 'Beneficiario', 'PABLO', 'GARCIA', '', str(datetime.now().year - 8), '8', '0001', 'ANA GARCIA',
+        filas[1][-1],
+    ]]
+    filas = leer_csv(admin_client.get('/admin/beneficiarios/exportar'))
+    assert {(fila[1], fila[2]) for fila in filas[1:]} == {('Socio', 'ANA'), ('Socio', 'LUIS'), ('Beneficiario', 'PABLO')}
+
+
+def test_inscritos_de_una_actividad(app, admin_client):
+    ana, luis, hijo = preparar()
+    actividad = Actividad(nombre='EXCURSIÓN', fecha=datetime(2026, 6, 5), aforo_maximo=10)
+    db.session.add(actividad)
+    db.session.flush()
+    db.session.add(Inscripcion(user_id=luis.id, actividad_id=actividad.id, fecha_inscripcion=datetime(2026, 5, 1), asiste=True))
+    db.session.add(Inscripcion(user_id=ana.id, actividad_id=actividad.id, beneficiario_id=hijo.id,
+                               fecha_inscripcion=datetime(2026, 5, 2)))
+    db.session.commit()
+
+    respuesta = admin_client.get(f'/admin/actividades/{actividad.id}/inscritos/exportar?formato=csv')
+    assert 'inscritos_EXCURSION_' in respuesta.headers['Content-Disposition']
+    assert leer_csv(respuesta)[1:] == [
+        ['LUIS PEREZ', 'Socio', '0002', '1980', 'LUIS PEREZ', '01/05/2026 00:00', 'Sí'],
+        ['PABLO GARCIA', 'Beneficiario', '0001-1', str(datetime.now().year - 8), 'ANA GARCIA', '02/05/2026 00:00', 'No'],
+    ]
+
+
+def test_se_envia_a_trozos_sin_formulas(app, admin_client, monkeypatch):
+    for i in range(5):
+        crear_socio(f'=SOCIO {i}', f'socio{i}')
+    db.session.commit()
+    monkeypatch.setattr(exportacion, 'LOTE', 2)
+
+    respuesta = admin_client.get('/admin/socios/exportar')
+    trozos = list(respuesta.response)
+    assert len(trozos) == 3
+    filas = list(csv.reader(io.StringIO(b''.join(trozos).decode('utf-8')[1:]), delimiter=';'))
+    assert [fila[1] for fila in filas[1:]] == [f"'=SOCIO {i}" for i in range(5)]
+
+
+def test_formato_no_valido(app, admin_client):
+    assert admin_client.get('/admin/socios/exportar?formato=pdf').status_code == 302
@@ -0,0 +1,50 @@
+"""
+Tests del listado de socios de la directiva (admin.gestion_socios)
+"""
+from conftest import ContadorConsultas, crear_socio
+from models import db, Beneficiario
+
+
+def _crear_socios_con_beneficiarios(numero_socios, beneficiarios_por_socio, prefijo='SOCIO'):
+    for i in range(numero_socios):
+        socio = crear_socio(f'{prefijo} {i:03d}', f'{prefijo.lower()}{i:03d}')
+        db.session.flush()
+        for j in range(beneficiarios_por_socio):
+            db.session.add(Beneficiario(
+                socio_id=socio.id,
+                nombre=f'BEN {beneficiarios_por_socio - j}',
+                primer_apellido='PRUEBA',
+                ano_nacimiento=2015,
+                fecha_validez=socio.fecha_validez
+            ))
+    db.session.commit()
+
+
+def _consultas_listado(client, **params):
+    with ContadorConsultas() as consultas:
+        response = client.get('/admin/socios', query_string=params)
+    assert response.status_code == 200
+    return consultas.total
+
+
+def test_gestion_socios_numero_de_consultas_constante(app, admin_client):
+    _crear_socios_con_beneficiarios(3, 2)
+    consultas_pocos = _consultas_listado(admin_client)
+
+    _crear_socios_con_beneficiarios(40, 3, prefijo='OTRO')
+    consultas_muchos = _consultas_listado(admin_client)
+
+    assert consultas_muchos == consultas_pocos
+    assert consultas_muchos <= 4
+
+
+def test_gestion_socios_consultas_constantes_con_filtros(app, admin_client):
+    _crear_socios_con_beneficiarios(20, 3)
+    assert _consultas_listado(admin_client, search='SOCIO') <= 4
+    assert _consultas_listado(admin_client, solo_ninos='on') <= 5
+
+
+def test_gestion_socios_beneficiarios_ordenados_por_nombre(app, admin_client):
+    _crear_socios_con_beneficiarios(2, 3)
+    html = admin_client.get('/admin/socios').get_data(as_text=True)
+    assert html.index('BEN 1') < html.index('BEN 2') < html.index('BEN 3')
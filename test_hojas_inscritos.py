@@ -0,0 +1,98 @@
+"""
+Tests de la exportación en bloque de las hojas de inscritos (ZIP)
+"""
+import io
+import os
+import zipfile
+from datetime import datetime
+
+import hojas_inscritos
+from cache_pdf import directorio_cache
+from conftest import ContadorConsultas, crear_socio
+from exportar_inscritos import exportar
+from hojas_inscritos import cargar_hojas
+from models import db, Actividad, Inscripcion
+
+
+def crear_actividades(dias, socios=2):
+    """Una actividad por día de junio de 2026, con `socios` inscritos en cada una"""
+    inscritos = [crear_socio(f'SOCIO {dias[0]} {i}', f'socio{dias[0]}_{i}') for i in range(socios)]
+    actividades = []
+    for dia in dias:
+        actividad = Actividad(nombre=f'TALLER {dia}', fecha=datetime(2026, 6, dia, 18), aforo_maximo=10,
+                              inscritos_count=socios)
+        db.session.add(actividad)
+        db.session.flush()
+        for socio in inscritos:
+            db.session.add(Inscripcion(user_id=socio.id, actividad_id=actividad.id))
+        actividades.append(actividad)
+    db.session.commit()
+    return actividades
+
+
+def leer_zip(datos):
+    with zipfile.ZipFile(io.BytesIO(datos)) as archivo_zip:
+        return {nombre: archivo_zip.read(nombre) for nombre in archivo_zip.namelist()}
+
+
+def test_zip_por_rango_de_fechas(app, admin_client):
+    actividades = crear_actividades([5, 6, 7, 9])
+    respuesta = admin_client.get('/admin/actividades/inscritos/zip?desde=2026-06-05&hasta=2026-06-07')
+    assert respuesta.status_code == 200
+    assert respuesta.headers['Content-Type'] == 'application/zip'
+    assert respuesta.is_streamed
+
+    pdfs = leer_zip(respuesta.get_data())
+    assert sorted(pdfs) == [f'inscritos_202606{dia:02d}_{actividad.id}_TALLER_{dia}.pdf'
+                            for dia, actividad in zip([5, 6, 7], actividades)]
+    assert all(contenido.startswith(b'%PDF') for contenido in pdfs.values())
+
+
+def test_zip_por_ids_reutiliza_las_hojas_guardadas(app, admin_client):
+    primera, segunda, _ = crear_actividades([5, 6, 7])
+    guardada = admin_client.get(f'/admin/actividades/{primera.id}/inscritos/pdf').get_data()
+
+    respuesta = admin_client.get(f'/admin/actividades/inscritos/zip?ids={primera.id},{segunda.id}')
+    pdfs = leer_zip(respuesta.get_data())
+    assert len(pdfs) == 2
+    assert pdfs[f'inscritos_20260605_{primera.id}_TALLER_5.pdf'] == guardada
+
+    # La hoja generada para el ZIP queda guardada para la descarga individual
+    assert [nombre for nombre in os.listdir(directorio_cache()) if nombre.startswith(f'inscritos_{segunda.id}_')]
+
+
+def test_consultas_no_crecen_con_las_actividades(app):
+    crear_actividades([1, 2])
+    with ContadorConsultas() as pocas:
+        cargar_hojas(desde=datetime(2026, 6, 1))
+    crear_actividades(range(3, 20))
+    with ContadorConsultas() as muchas:
+        hojas = cargar_hojas(desde=datetime(2026, 6, 1))
+    assert len(hojas) == 19
+    assert muchas.total == pocas.total
+
+
+def test_errores_de_criterios(app, admin_client, monkeypatch):
+    crear_actividades([5, 6])
+    for consulta in ('', '?ids=uno', '?desde=05/06/2026', '?desde=2027-01-01'):
+        assert admin_client.get('/admin/actividades/inscritos/zip' + consulta).status_code == 302
+
+    monkeypatch.setattr(hojas_inscritos, 'MAX_ACTIVIDADES', 1)
+    assert admin_client.get('/admin/actividades/inscritos/zip?desde=2026-06-01').status_code == 302
+
+
+def test_script_de_exportacion(app, tmp_path, monkeypatch):
+    arranques = []
+    original = hojas_inscritos.ProcessPoolExecutor
+
+    def anotar(**opciones):
+        arranques.append(opciones['mp_context'].get_start_method())
+        return original(**opciones)
+    monkeypatch.setattr(hojas_inscritos, 'ProcessPoolExecutor', anotar)
+
+    crear_actividades([5, 6, 7])
+    destino = tmp_path / 'hojas.zip'
+    assert exportar(str(destino), desde=datetime(2026, 6, 6), hasta=datetime(2026, 6, 7), procesos=2) == 2
+    assert len(leer_zip(destino.read_bytes())) == 2
+    # Los procesos no se crean con fork (el worker tiene otros hilos)
+    assert arranques and 'fork' not in arranques
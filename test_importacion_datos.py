@@ -0,0 +1,112 @@
+"""
+Tests de la importación en bloque de una exportación completa
+"""
+import io
+import json
+from datetime import datetime
+
+import trabajos_importacion
+from conftest import ContadorConsultas, crear_socio
+from importacion_datos import importar_volcado, resumen_rechazos
+from models import db, User, Actividad, Beneficiario, Contador, asignar_numeros_socio
+from versiones import GENERACION_ACTIVIDADES, leer_version, version_actividad
+
+
+def usuario(id, nombre_usuario, numero_socio=None):
+    return {'id': id, 'nombre': nombre_usuario.upper(), 'nombre_usuario': nombre_usuario, 'password_hash': 'x',
+            'rol': 'socio', 'fecha_alta': '2026-01-10T00:00:00', 'fecha_validez': '2026-12-31T23:59:59',
+            'numero_socio': numero_socio}
+
+
+def datos_de_prueba(inscripciones=()):
+    return {
+        'version': '2.0',
+        'usuarios': [usuario(10, 'ana'), usuario(11, 'luis', '0002'), {'id': 12, 'nombre': 'SIN USUARIO'},
+                     usuario(13, 'eva', '0001')],
+        'actividades': [{'id': 20, 'nombre': 'TALLER', 'fecha': '2026-06-05T18:00:00', 'aforo_maximo': 10},
+                        {'id': 21, 'nombre': 'SIN AFORO'}],
+        'beneficiarios': [{'id': 30, 'socio_id': 11, 'nombre': 'MARÍA', 'primer_apellido': 'LÓPEZ', 'ano_nacimiento': 2015,
+                           'numero_beneficiario': '0002-1'},
+                          {'id': 31, 'socio_id': 99, 'nombre': 'NADIE', 'primer_apellido': 'X', 'ano_nacimiento': 2015}],
+        'inscripciones': list(inscripciones) or [
+            {'id': 40, 'user_id': 11, 'actividad_id': 20},
+            {'id': 41, 'user_id': 11, 'actividad_id': 20, 'beneficiario_id': 30, 'asiste': True},
+            {'id': 42, 'user_id': 11, 'actividad_id': 20},
+            {'id': 43, 'user_id': 11, 'actividad_id': 21},
+            {'id': 44, 'user_id': 10, 'actividad_id': 20},
+        ],
+    }
+
+
+def test_importa_traduciendo_ids_y_rechaza_sin_abortar(app):
+    ana = crear_socio('ANA', 'ana', numero_socio='0001')
+    db.session.commit()
+
+    resultados = importar_volcado(datos_de_prueba())
+    db.session.commit()
+
+    cuentas = {tabla: (resultado.importados, resultado.rechazados) for tabla, resultado in resultados.items()}
+    assert cuentas['usuarios'] == (1, 3)
+    assert cuentas['actividades'] == (1, 1)
+    assert cuentas['beneficiarios'] == (1, 1)
+    assert cuentas['inscripciones'] == (3, 2)
+
+    luis = User.query.filter_by(nombre_usuario='luis').one()
+    assert luis.nombre_norm == 'LUIS'
+    maria = Beneficiario.query.filter_by(socio_id=luis.id).one()
+    assert maria.nombre_norm == 'MARIA LOPEZ'
+    taller = Actividad.query.one()
+    assert taller.inscritos_count == 3
+    # La inscripción de 'ana' (ya existente) se une a su usuario actual
+    assert {(inscripcion.user_id, inscripcion.beneficiario_id) for inscripcion in taller.inscripciones} == {
+        (luis.id, None), (luis.id, maria.id), (ana.id, None)
+    }
+
+    rechazos = resumen_rechazos(resultados)
+    assert 'ana: ya existe' in rechazos
+    assert 'eva: el número de socio 0001 ya existe' in rechazos
+    assert 'SIN AFORO: falta el campo' in rechazos
+
+
+def test_consultas_no_crecen_con_los_registros(app):
+    def inscripciones(cantidad):
+        return [{'id': i, 'user_id': 11, 'actividad_id': 20, 'beneficiario_id': 30 if i % 2 else None}
+                for i in range(cantidad)]
+
+    with ContadorConsultas() as pocas:
+        importar_volcado(datos_de_prueba(inscripciones(2)), limpiar=True)
+    db.session.rollback()
+    with ContadorConsultas() as muchas:
+        importar_volcado(datos_de_prueba(inscripciones(300)), limpiar=True)
+    assert muchas.total == pocas.total
+
+
+def test_limpiar_conserva_las_versiones(app):
+    actividad = Actividad(nombre='VIEJA', fecha=datetime(2026, 1, 1), aforo_maximo=5)
+    db.session.add(actividad)
+    db.session.commit()
+    asignar_numeros_socio()
+    db.session.commit()
+    generacion = leer_version(GENERACION_ACTIVIDADES)
+    version = leer_version(version_actividad(actividad.id))
+
+    importar_volcado(datos_de_prueba(), limpiar=True)
+    db.session.commit()
+
+    # Los ids se reutilizan: las versiones deben seguir subiendo para no servir datos guardados de antes
+    assert leer_version(GENERACION_ACTIVIDADES) > generacion
+    assert leer_version(version_actividad(actividad.id)) > version
+    assert db.session.get(Contador, 'numero_socio') is None
+
+
+def test_un_solo_mensaje_de_rechazos(app, admin_client):
+    archivo = io.BytesIO(json.dumps(datos_de_prueba()).encode('utf-8'))
+    respuesta = admin_client.post('/admin/importar-datos', data={'archivo': (archivo, 'datos.json')},
+                                  content_type='multipart/form-data')
+    trabajo_id = respuesta.headers['Location'].rsplit('/', 1)[-1]
+    trabajos_importacion._futuros[trabajo_id].result(timeout=30)
+
+    estado = admin_client.get(f'/admin/importaciones/{trabajo_id}/estado').get_json()
+    assert estado['estado'] == 'completado'
+    assert '3 usuarios, 1 actividades' in estado['mensaje']
+    assert len(estado['mensajes']) == 1 and estado['mensajes'][0].startswith('Registros no importados')
@@ -0,0 +1,74 @@
+"""
+Tests de índices: las consultas más frecuentes no deben recorrer tablas completas
+(EXPLAIN QUERY PLAN de SQLite)
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, inspect
+
+from models import db, User, Actividad, Inscripcion, Beneficiario, SolicitudSocio, BeneficiarioSolicitud
+
+
+def plan_de(consulta):
+    """Ejecuta la consulta, captura el SQL emitido y devuelve su EXPLAIN QUERY PLAN"""
+    capturadas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        capturadas.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        consulta()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+    assert capturadas, 'La consulta no emitió SQL'
+    statement, parameters = capturadas[-1]
+    with db.engine.connect() as conn:
+        filas = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    return [fila[-1] for fila in filas]
+
+
+def recorridos_completos(plan):
+    """Pasos del plan que leen una tabla entera sin usar índice"""
+    return [paso for paso in plan if paso.startswith('SCAN') and 'INDEX' not in paso]
+
+
+ahora = datetime.utcnow()
+
+CONSULTAS_FRECUENTES = {
+    'inscripciones por actividad': lambda: Inscripcion.query.filter_by(actividad_id=1).all(),
+    'inscripciones por usuario': lambda: Inscripcion.query.filter_by(user_id=1).all(),
+    'inscripciones por beneficiario': lambda: Inscripcion.query.filter_by(beneficiario_id=1).first(),
+    'inscripción de beneficiario en actividad': lambda: Inscripcion.query.filter_by(beneficiario_id=1, actividad_id=1).first(),
+    'beneficiarios de un socio': lambda: Beneficiario.query.filter_by(socio_id=1).order_by(Beneficiario.nombre).all(),
+    'socios por vencer': lambda: User.query.filter(
+        User.rol == 'socio',
+        User.fecha_validez <= ahora + timedelta(days=30),
+        User.fecha_validez > ahora
+    ).order_by(User.fecha_validez).all(),
+    'actividades próximas': lambda: Actividad.query.filter(Actividad.fecha > ahora).order_by(Actividad.fecha).all(),
+    'solicitudes por estado': lambda: SolicitudSocio.query.filter_by(estado='por_confirmar').order_by(SolicitudSocio.fecha_solicitud.desc()).all(),
+    'beneficiarios de una solicitud': lambda: BeneficiarioSolicitud.query.filter_by(solicitud_id=1).all(),
+}
+
+
+@pytest.mark.parametrize('nombre', list(CONSULTAS_FRECUENTES))
+def test_consulta_frecuente_usa_indice(app, nombre):
+    plan = plan_de(CONSULTAS_FRECUENTES[nombre])
+    assert not recorridos_completos(plan), f'{nombre}: {plan}'
+
+
+def test_indices_se_crean_en_bd_existente(app):
+    """Una BD creada antes de declarar los índices los recibe al arrancar la aplicación"""
+    from app import create_app
+
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('DROP INDEX ix_inscripciones_actividad_id')
+        conn.exec_driver_sql('DROP INDEX ix_actividades_fecha')
+
+    create_app()
+
+    assert 'ix_inscripciones_actividad_id' in {i['name'] for i in inspect(db.engine).get_indexes('inscripciones')}
+    assert 'ix_actividades_fecha' in {i['name'] for i in inspect(db.engine).get_indexes('actividades')}
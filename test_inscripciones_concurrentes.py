@@ -0,0 +1,39 @@
+"""
+Test de concurrencia: muchas inscripciones simultáneas nunca superan el aforo
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models import db, Actividad, Inscripcion
+from conftest import crear_socio, login
+
+SOCIOS = 300
+AFORO = 40
+
+
+def test_inscripciones_simultaneas_respetan_el_aforo(app):
+    actividad = Actividad(nombre='Excursión', descripcion='Plazas limitadas',
+                          fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=AFORO)
+    db.session.add(actividad)
+    socios = [crear_socio(f'SOCIO {i}', f'socio{i}') for i in range(SOCIOS)]
+    db.session.commit()
+    actividad_id = actividad.id
+    socio_ids = [socio.id for socio in socios]
+    url = f'/socios/actividades/{actividad_id}/inscribir'
+
+    clientes = []
+    for socio in socios:
+        clientes.append(login(app.test_client(), socio))
+
+    def inscribir(cliente):
+        return cliente.post(url, data={'beneficiario_id': 'socio'}).status_code
+
+    with ThreadPoolExecutor(max_workers=32) as ejecutor:
+        codigos = list(ejecutor.map(inscribir, clientes))
+
+    assert all(codigo == 302 for codigo in codigos)
+    db.session.expire_all()
+    inscritos = Inscripcion.query.filter_by(actividad_id=actividad_id).count()
+    assert inscritos == AFORO
+    assert db.session.get(Actividad, actividad_id).inscritos_count == AFORO
+    assert Inscripcion.query.filter(Inscripcion.user_id.in_(socio_ids)).count() == AFORO
@@ -0,0 +1,145 @@
+"""
+Tests de la lista de espera: alta, posición y promoción automática al cancelar
+"""
+from datetime import datetime, timedelta
+
+from models import db, Actividad, Beneficiario, Inscripcion, ListaEspera, posiciones_lista_espera, promover_lista_espera
+from conftest import ContadorConsultas, crear_socio, login
+
+
+def actividad_completa(app, aforo=1, **kwargs):
+    """Actividad con `aforo` plazas ya ocupadas por otros socios; devuelve (actividad, inscritos)"""
+    actividad = Actividad(nombre='Excursión', fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=aforo, **kwargs)
+    db.session.add(actividad)
+    inscritos = [crear_socio(f'INSCRITO {i}', f'inscrito{i}') for i in range(aforo)]
+    db.session.flush()
+    for socio in inscritos:
+        db.session.add(Inscripcion(user_id=socio.id, actividad_id=actividad.id))
+    actividad.inscritos_count = aforo
+    db.session.commit()
+    return actividad, inscritos
+
+
+def apuntar(app, socio, actividad):
+    cliente = login(app.test_client(), socio)
+    return cliente.post(f'/socios/actividades/{actividad.id}/lista-espera', data={'beneficiario_id': 'socio'})
+
+
+def test_alta_y_posicion(app):
+    actividad, _ = actividad_completa(app)
+    primero = crear_socio('ANA', 'ana')
+    segundo = crear_socio('EVA', 'eva')
+    db.session.commit()
+
+    assert apuntar(app, primero, actividad).status_code == 302
+    assert apuntar(app, segundo, actividad).status_code == 302
+    # Apuntarse dos veces no duplica la entrada
+    apuntar(app, segundo, actividad)
+
+    assert ListaEspera.query.filter_by(actividad_id=actividad.id).count() == 2
+    assert posiciones_lista_espera(segundo.id) == {(actividad.id, None): 2}
+
+    cliente = login(app.test_client(), segundo)
+    respuesta = cliente.get('/socios/lista-espera/posiciones')
+    assert respuesta.get_json() == {'posiciones': [{'actividad_id': actividad.id, 'beneficiario_id': None, 'posicion': 2}]}
+    assert 'posición 2' in cliente.get('/socios/actividades').get_data(as_text=True)
+    assert 'Posición 2' in cliente.get('/socios/dashboard').get_data(as_text=True)
+
+
+def test_no_se_apunta_si_quedan_plazas(app):
+    actividad = Actividad(nombre='Taller', fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=5)
+    socio = crear_socio('ANA', 'ana')
+    db.session.add(actividad)
+    db.session.commit()
+
+    apuntar(app, socio, actividad)
+    assert ListaEspera.query.count() == 0
+
+
+def test_cancelar_promueve_al_primero(app):
+    actividad, (inscrito,) = actividad_completa(app)
+    primero = crear_socio('ANA', 'ana')
+    segundo = crear_socio('EVA', 'eva')
+    db.session.commit()
+    apuntar(app, primero, actividad)
+    apuntar(app, segundo, actividad)
+
+    cliente = login(app.test_client(), inscrito)
+    assert cliente.post(f'/socios/actividades/{actividad.id}/cancelar', data={'beneficiario_id': 'socio'}).status_code == 302
+
+    db.session.expire_all()
+    inscritos = {insc.user_id for insc in Inscripcion.query.filter_by(actividad_id=actividad.id)}
+    assert inscritos == {primero.id}
+    assert db.session.get(Actividad, actividad.id).inscritos_count == 1
+    assert posiciones_lista_espera(primero.id) == {}
+    assert posiciones_lista_espera(segundo.id) == {(actividad.id, None): 1}
+
+
+def test_promocion_salta_a_quien_no_cumple_la_edad(app):
+    actividad, (inscrito,) = actividad_completa(app, edad_maxima=60)
+    joven = crear_socio('ANA', 'ana', ano_nacimiento=datetime.now().year - 30)
+    db.session.commit()
+    apuntar(app, joven, actividad)
+    # Entrada de alguien que ya no cumple la edad (p. ej. se corrigió su año de nacimiento)
+    mayor = crear_socio('EVA', 'eva', ano_nacimiento=datetime.now().year - 70)
+    db.session.flush()
+    db.session.add(ListaEspera(user_id=mayor.id, actividad_id=actividad.id, fecha_alta=datetime.utcnow()))
+    db.session.execute(db.update(ListaEspera).where(ListaEspera.user_id == mayor.id).values(id=0))
+    db.session.commit()
+
+    login(app.test_client(), inscrito).post(f'/socios/actividades/{actividad.id}/cancelar', data={'beneficiario_id': 'socio'})
+
+    db.session.expire_all()
+    assert {insc.user_id for insc in Inscripcion.query.filter_by(actividad_id=actividad.id)} == {joven.id}
+    assert posiciones_lista_espera(mayor.id) == {(actividad.id, None): 1}
+
+
+def test_promocion_lee_las_inscripciones_una_vez(app):
+    actividad = Actividad(nombre='Excursión', fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=1, edad_maxima=60)
+    db.session.add(actividad)
+    # Varias entradas que se saltan por la edad antes de la que se promueve
+    mayores = [crear_socio(f'MAYOR {i}', f'mayor{i}', ano_nacimiento=datetime.now().year - 70) for i in range(5)]
+    joven = crear_socio('ANA', 'ana', ano_nacimiento=datetime.now().year - 30)
+    db.session.flush()
+    for socio in mayores + [joven]:
+        db.session.add(ListaEspera(user_id=socio.id, actividad_id=actividad.id, fecha_alta=datetime.utcnow()))
+        db.session.flush()
+    db.session.commit()
+
+    with ContadorConsultas() as consultas:
+        promovidas = promover_lista_espera(actividad)
+    db.session.commit()
+    assert [entrada.user_id for entrada in promovidas] == [joven.id]
+    assert len([s for s in consultas.sentencias if s.lstrip().startswith('SELECT') and 'FROM inscripciones' in s]) == 1
+
+
+def test_ampliar_aforo_promueve(app, admin_client):
+    actividad, _ = actividad_completa(app)
+    esperando = [crear_socio(f'ESPERA {i}', f'espera{i}') for i in range(3)]
+    db.session.commit()
+    for socio in esperando:
+        apuntar(app, socio, actividad)
+
+    admin_client.post(f'/admin/actividades/{actividad.id}/editar', data={
+        'nombre': actividad.nombre, 'descripcion': '', 'aforo_maximo': '3',
+        'fecha': actividad.fecha.strftime('%Y-%m-%dT%H:%M'),
+    })
+
+    db.session.expire_all()
+    assert Inscripcion.query.filter_by(actividad_id=actividad.id).count() == 3
+    assert db.session.get(Actividad, actividad.id).inscritos_count == 3
+    assert posiciones_lista_espera(esperando[2].id) == {(actividad.id, None): 1}
+
+
+def test_socio_inscrito_puede_apuntar_a_un_beneficiario(app):
+    actividad, (inscrito,) = actividad_completa(app)
+    db.session.add(Beneficiario(socio_id=inscrito.id, nombre='PABLO', primer_apellido='GARCIA', ano_nacimiento=2015,
+                                fecha_validez=inscrito.fecha_validez))
+    db.session.commit()
+
+    pagina = login(app.test_client(), inscrito).get('/socios/actividades').get_data(as_text=True)
+    assert 'Tú estás inscrito' in pagina
+    assert f'dropdownEspera{actividad.id}' in pagina
+    assert 'PABLO GARCIA' in pagina
+    # El propio socio ya está inscrito: no se le ofrece la lista de espera
+    assert f"Yo ({inscrito.nombre})" not in pagina
@@ -0,0 +1,78 @@
+"""
+Tests de las columnas nombre_norm y de la búsqueda por prefijo sin acentos
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db, User, Beneficiario, SolicitudSocio, rellenar_nombres_normalizados
+from normalizacion import normalizar, filtro_prefijo
+from conftest import crear_socio
+from test_indices import plan_de
+
+
+def crear_solicitud(nombre, primer_apellido, segundo_apellido):
+    solicitud = SolicitudSocio(nombre=nombre, primer_apellido=primer_apellido, segundo_apellido=segundo_apellido,
+                               movil='600000000', miembros_unidad_familiar=1, forma_de_pago='bizum',
+                               calle='MAYOR', numero='1', poblacion='ALMERIA')
+    db.session.add(solicitud)
+    return solicitud
+
+
+def test_normalizar():
+    assert normalizar('  Martínez ', 'López', None) == 'MARTINEZ LOPEZ'
+    assert normalizar('Núñez  Ibáñez') == 'NUÑEZ IBAÑEZ'
+    assert normalizar(None, '') == ''
+
+
+def test_nombre_norm_se_rellena_al_guardar(app):
+    socio = crear_socio('Martínez López Ana', 'ana')
+    db.session.flush()
+    beneficiario = Beneficiario(socio_id=socio.id, nombre='José', primer_apellido='Martínez',
+                                ano_nacimiento=2015, fecha_validez=datetime(2030, 12, 31))
+    db.session.add(beneficiario)
+    db.session.commit()
+    assert socio.nombre_norm == 'MARTINEZ LOPEZ ANA'
+    assert beneficiario.nombre_norm == 'JOSE MARTINEZ'
+
+    beneficiario.segundo_apellido = 'Sáez'
+    db.session.commit()
+    assert beneficiario.nombre_norm == 'JOSE MARTINEZ SAEZ'
+
+
+def test_rellenar_por_lotes(app):
+    for i in range(7):
+        crear_socio(f'Pérez {i}', f'perez{i}')
+    db.session.commit()
+    with db.engine.begin() as conn:
+        conn.execute(text('UPDATE users SET nombre_norm = NULL'))
+    db.session.expire_all()
+
+    assert rellenar_nombres_normalizados(lote=3) == User.query.count()
+    assert User.query.filter(User.nombre_norm.is_(None)).count() == 0
+    assert User.query.filter_by(nombre_usuario='perez3').one().nombre_norm == 'PEREZ 3'
+
+
+def test_prefijo_usa_el_indice(app):
+    crear_socio('Martínez López Ana', 'ana')
+    crear_socio('Martín Ruiz Eva', 'eva')
+    crear_socio('Marta Gil Luz', 'luz')
+    db.session.commit()
+
+    encontrados = User.query.filter(filtro_prefijo(User.nombre_norm, 'martin')).all()
+    assert sorted(socio.nombre_usuario for socio in encontrados) == ['ana', 'eva']
+
+    plan = plan_de(lambda: User.query.filter(filtro_prefijo(User.nombre_norm, 'martin')).all())
+    assert any('ix_users_nombre_norm' in paso and paso.startswith('SEARCH') for paso in plan), plan
+
+
+def test_buscar_solicitudes_sin_acentos(admin_client):
+    crear_solicitud('María', 'Núñez', 'Gómez')
+    crear_solicitud('Pedro', 'Sanz', 'Ruiz')
+    db.session.commit()
+
+    respuesta = admin_client.get('/admin/solicitudes-socios?estado=todas&search=maria nu')
+    html = respuesta.get_data(as_text=True)
+    assert respuesta.status_code == 200
+    assert 'Núñez' in html
+    assert 'Sanz' not in html
@@ -0,0 +1,83 @@
+"""
+Tests del contador de números de socio y de beneficiario
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from models import (db, User, Beneficiario, Contador,
+                    asignar_numeros_socio, asignar_numeros_beneficiario, siguiente_numero_socio)
+from conftest import ContadorConsultas, crear_socio, crear_solicitud, login
+
+SOLICITUDES = 30
+
+
+def test_continua_desde_el_mayor_numero_existente(app):
+    # Ordenado como texto, '9999' iría después de '10000'
+    crear_socio('ANA', 'ana', numero_socio='9999')
+    crear_socio('EVA', 'eva', numero_socio='10000')
+    crear_socio('LUIS', 'luis', numero_socio='ABC')
+    db.session.commit()
+
+    assert siguiente_numero_socio() == '10001'
+    assert asignar_numeros_socio() == ['10001']
+    assert asignar_numeros_socio(3) == ['10002', '10003', '10004']
+    assert siguiente_numero_socio() == '10005'
+
+
+def test_asignacion_es_una_escritura_indexada(app):
+    asignar_numeros_socio()
+    db.session.commit()
+    for i in range(50):
+        crear_socio(f'SOCIO {i}', f'socio{i}', numero_socio=f'{i + 2:04d}')
+    db.session.commit()
+
+    with ContadorConsultas() as consultas:
+        asignar_numeros_socio(5)
+    assert consultas.total == 2
+    assert not any('users' in sentencia for sentencia in consultas.sentencias)
+
+
+def test_numeros_de_beneficiario_por_socio(app):
+    socio = crear_socio('ANA', 'ana', numero_socio='0007')
+    sin_numero = crear_socio('EVA', 'eva')
+    db.session.flush()
+    db.session.add(Beneficiario(socio_id=socio.id, nombre='HIJO', primer_apellido='PRUEBA', ano_nacimiento=2015,
+                                fecha_validez=socio.fecha_validez, numero_beneficiario='0007-2'))
+    db.session.commit()
+
+    assert asignar_numeros_beneficiario(socio, 2) == ['0007-3', '0007-4']
+    assert asignar_numeros_beneficiario(socio) == ['0007-5']
+    assert asignar_numeros_beneficiario(sin_numero, 2) == [None, None]
+
+
+def test_confirmar_solicitud_asigna_numeros(app, admin_client):
+    crear_socio('ANA', 'ana', numero_socio='0041')
+    solicitud = crear_solicitud(1, beneficiarios=2)
+    db.session.commit()
+
+    respuesta = admin_client.post(f'/admin/solicitudes-socios/{solicitud.id}/confirmar')
+    assert respuesta.status_code == 302
+
+    socio = User.query.filter_by(numero_socio='0042').one()
+    numeros = sorted(b.numero_beneficiario for b in Beneficiario.query.filter_by(socio_id=socio.id))
+    assert numeros == ['0042-1', '0042-2']
+    assert db.session.get(Contador, 'numero_socio').valor == 42
+
+
+def test_confirmaciones_simultaneas_no_repiten_numero(app):
+    admin = User.query.filter_by(rol='directiva').first()
+    crear_socio('ANA', 'ana', numero_socio='0001')
+    solicitud_ids = [crear_solicitud(i).id for i in range(SOLICITUDES)]
+    db.session.commit()
+
+    clientes = [login(app.test_client(), admin) for _ in solicitud_ids]
+
+    def confirmar(cliente, solicitud_id):
+        return cliente.post(f'/admin/solicitudes-socios/{solicitud_id}/confirmar').status_code
+
+    with ThreadPoolExecutor(max_workers=16) as ejecutor:
+        codigos = list(ejecutor.map(confirmar, clientes, solicitud_ids))
+
+    assert all(codigo == 302 for codigo in codigos)
+    db.session.expire_all()
+    numeros = [fila.numero_socio for fila in db.session.query(User.numero_socio).filter(User.numero_socio.isnot(None))]
+    assert sorted(numeros) == [f'{n:04d}' for n in range(1, SOLICITUDES + 2)]
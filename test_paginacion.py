@@ -0,0 +1,102 @@
+"""
+Tests de la paginación por clave (cursores, empates en la ordenación y navegación hacia atrás)
+"""
+import base64
+from datetime import datetime, timedelta
+
+from models import db, Actividad
+from paginacion import codificar_cursor, decodificar_cursor, paginar
+
+COLUMNAS = [Actividad.fecha, Actividad.id]
+
+
+def clave(actividad):
+    return (actividad.fecha, actividad.id)
+
+
+def crear_actividades():
+    """Siete actividades en tres fechas: la fecha se repite y desempata el id"""
+    base = datetime(2026, 5, 1, 10, 0)
+    fechas = [base, base + timedelta(days=1), base, base + timedelta(days=2), base + timedelta(days=1), base, base + timedelta(days=2)]
+    actividades = [Actividad(nombre=f'ACTIVIDAD {i}', fecha=fecha, aforo_maximo=10) for i, fecha in enumerate(fechas)]
+    db.session.add_all(actividades)
+    db.session.commit()
+    return actividades
+
+
+def ids(pagina):
+    return [actividad.id for actividad in pagina]
+
+
+def recorrer(descendente):
+    """Avanza hasta el final y vuelve al principio; devuelve las páginas en cada sentido"""
+    paginas, despues = [], None
+    while True:
+        pagina = paginar(Actividad.query, COLUMNAS, clave, descendente=descendente, despues=despues, por_pagina=3)
+        paginas.append(pagina)
+        if pagina.siguiente is None:
+            break
+        despues = pagina.siguiente
+    vuelta = [paginas[-1]]
+    while vuelta[-1].anterior is not None:
+        vuelta.append(paginar(Actividad.query, COLUMNAS, clave, descendente=descendente,
+                              antes=vuelta[-1].anterior, por_pagina=3))
+    return paginas, vuelta
+
+
+def test_avanza_y_retrocede_con_empates(app):
+    actividades = crear_actividades()
+    for descendente in (False, True):
+        esperado = [a.id for a in sorted(actividades, key=clave, reverse=descendente)]
+        paginas, vuelta = recorrer(descendente)
+
+        assert [ids(pagina) for pagina in paginas] == [esperado[0:3], esperado[3:6], esperado[6:7]]
+        assert all(pagina.total == 7 for pagina in paginas)
+        # Primera página sin anterior; la última sin siguiente
+        assert paginas[0].anterior is None
+        assert paginas[-1].siguiente is None and paginas[-1].anterior is not None
+
+        # Hacia atrás se obtienen las mismas páginas, en el mismo orden interno
+        assert [ids(pagina) for pagina in reversed(vuelta)] == [ids(pagina) for pagina in paginas]
+        assert vuelta[-1].anterior is None and vuelta[-1].siguiente is not None
+
+
+def test_pagina_unica_y_listado_vacio(app):
+    pagina = paginar(Actividad.query, COLUMNAS, clave, por_pagina=3)
+    assert ids(pagina) == [] and pagina.siguiente is None and pagina.anterior is None and pagina.total == 0
+
+    crear_actividades()
+    pagina = paginar(Actividad.query, COLUMNAS, clave, por_pagina=7)
+    assert len(pagina) == 7 and pagina.siguiente is None and pagina.anterior is None
+
+    # Un cursor tras la última fila da una página vacía, sin cursores
+    ultima = max(Actividad.query.all(), key=clave)
+    pagina = paginar(Actividad.query, COLUMNAS, clave, despues=codificar_cursor(clave(ultima)), por_pagina=3)
+    assert ids(pagina) == [] and pagina.siguiente is None and pagina.anterior is None
+
+
+def test_cursor_con_fecha_ida_y_vuelta():
+    fecha = datetime(2026, 5, 1, 10, 30, 15, 123456)
+    assert decodificar_cursor(codificar_cursor((fecha, 42)), COLUMNAS) == [fecha, 42]
+    assert decodificar_cursor(codificar_cursor((None, 42)), COLUMNAS) == [None, 42]
+    assert decodificar_cursor(codificar_cursor(('ÁNGELA', 3)), [Actividad.nombre, Actividad.id]) == ['ÁNGELA', 3]
+
+
+def test_cursores_no_validos(app):
+    crear_actividades()
+    primera = ids(paginar(Actividad.query, COLUMNAS, clave, por_pagina=3))
+
+    def token(texto):
+        return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+    no_validos = [
+        '%%%', 'AAAA', token('no es json'), token('{"a": 1}'), token('[1]'),
+        token('["2026-05-01T10:00:00", 1, 2]'), token('["no es una fecha", 1]'), token('[5, 1]'),
+    ]
+    for cursor in no_validos:
+        assert decodificar_cursor(cursor, COLUMNAS) is None
+        # Un cursor no válido se ignora: se muestra la primera página
+        pagina = paginar(Actividad.query, COLUMNAS, clave, despues=cursor, por_pagina=3)
+        assert ids(pagina) == primera and pagina.anterior is None
+        pagina = paginar(Actividad.query, COLUMNAS, clave, antes=cursor, por_pagina=3)
+        assert ids(pagina) == primera and pagina.anterior is None
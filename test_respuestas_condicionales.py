@@ -0,0 +1,95 @@
+"""
+Tests de las respuestas condicionales (ETag / 304) de las páginas y los PDF
+"""
+from datetime import datetime, timedelta
+
+from conftest import crear_socio, login
+from models import db, Actividad, Beneficiario, Inscripcion
+
+
+def revalidar(cliente, url):
+    """Pide la URL y vuelve a pedirla con su ETag; devuelve (primera, segunda)"""
+    primera = cliente.get(url)
+    assert primera.status_code == 200
+    assert primera.headers['ETag']
+    segunda = cliente.get(url, headers={'If-None-Match': primera.headers['ETag']})
+    return primera, segunda
+
+
+def preparar(app):
+    actividad = Actividad(nombre='EXCURSION', fecha=datetime.utcnow() + timedelta(days=7), aforo_maximo=10)
+    db.session.add(actividad)
+    socio = crear_socio('ANA', 'ana')
+    otro = crear_socio('EVA', 'eva')
+    db.session.commit()
+    return actividad, login(app.test_client(), socio), socio, login(app.test_client(), otro)
+
+
+def test_listado_de_actividades_304_hasta_que_cambia(app):
+    actividad, cliente, _, otro = preparar(app)
+    url = '/socios/actividades'
+
+    primera, segunda = revalidar(cliente, url)
+    assert segunda.status_code == 304
+    assert segunda.get_data() == b''
+    assert primera.headers['Cache-Control'] == 'private, no-cache'
+    assert 'Cookie' in primera.headers['Vary']
+    assert segunda.headers['ETag'] == primera.headers['ETag']
+
+    # Cada socio tiene su propio ETag
+    assert otro.get(url).headers['ETag'] != primera.headers['ETag']
+
+    # La inscripción de otro socio cambia las plazas libres
+    otro.post(f'/socios/actividades/{actividad.id}/inscribir', data={'beneficiario_id': 'socio'})
+    tercera = cliente.get(url, headers={'If-None-Match': primera.headers['ETag']})
+    assert tercera.status_code == 200
+    assert '1/10' in tercera.get_data(as_text=True)
+
+
+def test_mensajes_flash_pendientes_no_llevan_etag(app):
+    actividad, cliente, _, _ = preparar(app)
+    # Inscribir redirige al listado con un mensaje
+    cliente.post(f'/socios/actividades/{actividad.id}/inscribir', data={'beneficiario_id': 'socio'})
+    respuesta = cliente.get('/socios/actividades')
+    assert respuesta.status_code == 200
+    assert 'ETag' not in respuesta.headers
+    assert 'ETag' in cliente.get('/socios/actividades').headers
+
+
+def test_detalle_cambia_con_la_familia(app):
+    actividad, cliente, socio, _ = preparar(app)
+    url = f'/actividades/{actividad.id}'
+
+    primera, segunda = revalidar(cliente, url)
+    assert segunda.status_code == 304
+
+    db.session.add(Beneficiario(socio_id=socio.id, nombre='HIJO', primer_apellido='PRUEBA', ano_nacimiento=2015,
+                                fecha_validez=socio.fecha_validez))
+    db.session.commit()
+    assert cliente.get(url, headers={'If-None-Match': primera.headers['ETag']}).status_code == 200
+
+
+def test_pdf_de_inscritos_cambia_con_la_asistencia(app, admin_client):
+    actividad, _, socio, _ = preparar(app)
+    inscripcion = Inscripcion(user_id=socio.id, actividad_id=actividad.id)
+    db.session.add(inscripcion)
+    db.session.commit()
+    url = f'/admin/actividades/{actividad.id}/inscritos/pdf'
+
+    primera, segunda = revalidar(admin_client, url)
+    assert primera.headers['Content-Type'] == 'application/pdf'
+    assert segunda.status_code == 304
+
+    admin_client.post(f'/admin/actividades/{actividad.id}/marcar-asistencia/{inscripcion.id}')
+    admin_client.get(f'/admin/actividades/{actividad.id}/inscritos')  # consume el mensaje flash
+    assert admin_client.get(url, headers={'If-None-Match': primera.headers['ETag']}).status_code == 200
+
+
+def test_pdf_de_actividades(app, admin_client):
+    preparar(app)
+    primera, segunda = revalidar(admin_client, '/admin/actividades/pdf')
+    assert segunda.status_code == 304
+
+    db.session.add(Actividad(nombre='TALLER', fecha=datetime.utcnow() + timedelta(days=3), aforo_maximo=5))
+    db.session.commit()
+    assert admin_client.get('/admin/actividades/pdf', headers={'If-None-Match': primera.headers['ETag']}).status_code == 200
@@ -0,0 +1,45 @@
+"""
+Tests del listado de solicitudes (admin.solicitudes_socios) y de la asignación de nombres de usuario
+"""
+from conftest import ContadorConsultas, crear_socio, crear_solicitud
+from models import db, asignar_nombres_usuario
+
+
+def _consultas_listado(client):
+    with ContadorConsultas() as consultas:
+        response = client.get('/admin/solicitudes-socios')
+    assert response.status_code == 200
+    return consultas.total
+
+
+def test_listado_numero_de_consultas_constante(app, admin_client):
+    for i in range(5):
+        crear_solicitud(i)
+    db.session.commit()
+    consultas_pocas = _consultas_listado(admin_client)
+
+    for i in range(5, 200):
+        crear_solicitud(i)
+    db.session.commit()
+    assert _consultas_listado(admin_client) == consultas_pocas
+
+
+def test_sufijos_libres(app):
+    crear_socio('ANA', 'anapt1980', numero_socio='0001')
+    crear_socio('ANA', 'anapt19801', numero_socio='0002')
+    crear_socio('ANA', 'anapt19803', numero_socio='0003')
+    primera = crear_solicitud(1, nombre='Ana')
+    segunda = crear_solicitud(2, nombre='Ana')
+    otra = crear_solicitud(3, nombre='Eva')
+    db.session.commit()
+
+    assert asignar_nombres_usuario([primera, segunda, otra]) == ['anapt19802', 'anapt19804', 'evapt1980']
+    assert asignar_nombres_usuario([]) == []
+
+
+def test_nombre_con_comodines_de_like(app):
+    crear_socio('ANA', 'a_apt1980')
+    solicitud = crear_solicitud(1, nombre='a%a')
+    db.session.commit()
+
+    assert asignar_nombres_usuario([solicitud]) == ['a%apt1980']
@@ -0,0 +1,153 @@
+"""
+Tests de las importaciones en segundo plano y de su estado
+"""
+import io
+import json
+import os
+import sqlite3
+from concurrent.futures import Future
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import importacion_datos
+import trabajos_importacion
+from conftest import login
+from cache_pdf import directorio_cache, guardar_pdf
+from models import db, User, Actividad
+from versiones import GENERACION_ACTIVIDADES, huella, leer_version
+
+
+def esperar(respuesta):
+    """Espera a que termine el trabajo encolado por la petición y devuelve su id"""
+    assert respuesta.status_code == 302
+    trabajo_id = respuesta.headers['Location'].rsplit('/', 1)[-1]
+    trabajos_importacion._futuros[trabajo_id].result(timeout=30)
+    db.session.rollback()
+    return trabajo_id
+
+
+def subir(cliente, url, contenido, nombre, **campos):
+    return cliente.post(url, data={'archivo': (io.BytesIO(contenido), nombre), **campos},
+                        content_type='multipart/form-data')
+
+
+def test_progreso_por_tabla_en_disco(app, admin_client, monkeypatch):
+    monkeypatch.setattr(importacion_datos, 'LOTE', 2)
+    monkeypatch.setattr(trabajos_importacion, 'LOTE', 2)
+    usuarios = [{'id': i, 'nombre': f'SOCIO {i}', 'nombre_usuario': f'socio{i}', 'password_hash': 'x', 'rol': 'socio'}
+                for i in range(7)]
+    guardados = []
+    guardar = trabajos_importacion._Trabajo.guardar
+
+    def anotar(trabajo, **cambios):
+        guardar(trabajo, **cambios)
+        guardados.append(json.loads(json.dumps(trabajo.estado)))
+    monkeypatch.setattr(trabajos_importacion._Trabajo, 'guardar', anotar)
+
+    contenido = json.dumps({'version': '1.0', 'usuarios': usuarios, 'actividades': []}).encode('utf-8')
+    trabajo_id = esperar(subir(admin_client, '/admin/importar-datos', contenido, 'datos.json'))
+
+    estado = admin_client.get(f'/admin/importaciones/{trabajo_id}/estado').get_json()
+    assert estado['estado'] == 'completado'
+    assert estado['tablas']['usuarios'] == {'leidos': 7, 'procesados': 7, 'importados': 7, 'rechazados': 0, 'motivos': []}
+    assert User.query.filter(User.nombre_usuario.like('socio%')).count() == 7
+    # El progreso se guarda mientras avanza, no solo al final
+    procesados = [e['tablas']['usuarios']['procesados'] for e in guardados if 'usuarios' in e['tablas']]
+    assert {2, 4, 6} <= set(procesados)
+    # Solo queda el estado: el archivo subido y los temporales se borran
+    directorio = os.path.join(trabajos_importacion.directorio_persistente('importaciones'), trabajo_id)
+    assert os.listdir(directorio) == ['estado.json']
+
+    assert admin_client.get(f'/admin/importaciones/{trabajo_id}').status_code == 200
+
+
+def test_archivo_no_valido(app, admin_client):
+    trabajo_id = esperar(subir(admin_client, '/admin/importar-datos', b'{"version": "1.0", "usuarios": [{"id"',
+                               'datos.json'))
+    estado = trabajos_importacion.leer_estado(trabajo_id)
+    assert estado['estado'] == 'error'
+    assert estado['mensaje'] == 'El archivo no es una exportación válida (NDJSON o JSON).'
+
+
+def test_trabajo_interrumpido_se_da_por_fallido(app, admin_client):
+    # Estado que dejó a medias un worker que ya no existe
+    trabajo_id = 'b' * 32
+    directorio = os.path.join(trabajos_importacion.directorio_persistente('importaciones'), trabajo_id)
+    os.makedirs(directorio)
+    trabajo = trabajos_importacion._Trabajo(directorio, {'id': trabajo_id, 'tipo': 'datos', 'archivo': 'datos.json',
+                                                         'estado': 'en_curso', 'fase': 'importación', 'tablas': {},
+                                                         'mensaje': None, 'mensajes': []})
+    trabajo.guardar()
+    assert admin_client.get(f'/admin/importaciones/{trabajo_id}/estado').get_json()['estado'] == 'en_curso'
+
+    hace_rato = (datetime.now() - trabajos_importacion.SIN_NOTICIAS - timedelta(minutes=1)).isoformat(timespec='seconds')
+    trabajo.estado['actualizado'] = hace_rato
+    trabajos_importacion.escribir_json(os.path.join(directorio, trabajos_importacion.ESTADO), trabajo.estado)
+    estado = admin_client.get(f'/admin/importaciones/{trabajo_id}/estado').get_json()
+    assert estado['estado'] == 'error'
+    assert 'se ha interrumpido' in estado['mensaje']
+
+    # Si corre en este proceso sigue en curso aunque tarde en anotar progreso
+    trabajos_importacion._futuros[trabajo_id] = Future()
+    try:
+        assert trabajos_importacion.leer_estado(trabajo_id)['estado'] == 'en_curso'
+    finally:
+        del trabajos_importacion._futuros[trabajo_id]
+
+
+def test_estado_de_un_trabajo_que_no_existe(app, admin_client):
+    assert admin_client.get('/admin/importaciones/' + 'a' * 32 + '/estado').status_code == 404
+    assert admin_client.get('/admin/importaciones/../estado').status_code == 404
+
+
+def test_reemplazar_base_de_datos(app):
+    jmurillo = User.query.filter_by(nombre_usuario='jmurillo').one()
+    cliente = login(app.test_client(), jmurillo)
+
+    trabajo_id = esperar(subir(cliente, '/admin/importar-base-datos', b'no es sqlite', 'copia.db'))
+    assert trabajos_importacion.leer_estado(trabajo_id)['mensaje'] == 'El archivo no parece ser un archivo SQLite válido.'
+
+    # Copia de la BD actual con un cambio, para comprobar que se usa la subida
+    db_path = db.engine.url.database
+    copia = db_path + '.copia'
+    with closing(sqlite3.connect(db_path)) as origen, closing(sqlite3.connect(copia)) as destino:
+        origen.backup(destino)
+        destino.execute("UPDATE users SET nombre = 'DE LA COPIA' WHERE nombre_usuario = 'jmurillo'")
+        destino.commit()
+    with open(copia, 'rb') as archivo:
+        contenido = archivo.read()
+    db.session.close()
+
+    trabajo_id = esperar(subir(cliente, '/admin/importar-base-datos', contenido, 'copia.db'))
+    estado = trabajos_importacion.leer_estado(trabajo_id)
+    assert estado['estado'] == 'completado', estado['mensaje']
+    assert estado['mensajes'][0].startswith('Se guardó una copia de la base de datos actual')
+    assert User.query.filter_by(nombre_usuario='jmurillo').one().nombre == 'DE LA COPIA'
+
+
+def test_reemplazar_cambia_las_huellas_y_vacia_la_cache_de_pdf(app):
+    cliente = login(app.test_client(), User.query.filter_by(nombre_usuario='jmurillo').one())
+    actividad = Actividad(nombre='TALLER', fecha=datetime(2026, 6, 5, 18), aforo_maximo=10)
+    db.session.add(actividad)
+    db.session.commit()
+    # Copia con la generación actual; después un cambio la sube en uno
+    db_path = db.engine.url.database
+    copia = db_path + '.copia'
+    with closing(sqlite3.connect(db_path)) as origen, closing(sqlite3.connect(copia)) as destino:
+        origen.backup(destino)
+    actividad.nombre = 'TALLER DE PINTURA'
+    db.session.commit()
+    generacion = leer_version(GENERACION_ACTIVIDADES)
+    antes = huella('actividades', generacion)
+    guardar_pdf('actividades', antes, b'%PDF antiguo').close()
+    with open(copia, 'rb') as archivo:
+        contenido = archivo.read()
+    db.session.close()
+
+    esperar(subir(cliente, '/admin/importar-base-datos', contenido, 'copia.db'))
+
+    # La copia, con su generación subida en uno, repite la generación de antes...
+    assert leer_version(GENERACION_ACTIVIDADES) == generacion
+    # ...pero la época es otra: ni el ETag ni el nombre del PDF coinciden
+    assert huella('actividades', generacion) != antes
+    assert not [nombre for nombre in os.listdir(directorio_cache()) if nombre.endswith('.pdf')]
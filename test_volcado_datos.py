@@ -0,0 +1,122 @@
+"""
+Tests de la exportación completa en NDJSON y de su importación
+"""
+import gzip
+import io
+import json
+from datetime import datetime
+
+import trabajos_importacion
+import volcado_datos
+from conftest import crear_socio
+from models import db, User, Actividad, Beneficiario, Inscripcion, ListaEspera
+from volcado_datos import leer_datos
+
+
+def preparar():
+    socio = crear_socio('ANA GARCIA', 'ana', numero_socio='0001')
+    actividad = Actividad(nombre='EXCURSIÓN', fecha=datetime(2026, 6, 5, 10), aforo_maximo=10)
+    db.session.add(actividad)
+    db.session.flush()
+    db.session.add(Beneficiario(socio_id=socio.id, nombre='PABLO', primer_apellido='GARCIA', ano_nacimiento=2018,
+                                fecha_validez=socio.fecha_validez, numero_beneficiario='0001-1'))
+    db.session.add(Inscripcion(user_id=socio.id, actividad_id=actividad.id))
+    db.session.commit()
+
+
+def test_exportacion_ndjson(app, admin_client):
+    preparar()
+    respuesta = admin_client.get('/admin/exportar-datos')
+    assert respuesta.status_code == 200
+    assert respuesta.is_streamed
+    assert '.ndjson' in respuesta.headers['Content-Disposition']
+
+    lineas = [json.loads(linea) for linea in respuesta.get_data(as_text=True).splitlines()]
+    assert lineas[0]['formato'] == 'asociacion-ndjson'
+    tablas = [linea['tabla'] for linea in lineas if list(linea) == ['tabla']]
+    assert tablas == [tabla for tabla, _, _ in volcado_datos.TABLAS]
+    actividad = next(linea for linea in lineas if linea.get('aforo_maximo'))
+    assert actividad['nombre'] == 'EXCURSIÓN'
+    assert actividad['fecha'] == '2026-06-05T10:00:00'
+
+
+def test_exportacion_gzip_a_trozos(app, admin_client, monkeypatch):
+    preparar()
+    for i in range(5):
+        crear_socio(f'SOCIO {i}', f'socio{i}')
+    db.session.commit()
+    monkeypatch.setattr(volcado_datos, 'LOTE', 2)
+
+    respuesta = admin_client.get('/admin/exportar-datos?gzip=1')
+    assert respuesta.headers['Content-Type'] == 'application/gzip'
+    trozos = list(respuesta.response)
+    assert len(trozos) > 1
+
+    datos = leer_datos(io.BytesIO(b''.join(trozos)))
+    assert datos['version'] == volcado_datos.VERSION
+    assert len(datos['usuarios']) == User.query.count()
+    assert len(datos['beneficiarios']) == 1
+
+
+def test_importar_lo_exportado(app, admin_client):
+    preparar()
+    exportado = admin_client.get('/admin/exportar-datos?gzip=1').get_data()
+
+    respuesta = admin_client.post('/admin/importar-datos', data={
+        'archivo': (io.BytesIO(exportado), 'backup.ndjson.gz'), 'limpiar_bd': 'on',
+    }, content_type='multipart/form-data')
+    assert respuesta.status_code == 302
+    trabajos_importacion._futuros[respuesta.headers['Location'].rsplit('/', 1)[-1]].result(timeout=30)
+    db.session.rollback()
+
+    assert User.query.filter_by(nombre_usuario='ana').one().numero_socio == '0001'
+    assert Beneficiario.query.one().numero_beneficiario == '0001-1'
+    actividad = Actividad.query.one()
+    assert actividad.nombre == 'EXCURSIÓN' and actividad.inscritos_count == 1
+
+
+def test_las_listas_de_espera_sobreviven_a_exportar_e_importar(app, admin_client):
+    preparar()
+    ana = User.query.filter_by(nombre_usuario='ana').one()
+    pablo = Beneficiario.query.one()
+    luis = crear_socio('LUIS PEREZ', 'luis')
+    completa = Actividad(nombre='TEATRO', fecha=datetime(2026, 7, 1, 19), aforo_maximo=0)
+    db.session.add(completa)
+    db.session.flush()
+    # Orden de llegada: Luis, Pablo y Ana
+    for user_id, beneficiario_id in ((luis.id, None), (ana.id, pablo.id), (ana.id, None)):
+        db.session.add(ListaEspera(user_id=user_id, actividad_id=completa.id, beneficiario_id=beneficiario_id,
+                                   fecha_alta=datetime(2026, 6, 1, 12)))
+        db.session.flush()
+    db.session.commit()
+    exportado = admin_client.get('/admin/exportar-datos').get_data()
+
+    respuesta = admin_client.post('/admin/importar-datos', data={
+        'archivo': (io.BytesIO(exportado), 'backup.ndjson'), 'limpiar_bd': 'on',
+    }, content_type='multipart/form-data')
+    trabajos_importacion._futuros[respuesta.headers['Location'].rsplit('/', 1)[-1]].result(timeout=30)
+    db.session.rollback()
+
+    teatro = Actividad.query.filter_by(nombre='TEATRO').one()
+    pablo = Beneficiario.query.one()
+    esperando = ListaEspera.query.filter_by(actividad_id=teatro.id).order_by(ListaEspera.id).all()
+    assert [(entrada.usuario.nombre_usuario, entrada.beneficiario_id) for entrada in esperando] == [
+        ('luis', None), ('ana', pablo.id), ('ana', None)]
+    assert all(entrada.fecha_alta == datetime(2026, 6, 1, 12) for entrada in esperando)
+
+
+def test_leer_json_de_version_anterior(app):
+    datos = {'version': '1.0', 'usuarios': [{'id': 1, 'nombre': 'ANA'}], 'actividades': []}
+    assert leer_datos(io.BytesIO(json.dumps(datos, indent=2).encode('utf-8'))) == datos
+    assert leer_datos(io.BytesIO(gzip.compress(json.dumps(datos).encode('utf-8')))) == datos
+
+
+def test_leer_registros_por_trozos(app, monkeypatch):
+    # Trozos de pocos caracteres: los valores quedan partidos entre lecturas
+    monkeypatch.setattr(volcado_datos, 'TROZO', 5)
+    datos = {'version': '1.0', 'usuarios': [{'id': i, 'nombre': 'ÑANDÚ ' * i, 'ano_nacimiento': 1990 + i} for i in range(4)],
+             'actividades': [], 'total': 12345}
+    registros = list(volcado_datos.leer_registros(io.BytesIO(json.dumps(datos, indent=1).encode('utf-8'))))
+    assert registros[:3] == [('version', '1.0'), ('usuarios', []), ('usuarios', datos['usuarios'][0])]
+    assert registros[-2:] == [('actividades', []), ('total', 12345)]
+    assert leer_datos(io.BytesIO(json.dumps(datos).encode('utf-8'))) == datos
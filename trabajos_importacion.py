@@ -0,0 +1,258 @@
+"""
+Importaciones en segundo plano con el progreso guardado en disco
+
+La petición solo guarda el archivo subido en el disco persistente (importaciones/<id>/) y encola
+el trabajo; un hilo aparte lo ejecuta y va escribiendo su estado en importaciones/<id>/estado.json
+(fase, registros leídos, procesados, importados y rechazados por tabla, mensajes). El estado va a
+un archivo y no a la BD porque SQLite admite un solo escritor: mientras dura la transacción de la
+importación nadie más podría anotar el progreso. Así además cualquier worker puede responder a la
+consulta de estado aunque el trabajo corra en otro.
+
+Las exportaciones completas se leen registro a registro (leer_registros) y cada tabla se pasa a
+un archivo temporal, porque se importan en otro orden del que traen; de ahí se van leyendo al
+importar, sin tener nunca el archivo entero en memoria. Los trabajos se ejecutan de uno en uno.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import traceback
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from almacen_copias import copiar_bd
+from almacenamiento import directorio_persistente, escribir_json, leer_json
+from busqueda import instalar_busqueda
+from copias_bd import bd_reemplazada
+from importacion_datos import importar_volcado, resumen_rechazos
+from models import db
+from volcado_datos import LOTE, TABLAS, leer_registros
+
+DIRECTORIO = 'importaciones'
+ESTADO = 'estado.json'
+SUBIDA = 'subida'
+DIAS_CONSERVAR = 7
+# Un trabajo sin noticias en este tiempo y que no corre en este proceso se da por interrumpido (el worker
+# que lo ejecutaba se reinició o murió); el progreso se anota cada LOTE registros y en cada fase
+SIN_NOTICIAS = timedelta(minutes=15)
+CABECERA_SQLITE = b'SQLite format 3\x00'
+
+# Un solo hilo: dos importaciones a la vez se bloquearían en SQLite
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='importacion')
+_futuros = {}  # id -> Future de los trabajos de este proceso
+
+class ArchivoNoValido(Exception):
+    """El archivo subido no se puede importar; el mensaje se muestra tal cual"""
+
+class _Trabajo:
+    """Estado de un trabajo, que se reescribe entero (temporal + rename) en cada cambio"""
+
+    def __init__(self, directorio, estado):
+        self.directorio = directorio
+        self.estado = estado
+
+    def guardar(self, **cambios):
+        self.estado.update(cambios)
+        self.estado['actualizado'] = datetime.now().isoformat(timespec='seconds')
+        escribir_json(os.path.join(self.directorio, ESTADO), self.estado)
+
+    def tabla(self, tabla):
+        return self.estado['tablas'].setdefault(tabla, {'leidos': 0, 'procesados': 0, 'importados': 0,
+                                                         'rechazados': 0, 'motivos': []})
+
+    def leidos(self, tabla, cantidad):
+        self.tabla(tabla)['leidos'] = cantidad
+        self.guardar()
+
+    def progreso(self, tabla, resultado):
+        """Callback de importar_volcado()"""
+        self.tabla(tabla).update(procesados=resultado.procesados, importados=resultado.importados,
+                                 rechazados=resultado.rechazados, motivos=resultado.motivos)
+        self.guardar()
+
+def _directorio_trabajo(trabajo_id):
+    return os.path.join(directorio_persistente(DIRECTORIO), trabajo_id)
+
+def encolar_importacion(tipo, archivo, **opciones):
+    """Guarda el archivo subido (FileStorage) y encola su importación; devuelve el id del trabajo.
+
+    `tipo` es 'datos' (exportación completa; opción `limpiar`) o 'base_datos' (archivo SQLite).
+    """
+    _borrar_antiguos()
+    trabajo_id = uuid.uuid4().hex
+    directorio = _directorio_trabajo(trabajo_id)
+    os.makedirs(directorio)
+    # FileStorage.save copia a trozos: el archivo nunca está entero en memoria
+    archivo.save(os.path.join(directorio, SUBIDA))
+    ahora = datetime.now().isoformat(timespec='seconds')
+    trabajo = _Trabajo(directorio, {
+        'id': trabajo_id, 'tipo': tipo, 'archivo': archivo.filename, 'estado': 'pendiente', 'fase': 'en cola',
+        'creado': ahora, 'inicio': None, 'fin': None, 'tablas': {}, 'mensaje': None, 'mensajes': [],
+    })
+    trabajo.guardar()
+    app = current_app._get_current_object()
+    _futuros[trabajo_id] = _ejecutor.submit(_ejecutar, app, trabajo, opciones)
+    return trabajo_id
+
+def leer_estado(trabajo_id):
+    """Último estado guardado del trabajo (dict) o None si no existe.
+
+    Un trabajo pendiente o en curso que no corre en este proceso y lleva SIN_NOTICIAS sin anotar
+    nada se devuelve como error: nadie lo va a terminar y la página de progreso dejaría de consultar.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', trabajo_id or ''):
+        return None
+    estado = leer_json(os.path.join(_directorio_trabajo(trabajo_id), ESTADO))
+    if estado and estado['estado'] in ('pendiente', 'en_curso') and _interrumpido(trabajo_id, estado):
+        estado.update(estado='error', mensaje=(
+            f"La importación se ha interrumpido: no hay noticias de ella desde {estado['actualizado']} "
+            "(el servidor se reinició mientras se ejecutaba). Comprueba los datos y vuelve a intentarlo."))
+    return estado
+
+def _interrumpido(trabajo_id, estado):
+    futuro = _futuros.get(trabajo_id)
+    if futuro is not None and not futuro.done():
+        return False
+    return datetime.now() - datetime.fromisoformat(estado['actualizado']) > SIN_NOTICIAS
+
+def _borrar_antiguos():
+    """Borra los trabajos terminados hace más de DIAS_CONSERVAR días"""
+    base = directorio_persistente(DIRECTORIO)
+    limite = time.time() - DIAS_CONSERVAR * 86400
+    for nombre in os.listdir(base):
+        futuro = _futuros.get(nombre)
+        if futuro is not None and not futuro.done():
+            continue
+        try:
+            if os.path.getmtime(os.path.join(base, nombre, ESTADO)) < limite:
+                shutil.rmtree(os.path.join(base, nombre), ignore_errors=True)
+                _futuros.pop(nombre, None)
+        except OSError:
+            pass
+
+def _ejecutar(app, trabajo, opciones):
+    with app.app_context():
+        trabajo.guardar(estado='en_curso', inicio=datetime.now().isoformat(timespec='seconds'))
+        ruta = os.path.join(trabajo.directorio, SUBIDA)
+        try:
+            if trabajo.estado['tipo'] == 'datos':
+                _importar_datos(trabajo, ruta, opciones.get('limpiar', False))
+            else:
+                _importar_base_datos(trabajo, ruta)
+        except ArchivoNoValido as e:
+            trabajo.guardar(estado='error', mensaje=str(e))
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            trabajo.guardar(estado='error', mensaje=f'Error al importar: {e}. Todos los cambios han sido revertidos.')
+        else:
+            trabajo.guardar(estado='completado')
+        finally:
+            trabajo.guardar(fin=datetime.now().isoformat(timespec='seconds'))
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+def _leer_por_tablas(trabajo, ruta, temporales):
+    """Lee la exportación y pasa cada tabla a un temporal NDJSON; devuelve los datos sueltos ('version', ...)"""
+    datos = {}
+    leidos = Counter()
+    tablas = {tabla for tabla, _, _ in TABLAS}
+    try:
+        with open(ruta, 'rb') as archivo:
+            for clave, valor in leer_registros(archivo):
+                if not isinstance(valor, (dict, list)):
+                    datos[clave] = valor
+                elif clave in tablas and isinstance(valor, dict):
+                    if clave not in temporales:
+                        temporales[clave] = tempfile.TemporaryFile('w+', encoding='utf-8', dir=trabajo.directorio)
+                    temporales[clave].write(json.dumps(valor, ensure_ascii=False) + '\n')
+                    leidos[clave] += 1
+                    if leidos[clave] % LOTE == 0:
+                        trabajo.leidos(clave, leidos[clave])
+    except (ValueError, UnicodeDecodeError, gzip.BadGzipFile, EOFError):
+        raise ArchivoNoValido('El archivo no es una exportación válida (NDJSON o JSON).')
+    for tabla, cantidad in leidos.items():
+        trabajo.tabla(tabla)['leidos'] = cantidad
+    trabajo.guardar()
+    if 'version' not in datos:
+        raise ArchivoNoValido('El archivo no tiene el formato correcto.')
+    return datos
+
+def _importar_datos(trabajo, ruta, limpiar):
+    temporales = {}
+    try:
+        trabajo.guardar(fase='lectura')
+        datos = _leer_por_tablas(trabajo, ruta, temporales)
+        for tabla, temporal in temporales.items():
+            temporal.seek(0)
+            datos[tabla] = (json.loads(linea) for linea in temporal)
+
+        trabajo.guardar(fase='importación')
+        resultados = importar_volcado(datos, limpiar, progreso=trabajo.progreso)
+        db.session.commit()
+    finally:
+        for temporal in temporales.values():
+            temporal.close()
+
+    for tabla, resultado in resultados.items():
+        trabajo.progreso(tabla, resultado)
+    importados = ', '.join(f'{resultado.importados} {tabla.replace("_", " ")}' for tabla, resultado in resultados.items())
+    mensajes = []
+    rechazos = resumen_rechazos(resultados)
+    if rechazos:
+        mensajes.append(f'Registros no importados — {rechazos}')
+    trabajo.guardar(fase='terminado', mensaje=f'Importación completada: {importados}.', mensajes=mensajes)
+
+def _importar_base_datos(trabajo, ruta):
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise ArchivoNoValido('Tipo de base de datos no soportado para importación completa.')
+    with open(ruta, 'rb') as archivo:
+        cabecera = archivo.read(len(CABECERA_SQLITE))
+    if not cabecera:
+        raise ArchivoNoValido('El archivo de base de datos está vacío.')
+    if cabecera != CABECERA_SQLITE:
+        raise ArchivoNoValido('El archivo no parece ser un archivo SQLite válido.')
+    try:
+        with closing(sqlite3.connect(f'file:{ruta}?mode=ro', uri=True)) as conexion:
+            conexion.execute('PRAGMA schema_version').fetchone()
+    except sqlite3.DatabaseError:
+        raise ArchivoNoValido('El archivo no parece ser un archivo SQLite válido.')
+
+    db_path = os.path.abspath(url.database)
+    mensajes = []
+    trabajo.guardar(fase='copia de seguridad')
+    try:
+        entrada, _ = copiar_bd('antes de importar')
+        mensajes.append(f"Se guardó una copia de la base de datos actual en el almacén de copias: {entrada['archivo']}")
+    except Exception as e:
+        mensajes.append(f'Advertencia: No se pudo crear backup del archivo actual: {e}')
+    # Cerrar todas las conexiones antes de reemplazar el archivo
+    db.session.remove()
+    db.engine.dispose()
+
+    trabajo.guardar(fase='reemplazo', mensajes=mensajes)
+    # Los archivos WAL del archivo anterior no valen para el nuevo
+    for auxiliar in (f'{db_path}-shm', f'{db_path}-wal'):
+        if os.path.exists(auxiliar):
+            os.remove(auxiliar)
+    # El directorio de importaciones está junto a la BD: el rename es atómico
+    os.replace(ruta, db_path)
+    db.engine.dispose()
+
+    # Una copia anterior puede no tener el índice de búsqueda: crearlo si falta
+    try:
+        instalar_busqueda()
+    except Exception as e:
+        mensajes.append(f'No se pudo crear el índice de búsqueda: {e}')
+    bd_reemplazada()
+    trabajo.guardar(fase='terminado', mensaje='Base de datos SQLite importada exitosamente.', mensajes=mensajes)
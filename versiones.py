@@ -0,0 +1,176 @@
+"""
+Versiones de los datos y respuestas condicionales (ETag / 304 Not Modified)
+
+Cada transacción que modifica datos sube, en la misma transacción, los contadores de versión
+(tabla contadores) de lo que ha cambiado:
+
+    generacion_actividades   cualquier actividad (incluido su contador de inscritos)
+    lista_espera             cualquier entrada de las listas de espera
+    socios                   cualquier socio o beneficiario
+    actividad:<id>           la actividad, sus inscripciones y su lista de espera
+    familia:<socio_id>       el socio, sus beneficiarios, sus inscripciones y sus listas de espera
+
+Además 'epoca' es un número al azar que cambia cada vez que se sustituye la BD entera (renovar_epoca()):
+los contadores de la BD nueva pueden repetir valores ya vistos, pero con otra época las huellas no.
+
+Las páginas calculan su ETag con las versiones que usan (leídas antes que los datos, así el ETag
+nunca es más nuevo que el cuerpo); si el navegador ya tiene esa versión se responde 304 sin
+consultar el resto de datos ni generar el cuerpo.
+"""
+import hashlib
+import os
+import secrets
+from itertools import chain
+
+from flask import g, request, session, make_response
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, User, Actividad, Inscripcion, Beneficiario, ListaEspera, Contador
+
+GENERACION_ACTIVIDADES = 'generacion_actividades'
+LISTA_ESPERA = 'lista_espera'
+SOCIOS = 'socios'
+EPOCA = 'epoca'
+
+# Identificador del despliegue (Render lo define): una plantilla nueva cambia todos los ETag
+DESPLIEGUE = os.environ.get('RENDER_GIT_COMMIT', '')
+
+def version_actividad(actividad_id):
+    return f'actividad:{actividad_id}'
+
+def version_familia(socio_id):
+    return f'familia:{socio_id}'
+
+def leer_versiones(*nombres):
+    """Devuelve {nombre: versión} en una sola consulta por clave primaria (0 si aún no existe).
+
+    La misma consulta lee la época de la BD, que huella() usa durante el resto de la petición.
+    """
+    versiones = dict.fromkeys(nombres, 0)
+    leidas = dict(db.session.execute(
+        db.select(Contador.nombre, Contador.valor).where(Contador.nombre.in_((*nombres, EPOCA)))
+    ).all())
+    g.epoca_datos = leidas.pop(EPOCA, 0)
+    versiones.update(leidas)
+    return versiones
+
+def leer_version(nombre):
+    return leer_versiones(nombre)[nombre]
+
+def epoca():
+    """Época de la BD (la leída con las versiones de esta petición)"""
+    if 'epoca_datos' not in g:
+        leer_versiones()
+    return g.epoca_datos
+
+def renovar_epoca():
+    """Da a la BD una época nueva al azar, tras sustituirla entera (restauración o importación de un SQLite); no hace commit"""
+    anterior = db.session.get(Contador, EPOCA)
+    nueva = secrets.randbelow(2 ** 31 - 1) + 1
+    while anterior is not None and nueva == anterior.valor:
+        nueva = secrets.randbelow(2 ** 31 - 1) + 1
+    db.session.merge(Contador(nombre=EPOCA, valor=nueva))
+    db.session.flush()
+    g.pop('epoca_datos', None)
+
+def _versiones_de(obj):
+    """Contadores que sube un cambio en `obj`"""
+    if isinstance(obj, Actividad):
+        return (GENERACION_ACTIVIDADES, version_actividad(obj.id))
+    if isinstance(obj, Inscripcion):
+        return (version_actividad(obj.actividad_id), version_familia(obj.user_id))
+    if isinstance(obj, ListaEspera):
+        return (LISTA_ESPERA, version_actividad(obj.actividad_id), version_familia(obj.user_id))
+    if isinstance(obj, Beneficiario):
+        return (SOCIOS, version_familia(obj.socio_id))
+    if isinstance(obj, User):
+        return (SOCIOS, version_familia(obj.id))
+    return ()
+
+# Un UPDATE/DELETE masivo no dice qué filas toca: se sube la versión global del modelo
+_VERSIONES_MASIVAS = {Actividad: GENERACION_ACTIVIDADES, ListaEspera: LISTA_ESPERA, User: SOCIOS, Beneficiario: SOCIOS}
+
+def _subir_versiones(session, nombres):
+    """Suma uno a cada contador (una sola vez por transacción) con la conexión de la sesión"""
+    subidas = session.info.setdefault('versiones_subidas', set())
+    conexion = None
+    for nombre in nombres:
+        if nombre in subidas:
+            continue
+        subidas.add(nombre)
+        conexion = conexion or session.connection()
+        subir = db.update(Contador).where(Contador.nombre == nombre).values(valor=Contador.valor + 1)
+        if conexion.execute(subir).rowcount:
+            continue
+        try:
+            with conexion.begin_nested():
+                conexion.execute(db.insert(Contador).values(nombre=nombre, valor=1))
+        except IntegrityError:
+            # Otra transacción creó la fila a la vez
+            conexion.execute(subir)
+
+def subir_todas_las_versiones():
+    """Sube todos los contadores de versión existentes (tras una importación o un borrado masivo); no hace commit"""
+    db.session.execute(db.update(Contador).where(db.or_(
+        Contador.nombre.in_((GENERACION_ACTIVIDADES, LISTA_ESPERA, SOCIOS)),
+        Contador.nombre.startswith(version_actividad(''), autoescape=True),
+        Contador.nombre.startswith(version_familia(''), autoescape=True),
+    )).values(valor=Contador.valor + 1), execution_options={'synchronize_session': False})
+
+@event.listens_for(Session, 'after_flush')
+def _versiones_tras_flush(session, flush_context):
+    nombres = {nombre for obj in chain(session.new, session.dirty, session.deleted) for nombre in _versiones_de(obj)}
+    if nombres:
+        _subir_versiones(session, sorted(nombres))
+
+@event.listens_for(Session, 'do_orm_execute')
+def _versiones_en_update_masivo(estado):
+    # reservar_plaza(), recalcular_inscritos(), promover_lista_espera(), importaciones
+    if estado.is_update or estado.is_delete or estado.is_insert:
+        nombres = {_VERSIONES_MASIVAS[mapper.class_] for mapper in estado.all_mappers if mapper.class_ in _VERSIONES_MASIVAS}
+        if nombres:
+            _subir_versiones(estado.session, sorted(nombres))
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _fin_de_transaccion(session):
+    session.info.pop('versiones_subidas', None)
+
+def huella(*partes):
+    """Resumen (SHA-1) de las versiones y demás valores de los que depende un contenido, en la época actual de la BD"""
+    texto = '|'.join(str(parte) for parte in (DESPLIEGUE, epoca()) + partes)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+def etag_condicional(*partes):
+    """ETag fuerte a partir de las versiones (y demás valores) de los que depende la respuesta.
+
+    Devuelve None si hay mensajes flash pendientes: esa respuesta los muestra y no debe volver
+    a servirse desde la caché del navegador.
+    """
+    if session.get('_flashes'):
+        return None
+    return huella(*partes)
+
+def _cabeceras_privadas(respuesta):
+    # Contenido de usuarios autenticados: solo lo guarda el navegador (private), que debe
+    # revalidarlo siempre (no-cache); depende de la sesión, es decir, de la cookie
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    respuesta.vary.add('Cookie')
+    return respuesta
+
+def no_modificado(etag):
+    """Respuesta 304 si el navegador ya tiene la versión `etag`; None si hay que generarla"""
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    respuesta = make_response('', 304)
+    respuesta.set_etag(etag)
+    return _cabeceras_privadas(respuesta)
+
+def marcar_etag(respuesta, etag):
+    """Añade a una respuesta generada su ETag y las cabeceras de caché privada"""
+    respuesta = make_response(respuesta)
+    if etag is not None and respuesta.status_code == 200:
+        respuesta.set_etag(etag)
+    return _cabeceras_privadas(respuesta)
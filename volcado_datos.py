@@ -0,0 +1,203 @@
+"""
+Exportación completa de los datos en NDJSON (una línea JSON por registro)
+
+Formato:
+
+    {"formato": "asociacion-ndjson", "version": "2.0", "fecha_exportacion": "..."}
+    {"tabla": "usuarios"}
+    {"id": 1, "nombre": "...", ...}
+    ...
+    {"tabla": "actividades"}
+    ...
+
+Cada tabla se lee por lotes (yield_per) y se envía según se serializa, opcionalmente comprimida
+con gzip sobre la marcha: la memoria no depende del tamaño de la BD. leer_registros() lee este
+formato (también .gz) y el JSON de un solo documento de la versión 1.0 registro a registro.
+"""
+import gzip
+import io
+import json
+import zlib
+from datetime import date, datetime
+from itertools import chain
+
+from models import db, User, Actividad, Inscripcion, Beneficiario, ListaEspera, SolicitudSocio, BeneficiarioSolicitud
+
+FORMATO = 'asociacion-ndjson'
+VERSION = '2.0'
+LOTE = 500
+TROZO = 64 * 1024  # caracteres que se leen de cada vez al importar
+_DECODIFICADOR = json.JSONDecoder()
+
+# Tablas en el orden en que se importan, con los campos que se exportan de cada una
+TABLAS = (
+    ('usuarios', User, ('id', 'nombre', 'nombre_usuario', 'password_hash', 'password_plain', 'rol', 'fecha_alta',
+                        'fecha_validez', 'ano_nacimiento', 'fecha_nacimiento', 'numero_socio', 'calle', 'numero',
+                        'piso', 'poblacion')),
+    ('actividades', Actividad, ('id', 'nombre', 'descripcion', 'fecha', 'aforo_maximo', 'edad_minima', 'edad_maxima',
+                                'fecha_creacion')),
+    ('inscripciones', Inscripcion, ('id', 'user_id', 'actividad_id', 'beneficiario_id', 'fecha_inscripcion', 'asiste')),
+    ('beneficiarios', Beneficiario, ('id', 'socio_id', 'nombre', 'primer_apellido', 'segundo_apellido',
+                                     'ano_nacimiento', 'fecha_validez', 'numero_beneficiario')),
+    ('lista_espera', ListaEspera, ('id', 'user_id', 'actividad_id', 'beneficiario_id', 'fecha_alta')),
+    ('solicitudes_socio', SolicitudSocio, ('id', 'nombre', 'primer_apellido', 'segundo_apellido', 'movil', 'movil2',
+                                           'fecha_nacimiento', 'miembros_unidad_familiar', 'forma_de_pago', 'estado',
+                                           'fecha_solicitud', 'fecha_confirmacion', 'password_solicitud', 'calle',
+                                           'numero', 'piso', 'poblacion')),
+    ('beneficiarios_solicitud', BeneficiarioSolicitud, ('id', 'solicitud_id', 'nombre', 'primer_apellido',
+                                                        'segundo_apellido', 'ano_nacimiento')),
+)
+
+def _isoformat(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} no se puede exportar a JSON')
+
+def _linea(registro):
+    return json.dumps(registro, ensure_ascii=False, separators=(',', ':'), default=_isoformat) + '\n'
+
+def _lineas():
+    """Trozos de texto NDJSON de LOTE registros como máximo"""
+    yield _linea({'formato': FORMATO, 'version': VERSION, 'fecha_exportacion': datetime.utcnow().isoformat()})
+    for tabla, modelo, campos in TABLAS:
+        yield _linea({'tabla': tabla})
+        consulta = db.select(*(getattr(modelo, campo) for campo in campos)).order_by(modelo.id)
+        for lote in db.session.execute(consulta, execution_options={'yield_per': LOTE}).mappings().partitions():
+            yield ''.join(_linea(dict(fila)) for fila in lote)
+
+def generar_volcado(comprimir=False):
+    """Genera la exportación completa a trozos (bytes), en gzip si `comprimir`"""
+    if not comprimir:
+        for trozo in _lineas():
+            yield trozo.encode('utf-8')
+        return
+    compresor = zlib.compressobj(wbits=31)  # 31: cabecera y cola gzip
+    for trozo in _lineas():
+        comprimido = compresor.compress(trozo.encode('utf-8'))
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+class _LectorJSON:
+    """Lee un documento JSON de un flujo de texto por trozos, valor a valor (sin cargarlo entero)"""
+
+    def __init__(self, texto, inicial=''):
+        self.texto = texto
+        self.buffer = inicial
+        self.pos = 0
+
+    def _leer(self):
+        trozo = self.texto.read(TROZO)
+        if not trozo:
+            return False
+        self.buffer = self.buffer[self.pos:] + trozo
+        self.pos = 0
+        return True
+
+    def siguiente(self):
+        """Primer carácter significativo (sin consumirlo); '' al final del documento"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._leer():
+                return ''
+
+    def signo(self, esperados):
+        caracter = self.siguiente()
+        if not caracter or caracter not in esperados:
+            raise ValueError(f"JSON no válido: se esperaba {' o '.join(esperados)} y hay {caracter or 'el final'}")
+        self.pos += 1
+        return caracter
+
+    def valor(self):
+        self.siguiente()
+        while True:
+            try:
+                valor, fin = _DECODIFICADOR.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Valor cortado al final del trozo: leer más
+                if self._leer():
+                    continue
+                raise
+            # Un número al final del trozo puede continuar en el siguiente
+            if fin == len(self.buffer) and self._leer():
+                continue
+            self.pos = fin
+            return valor
+
+def _registros_json(lector):
+    """(clave, valor) del JSON de un solo documento: un par por elemento de cada lista y uno por cada dato suelto"""
+    lector.signo('{')
+    if lector.siguiente() == '}':
+        return
+    while True:
+        clave = lector.valor()
+        lector.signo(':')
+        if lector.siguiente() == '[':
+            lector.pos += 1
+            yield clave, []
+            if lector.siguiente() == ']':
+                lector.pos += 1
+            else:
+                while True:
+                    yield clave, lector.valor()
+                    if lector.signo(',]') == ']':
+                        break
+        else:
+            yield clave, lector.valor()
+        if lector.signo(',}') == '}':
+            return
+
+def _registros_ndjson(cabecera, texto):
+    yield 'version', cabecera.get('version')
+    yield 'fecha_exportacion', cabecera.get('fecha_exportacion')
+    tabla = None
+    for numero, linea in enumerate(texto, 2):
+        if not linea.strip():
+            continue
+        registro = json.loads(linea)
+        if list(registro) == ['tabla']:
+            tabla = registro['tabla']
+            yield tabla, []
+        elif tabla is None:
+            raise ValueError(f'Línea {numero}: registro antes de la cabecera de su tabla')
+        else:
+            yield tabla, registro
+
+def leer_registros(archivo):
+    """Lee una exportación (NDJSON, NDJSON en gzip o JSON 1.0) de un archivo binario sin cargarla entera.
+
+    Genera pares (clave, valor): (tabla, []) al empezar cada tabla, (tabla, registro) por cada registro
+    y (dato, valor) para los datos sueltos como 'version'. Lanza ValueError (json.JSONDecodeError incluido) si no es válido.
+    """
+    comprimido = archivo.read(2) == b'\x1f\x8b'
+    archivo.seek(0)
+    texto = io.TextIOWrapper(gzip.GzipFile(fileobj=archivo) if comprimido else archivo, encoding='utf-8')
+
+    inicio = texto.read(TROZO)
+    primera, salto, resto = inicio.partition('\n')
+    cabecera = None
+    if salto:
+        try:
+            cabecera = json.loads(primera)
+        except ValueError:
+            pass
+    if isinstance(cabecera, dict) and cabecera.get('formato') == FORMATO:
+        yield from _registros_ndjson(cabecera, chain(io.StringIO(resto), texto))
+    else:
+        # JSON de un solo documento (exportaciones anteriores)
+        yield from _registros_json(_LectorJSON(texto, inicio))
+
+def leer_datos(archivo):
+    """Como leer_registros(), pero devuelve el diccionario {'version': ..., 'usuarios': [...], ...} completo"""
+    datos = {}
+    for clave, valor in leer_registros(archivo):
+        if isinstance(valor, list):
+            datos.setdefault(clave, [])
+        elif isinstance(valor, dict):
+            datos.setdefault(clave, []).append(valor)
+        else:
+            datos[clave] = valor
+    return datos
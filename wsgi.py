@@ -2,9 +2,17 @@
 WSGI entry point para producción
 """
 from app import create_app
+from copias_programadas import iniciar_planificador
 
 app = create_app()
 
+# Copias de seguridad automáticas: solo en el servidor web (no en los scripts que usan create_app)
+# y solo en un worker (ver copias_programadas.py)
+try:
+    iniciar_planificador(app)
+except Exception as e:
+    print(f"[WARNING] No se pudo iniciar el planificador de copias de seguridad: {e}")
+
 if __name__ == "__main__":
     app.run()
 